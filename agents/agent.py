@@ -1,13 +1,28 @@
 import json
+import asyncio
 from utils.global_methods import *
 import re
 from utils.toolkit import *
-from prompts import *
+from utils.usage_tracker import track_usage
+from utils.prompt_layout import build_prompt
+from pydantic import ValidationError
+from utils.llm_json import try_parse_json, parse_structured, is_valid_structured
+from agents.schemas import (
+    KnowledgeExtraction,
+    MultipleChoiceQuestion,
+    QuestionAnswer,
+    QualityEvaluation,
+    Conversation,
+    ChainOfThought,
+)
 
 
 class BaseAgent:
     """Agent基础类，为所有子Agent提供通用接口和基本功能"""
 
+    # 结构化输出校验失败后的重新请求次数
+    structured_retries = 1
+
     def __init__(self, name="BaseAgent", model="qwen"):
         self.name = name
         self.feedback_history = []  # 用于存储评估反馈
@@ -27,15 +42,56 @@ class BaseAgent:
         """生成响应的通用方法，具体逻辑在子类中实现"""
         raise NotImplementedError("子类必须实现该方法")
 
+    def run_structured(self, prompt, schema, temperature=0.3, json_mode=True):
+        """
+        请求结构化输出并按 schema 校验，返回校验后的对象。
+        - json_mode: 对支持的模型开启 JSON 模式；schema 顶层为数组时需传 False
+        - 不合格的输出不读取也不写入缓存，重新请求最多 structured_retries 次，仍失败时抛出 ValueError
+        """
+        validate = lambda response: is_valid_structured(response, schema)
+        for attempt in range(self.structured_retries + 1):
+            response = run_agent(
+                prompt, model=self.model, num_gen=1, temperature=temperature,
+                json_mode=json_mode, validate=validate,
+            )
+            try:
+                return parse_structured(response, schema)
+            except ValueError as e:
+                error = e
+                print(f"⚠️ {self.name} 输出不符合 {getattr(schema, '__name__', schema)}（第 {attempt + 1} 次）: {e}")
+        raise error
+
+    async def run_structured_async(self, prompt, schema, temperature=0.3, json_mode=True):
+        """run_structured 的异步版本"""
+        validate = lambda response: is_valid_structured(response, schema)
+        for attempt in range(self.structured_retries + 1):
+            response = await run_agent_async(
+                prompt, model=self.model, num_gen=1, temperature=temperature,
+                json_mode=json_mode, validate=validate,
+            )
+            try:
+                return parse_structured(response, schema)
+            except ValueError as e:
+                error = e
+                print(f"⚠️ {self.name} 输出不符合 {getattr(schema, '__name__', schema)}（第 {attempt + 1} 次）: {e}")
+        raise error
+
 
 class QuestionSetter(BaseAgent):
     """出题人Agent，生成各类题型的问题和标准答案"""
 
-    def __init__(self, model="qwen"):
+    # 批量出题时同类题型在 prompt 与输出中相邻排列
+    QUESTION_TYPES = ["multiple_choice", "short_answer", "open_discussion"]
+
+    def __init__(self, model="qwen", batch_size=0):
+        """
+        - batch_size: 批量出题时每次请求包含的试题数，0 表示逐个知识点单独出题
+        """
         super().__init__(name="QuestionSetter", model=model)
         from prompts.question_prompts import QUESTION_PROMPTS_CN
 
         self.prompts = QUESTION_PROMPTS_CN
+        self.batch_size = batch_size
 
     def generate_response(self, input_data, data_class):
         """生成完整的试卷结构"""
@@ -43,128 +99,337 @@ class QuestionSetter(BaseAgent):
         knowledge_points = self.extract_knowledge_points(input_data, data_class)
 
         # 步骤2: 根据知识点的难度分配题型
-        question_set = []
         for point, difficulty, original_question in knowledge_points:
             if point == "解析错误":
                 # 直接跳过这条数据
                 print(f"跳过该数据：{original_question}")
                 return knowledge_points
+
+        if self.batch_size > 0:
+            return self.generate_questions_batch(knowledge_points, input_data)
+
+        question_set = []
+        for point, difficulty, original_question in knowledge_points:
             question_set.extend(
                 self.generate_questions_for_point(point, original_question, difficulty, input_data)
             )
 
         return question_set
 
-    def extract_knowledge_points(self, text, data_class):
-        """根据数据类别从文本中提取知识点并评估难度"""
+    async def generate_response_async(self, input_data, data_class):
+        """generate_response 的异步版本，各知识点的出题请求并发执行"""
+        knowledge_points = await self.extract_knowledge_points_async(input_data, data_class)
+
+        for point, difficulty, original_question in knowledge_points:
+            if point == "解析错误":
+                print(f"跳过该数据：{original_question}")
+                return knowledge_points
+
+        if self.batch_size > 0:
+            return await self.generate_questions_batch_async(knowledge_points, input_data)
+
+        question_groups = await asyncio.gather(
+            *[
+                self.generate_questions_for_point_async(point, original_question, difficulty, input_data)
+                for point, difficulty, original_question in knowledge_points
+            ]
+        )
+        return [question for group in question_groups for question in group]
+
+    def _knowledge_prompt(self, text, data_class):
         prompt_template = self.prompts[f"knowledge_extraction_{data_class}"]
+        # 语料放在前缀，后续逐点出题的请求可复用服务端的前缀缓存
+        return build_prompt(prompt_template, "text", text, length=len(text), q_num=len(text)/500)
 
+    @track_usage()
+    def extract_knowledge_points(self, text, data_class):
+        """根据数据类别从文本中提取知识点并评估难度"""
         # 构建 prompt
-        prompt = prompt_template.format(text=text, length=len(text), q_num=len(text)/500)
-
-        # 调用大模型生成知识点
-        response = run_agent(prompt, model=self.model, num_gen=1, temperature=0.3)
+        prompt = self._knowledge_prompt(text, data_class)
 
-        # 去除 markdown 格式标记
-        clean_text = re.sub(r"```(?:json)?|```", "", response.strip())
-        results = []
+        # 调用大模型生成知识点（顶层为数组，不开启 JSON 模式）
         try:
-            # 直接解析
-            knowledge_points = json.loads(clean_text)
-        except json.JSONDecodeError:
-            # print("⚠️ 初次 JSON 解析失败，尝试从文本中提取 JSON 数组部分")
-            match = re.search(r"\[\s*{[\s\S]*?}\s*\]", clean_text)
-            if match:
-                try:
-                    json_str = match.group(0)
-                    knowledge_points = json.loads(json_str)
-                except json.JSONDecodeError:
-                    print(f"❌ 二次 JSON 解析失败{clean_text}")
-                    return results
-            else:
-                print(f"❌ 未找到合法的 JSON 数组结构{clean_text}")
-                return results
+            knowledge_points = self.run_structured(prompt, KnowledgeExtraction, json_mode=False)
+        except ValueError:
+            return []
+
+        return self._knowledge_tuples(knowledge_points)
 
-        # 提取结构化数据
+    @track_usage()
+    async def extract_knowledge_points_async(self, text, data_class):
+        """extract_knowledge_points 的异步版本"""
+        prompt = self._knowledge_prompt(text, data_class)
+        try:
+            knowledge_points = await self.run_structured_async(prompt, KnowledgeExtraction, json_mode=False)
+        except ValueError:
+            return []
+        return self._knowledge_tuples(knowledge_points)
+
+    @staticmethod
+    def _knowledge_tuples(knowledge_points):
+        """将知识点抽取结果（KnowledgeExtraction）展开为 (知识点, 难度, 原始问题) 列表"""
+        results = []
         for item in knowledge_points:
             for _, inner in item.items():
-                results.append((inner["knowledge"], inner["difficulty"], inner["question"]))
+                results.append((inner.knowledge, inner.difficulty, inner.question))
 
         return results
 
-    def generate_questions_for_point(self, knowledge_point, original_question, difficulty, full_text):
-        """根据知识点和难度生成适合的多种题型"""
-        # 根据难度选择适合的题型
+    @staticmethod
+    def _question_types(difficulty):
+        """根据难度选择适合的题型"""
         if difficulty == "simple" or difficulty == "简单":
-            question_types = ["multiple_choice"]
+            return ["multiple_choice"]
         elif difficulty == "medium" or difficulty == "中等":
-            question_types = ["short_answer"]
+            return ["short_answer"]
         elif difficulty == "complex" or difficulty == "困难":
-            question_types = ["open_discussion"]
+            return ["open_discussion"]
         else:
             raise ValueError("未知难度级别")
 
-        questions = []
+    def _question_prompt(self, q_type, knowledge_point, original_question, full_text):
+        # 从 prompts 中获取指定题型的 prompt 模板
+        prompt_template = self.prompts[f"{q_type}"]
+        return build_prompt(
+            prompt_template,
+            "full_text",
+            full_text,
+            knowledge_point=knowledge_point,
+            original_question=original_question,
+        )
+
+    def _generate_question(self, q_type, knowledge_point, original_question, difficulty, full_text):
+        """为单个知识点生成一道指定题型的试题"""
+        prompt = self._question_prompt(q_type, knowledge_point, original_question, full_text)
 
-        for q_type in question_types:
-            # 从 prompts 中获取指定题型的 prompt 模板
-            prompt_template = self.prompts[f"{q_type}"]
+        # 调用大模型生成问题和答案，输出按题型 schema 校验
+        parsed = self.run_structured(prompt, self._question_schema(q_type))
 
-            prompt = prompt_template.format(
-                full_text=full_text,
-                knowledge_point=knowledge_point,
-                original_question=original_question,
-            )
+        return self._question_record(parsed.model_dump(), knowledge_point, difficulty, q_type)
 
-            # 调用 run_chatgpt 函数生成问题和答案
-            response = run_agent(prompt, model=self.model, num_gen=1, temperature=0.3)
+    async def _generate_question_async(self, q_type, knowledge_point, original_question, difficulty, full_text):
+        """_generate_question 的异步版本"""
+        prompt = self._question_prompt(q_type, knowledge_point, original_question, full_text)
+        parsed = await self.run_structured_async(prompt, self._question_schema(q_type))
+        return self._question_record(parsed.model_dump(), knowledge_point, difficulty, q_type)
 
-            # 默认存 response
-            record = {
-                "knowledge": knowledge_point,
-                "difficulty": difficulty,
-                "question_type": q_type,
+    @track_usage()
+    def generate_questions_for_point(self, knowledge_point, original_question, difficulty, full_text):
+        """根据知识点和难度生成适合的多种题型"""
+        return [
+            self._generate_question(q_type, knowledge_point, original_question, difficulty, full_text)
+            for q_type in self._question_types(difficulty)
+        ]
+
+    @track_usage()
+    async def generate_questions_for_point_async(self, knowledge_point, original_question, difficulty, full_text):
+        """generate_questions_for_point 的异步版本"""
+        return list(await asyncio.gather(
+            *[
+                self._generate_question_async(q_type, knowledge_point, original_question, difficulty, full_text)
+                for q_type in self._question_types(difficulty)
+            ]
+        ))
+
+    def _question_tasks(self, knowledge_points):
+        """展开为 (知识点, 难度, 原始问题, 题型) 列表，顺序与逐点出题一致"""
+        return [
+            (point, difficulty, original_question, q_type)
+            for point, difficulty, original_question in knowledge_points
+            for q_type in self._question_types(difficulty)
+        ]
+
+    def _batch_chunks(self, tasks):
+        return [tasks[i:i + self.batch_size] for i in range(0, len(tasks), self.batch_size)]
+
+    def _batch_prompt(self, chunk, full_text):
+        # 按题型分组排列，同类试题在输出中相邻；id 为试题在本批次中的序号
+        order = sorted(range(len(chunk)), key=lambda i: self.QUESTION_TYPES.index(chunk[i][3]))
+        items = [
+            {
+                "id": str(i + 1),
+                "question_type": chunk[i][3],
+                "knowledge": chunk[i][0],
+                "original_question": chunk[i][2],
             }
-            response = re.sub(r"```(?:json)?|```", "", response.strip())
-            parsed = json.loads(response)
-            # 🔸 如果是 multiple_choice，则尝试解析 JSON，并提取为 CSV 格式字段
-            if q_type == "multiple_choice":
-                # 安全获取选项，补齐到 4 个
-                options = parsed.get("options", [])
-                options = (options + ["", "", "", ""])[:4]
-
-                # 清洗字段，处理逗号转义
-                question_text = parsed.get("question", "").replace(",", "，")
-                answer_letter = parsed.get("answer", "").strip().upper()
-
-                # 构造 CSV 行字符串（字段顺序：question,A,B,C,D,answer）
-                csv_record = f'"{question_text}",{options[0]},{options[1]},{options[2]},{options[3]},{answer_letter}'
-
-                record["response"] = csv_record  # ✅ 添加 CSV 格式字段（便于后续保存）
-
-            elif q_type in ["short_answer", "open_discussion"]:
-                # 简答题和讨论题统一结构（字段相同）
-                question_text = parsed.get("question", "").replace(",", "，")
-                answer_text = parsed.get("answer", "").strip()
-
-                record["response"] = {
-                    "question": question_text,
-                    "answer": answer_text
-                }
+            for i in order
+        ]
+        return build_prompt(
+            self.prompts["batch_questions"],
+            "full_text",
+            full_text,
+            items=json.dumps(items, ensure_ascii=False, indent=2),
+        )
+
+    def _validate_question(self, item, q_type):
+        """按题型 schema 校验批量出题返回的单道试题，不合格的返回 None（改为单独出题）"""
+        if not isinstance(item, dict) or item.get("question_type", q_type) != q_type:
+            return None
+        try:
+            return self._question_schema(q_type).model_validate(item)
+        except ValidationError:
+            return None
+
+    def _parse_batch(self, response, chunk):
+        """
+        解析批量出题结果，返回与 chunk 等长的列表，未通过校验的位置为 None
+        """
+        items = try_parse_json(response, expect=list, default=[])
+
+        by_id = {str(item.get("id")): item for item in items if isinstance(item, dict)}
+        records = []
+        for i, (point, difficulty, _, q_type) in enumerate(chunk):
+            parsed = self._validate_question(by_id.get(str(i + 1)), q_type)
+            if parsed is not None:
+                records.append(self._question_record(parsed.model_dump(), point, difficulty, q_type))
+            else:
+                records.append(None)
+        return records
+
+    @staticmethod
+    def _failed_items(tasks, records):
+        """批量结果中需要回退为单独出题的位置"""
+        missing = [i for i, record in enumerate(records) if record is None]
+        if missing:
+            print(f"⚠️ 批量出题 {len(missing)}/{len(tasks)} 道未通过校验，改为单独出题")
+        return missing
+
+    @track_usage()
+    def generate_questions_batch(self, knowledge_points, full_text):
+        """
+        批量出题：一次请求为多个知识点出题（每次最多 batch_size 道），
+        返回与逐点出题相同结构与顺序的试题记录，未通过校验的试题回退为单独出题。
+        """
+        tasks = self._question_tasks(knowledge_points)
+        records = []
+        for chunk in self._batch_chunks(tasks):
+            response = run_agent(self._batch_prompt(chunk, full_text), model=self.model, num_gen=1, temperature=0.3)
+            records.extend(self._parse_batch(response, chunk))
+
+        for i in self._failed_items(tasks, records):
+            point, difficulty, original_question, q_type = tasks[i]
+            records[i] = self._generate_question(q_type, point, original_question, difficulty, full_text)
+        return records
+
+    @track_usage()
+    async def generate_questions_batch_async(self, knowledge_points, full_text):
+        """generate_questions_batch 的异步版本，各批次及回退请求并发执行"""
+        tasks = self._question_tasks(knowledge_points)
+        chunks = self._batch_chunks(tasks)
+        responses = await asyncio.gather(
+            *[
+                run_agent_async(self._batch_prompt(chunk, full_text), model=self.model, num_gen=1, temperature=0.3)
+                for chunk in chunks
+            ]
+        )
+        records = [
+            record
+            for chunk, response in zip(chunks, responses)
+            for record in self._parse_batch(response, chunk)
+        ]
+
+        missing = self._failed_items(tasks, records)
+        fallbacks = await asyncio.gather(
+            *[
+                self._generate_question_async(tasks[i][3], tasks[i][0], tasks[i][2], tasks[i][1], full_text)
+                for i in missing
+            ]
+        )
+        for i, record in zip(missing, fallbacks):
+            records[i] = record
+        return records
+
+    @staticmethod
+    def _question_schema(q_type):
+        return MultipleChoiceQuestion if q_type == "multiple_choice" else QuestionAnswer
+
+    @staticmethod
+    def _question_record(parsed, knowledge_point, difficulty, q_type):
+        """由解析后的 JSON 构造试题记录"""
+        # 默认存 response
+        record = {
+            "knowledge": knowledge_point,
+            "difficulty": difficulty,
+            "question_type": q_type,
+        }
+        # 🔸 如果是 multiple_choice，则尝试解析 JSON，并提取为 CSV 格式字段
+        if q_type == "multiple_choice":
+            # 安全获取选项，补齐到 4 个
+            options = parsed.get("options", [])
+            options = (options + ["", "", "", ""])[:4]
+
+            # 清洗字段，处理逗号转义
+            question_text = parsed.get("question", "").replace(",", "，")
+            answer_letter = parsed.get("answer", "").strip().upper()
+
+            # 构造 CSV 行字符串（字段顺序：question,A,B,C,D,answer）
+            csv_record = f'"{question_text}",{options[0]},{options[1]},{options[2]},{options[3]},{answer_letter}'
+
+            record["response"] = csv_record  # ✅ 添加 CSV 格式字段（便于后续保存）
 
-            questions.append(record)
+        elif q_type in ["short_answer", "open_discussion"]:
+            # 简答题和讨论题统一结构（字段相同）
+            question_text = parsed.get("question", "").replace(",", "，")
+            answer_text = parsed.get("answer", "").strip()
 
-        return questions    
+            record["response"] = {
+                "question": question_text,
+                "answer": answer_text
+            }
+
+        return record
 
 
 class ExpertAgent(BaseAgent):
     """专家 Agent，用于评估和改进试题质量"""
 
-    def __init__(self, model="qwen"):
+    # 评估结果中的分数字段，任一缺失或低于阈值的试题标记为删除
+    SCORE_KEYS = ["quality score", "relevance score", "consistency score"]
+    # 级联评估的判定阈值，与 _evaluation_result 一致
+    CASCADE_THRESHOLDS = [("quality_score", 6), ("relevance_score", 6), ("consistency_score", 6)]
+
+    def __init__(self, model="qwen", batch_size=0, prescreen=None, cascade=None):
+        """
+        - batch_size: 批量评估时每次请求包含的试题数，0 表示逐题评估
+        - prescreen: 本地预筛（utils.prescreen.QuestionPrescreen），明显合格的试题不调用 LLM 评估
+        - cascade: 级联评估（utils.cascade.CascadePolicy），先由小模型评分，结果不可靠时才调用 model
+        """
         super().__init__(name="ExpertAgent", model=model)
         from prompts.expert_prompts import EXPERT_PROMPTS_CN
 
         self.prompts = EXPERT_PROMPTS_CN
+        self.batch_size = batch_size
+        self.prescreen = prescreen
+        self.cascade = cascade
+
+    def _screen(self, text, question_data):
+        """本地预筛结果；未开启预筛时为 None"""
+        if self.prescreen is None:
+            return None
+        return self.prescreen.screen(text, question_data)
+
+    def _skips(self, screen):
+        return self.prescreen is not None and self.prescreen.skips(screen)
+
+    @staticmethod
+    def _with_screen(expert_feedback, screen):
+        # 记录预筛特征，供校准预筛阈值（tools/calibrate_prescreen.py）
+        if screen is not None:
+            expert_feedback["prescreen"] = screen
+        return expert_feedback
+
+    @staticmethod
+    def _eval_input(question_data):
+        """构造标准输入文本：用于评估 or 改写"""
+        question_type = question_data["question_type"]
+        if question_type == "multiple_choice":
+            return question_data.get("response", "")
+
+        elif question_type in ["short_answer", "open_discussion"]:
+            response = question_data.get("response", {})
+            question_text = response.get("question", "").strip()
+            answer_text = response.get("answer", "").strip()
+            return f"问题：{question_text}\n参考答案：{answer_text}"
 
     def evaluate_and_refine_question(self, text, question_data, data_class):
         """
@@ -175,56 +440,369 @@ class ExpertAgent(BaseAgent):
         knowledge_point = question_data["knowledge"]
         question_type = question_data["question_type"]
 
-        # ✅ 构造标准输入文本：用于评估 or 改写
-        if question_type == "multiple_choice":
-            eval_input = question_data.get("response", "")
+        # ✅ Step 0: 本地预筛，明显合格的试题跳过 LLM 评估
+        screen = self._screen(text, question_data)
+        if self._skips(screen):
+            return self.apply_feedback(text, question_data, data_class, self.prescreen.feedback(screen))
 
-        elif question_type in ["short_answer", "open_discussion"]:
-            response = question_data.get("response", {})
-            question_text = response.get("question", "").strip()
-            answer_text = response.get("answer", "").strip()
-            eval_input = f"问题：{question_text}\n参考答案：{answer_text}"
+        # ✅ 构造标准输入文本：用于评估 or 改写
+        eval_input = self._eval_input(question_data)
 
         # ✅ Step 1: 试题质量评估
-        expert_feedback = self.evaluate_quality(
+        expert_feedback = self._with_screen(self.evaluate_quality(
             text, eval_input, knowledge_point, question_type, data_class
-        )
+        ), screen)
 
         # ✅ Step 2: 根据需要进行改写
+        return self.apply_feedback(text, question_data, data_class, expert_feedback)
+
+    async def evaluate_and_refine_question_async(self, text, question_data, data_class):
+        """evaluate_and_refine_question 的异步版本"""
+        knowledge_point = question_data["knowledge"]
+        question_type = question_data["question_type"]
+
+        screen = self._screen(text, question_data)
+        if self._skips(screen):
+            return await self.apply_feedback_async(text, question_data, data_class, self.prescreen.feedback(screen))
+
+        eval_input = self._eval_input(question_data)
+        expert_feedback = self._with_screen(await self.evaluate_quality_async(
+            text, eval_input, knowledge_point, question_type, data_class
+        ), screen)
+
+        return await self.apply_feedback_async(text, question_data, data_class, expert_feedback)
+
+    def apply_feedback(self, text, question_data, data_class, expert_feedback):
+        """
+        根据评估结果改写试题（仅需要改写的试题调用大模型），返回补全 refined_response 的评估数据
+        - expert_feedback: evaluate_quality / evaluate_questions_batch 返回的评估结果
+        """
         if expert_feedback.get("requires_refinement", False):
             expert_feedback["refined_response"] = self.refine_response(
-                text, eval_input, knowledge_point, data_class, expert_feedback
+                text, self._eval_input(question_data), question_data["knowledge"], data_class, expert_feedback
             )
         else:
             expert_feedback["refined_response"] = ""
 
-        return expert_feedback  # 返回评估数据
+        return expert_feedback
 
-    def evaluate_quality(self, text, response, 
-                         knowledge_point, question_type, 
-                         data_class="web"
-                         ):
-        """评估试题质量并判断是否需要改进"""
-        prompt = self.prompts[f"evaluate_quality_{data_class}"].format(
-            text=text,
+    async def apply_feedback_async(self, text, question_data, data_class, expert_feedback):
+        """apply_feedback 的异步版本"""
+        if expert_feedback.get("requires_refinement", False):
+            expert_feedback["refined_response"] = await self.refine_response_async(
+                text, self._eval_input(question_data), question_data["knowledge"], data_class, expert_feedback
+            )
+        else:
+            expert_feedback["refined_response"] = ""
+
+        return expert_feedback
+
+    def evaluate_and_refine_questions(self, text, questions, data_class):
+        """
+        批量版本的 evaluate_and_refine_question：一次请求评估多道试题（每次最多 batch_size 道），
+        只对需要改写的试题逐题调用改写
+        """
+        feedbacks = self.evaluate_questions_batch(text, questions, data_class)
+        return [
+            self.apply_feedback(text, question_data, data_class, expert_feedback)
+            for question_data, expert_feedback in zip(questions, feedbacks)
+        ]
+
+    async def evaluate_and_refine_questions_async(self, text, questions, data_class):
+        """evaluate_and_refine_questions 的异步版本，改写请求并发执行"""
+        feedbacks = await self.evaluate_questions_batch_async(text, questions, data_class)
+        return list(await asyncio.gather(
+            *[
+                self.apply_feedback_async(text, question_data, data_class, expert_feedback)
+                for question_data, expert_feedback in zip(questions, feedbacks)
+            ]
+        ))
+
+    def _evaluate_prompt(self, text, response, knowledge_point, question_type, data_class):
+        return build_prompt(
+            self.prompts[f"evaluate_quality_{data_class}"],
+            "text",
+            text,
             response=response,
             knowledge=knowledge_point,
             question_type=question_type,
         )
 
-        evaluation_response = run_agent(prompt, model=self.model, num_gen=1, temperature=0.3)
+    @track_usage()
+    def evaluate_quality(self, text, response, 
+                         knowledge_point, question_type, 
+                         data_class="web", use_cascade=True
+                         ):
+        """
+        评估试题质量并判断是否需要改进
+        - use_cascade: 开启级联时先由小模型评分；已由小模型评过的试题传 False 直接调用 model
+        """
+        prompt = self._evaluate_prompt(text, response, knowledge_point, question_type, data_class)
+
+        verdict = None
+        if use_cascade and self.cascade is not None:
+            feedback, verdict = self._cascade_feedback(self._small_evaluations(self._run_small(prompt)))
+            if feedback is not None:
+                return feedback
+
+        evaluation = self.run_structured(prompt, QualityEvaluation)
+
+        return self._with_cascade(self._parse_evaluation(evaluation), verdict)
+
+    @track_usage()
+    async def evaluate_quality_async(self, text, response,
+                                     knowledge_point, question_type,
+                                     data_class="web", use_cascade=True
+                                     ):
+        """evaluate_quality 的异步版本"""
+        prompt = self._evaluate_prompt(text, response, knowledge_point, question_type, data_class)
+
+        verdict = None
+        if use_cascade and self.cascade is not None:
+            feedback, verdict = self._cascade_feedback(self._small_evaluations(await self._run_small_async(prompt)))
+            if feedback is not None:
+                return feedback
+
+        evaluation = await self.run_structured_async(prompt, QualityEvaluation)
+        return self._with_cascade(self._parse_evaluation(evaluation), verdict)
+
+    # ---------- 级联评估 ----------
+    def _run_small(self, prompt, json_mode=True):
+        """小模型一次 n 采样请求，返回回答列表；各回答用于估计置信度，需要新的采样，不读写缓存"""
+        response = run_agent(
+            prompt, model=self.cascade.small_model, num_gen=self.cascade.samples,
+            temperature=self.cascade.temperature, json_mode=json_mode, use_cache=False,
+        )
+        return response if isinstance(response, list) else [response]
+
+    async def _run_small_async(self, prompt, json_mode=True):
+        response = await run_agent_async(
+            prompt, model=self.cascade.small_model, num_gen=self.cascade.samples,
+            temperature=self.cascade.temperature, json_mode=json_mode, use_cache=False,
+        )
+        return response if isinstance(response, list) else [response]
+
+    def _small_evaluations(self, responses):
+        """解析小模型的各个回答，不符合 QualityEvaluation 的为 None"""
+        feedbacks = []
+        for response in responses:
+            try:
+                feedbacks.append(self._parse_evaluation(parse_structured(response, QualityEvaluation)))
+            except (TypeError, ValueError):
+                feedbacks.append(None)
+        return feedbacks
+
+    def _cascade_feedback(self, feedbacks):
+        """
+        根据小模型的多个评估结果判断是否升级，返回 (评估结果, 级联判定)；
+        需要升级时评估结果为 None，由 model 重新评估
+        """
+        verdict = self.cascade.assess(
+            [
+                None if feedback is None else {name: feedback[name] for name, _ in self.CASCADE_THRESHOLDS}
+                for feedback in feedbacks
+            ],
+            self.CASCADE_THRESHOLDS,
+        )
+        if verdict["escalate"]:
+            return None, verdict
+
+        # 各分数取中位数，改进建议取与多数判定一致的回答
+        scores = verdict["scores"]
+        feedback = self._evaluation_result({
+            "quality score": scores["quality_score"],
+            "relevance score": scores["relevance_score"],
+            "consistency score": scores["consistency_score"],
+            "improvement suggestions": feedbacks[verdict["index"]]["improvement_suggestions"],
+        })
+        return self.cascade.annotate(feedback, verdict), verdict
+
+    def _with_cascade(self, expert_feedback, verdict):
+        if verdict is not None:
+            self.cascade.annotate(expert_feedback, verdict)
+        return expert_feedback
+
+    def _batch_chunks(self, questions):
+        size = self.batch_size if self.batch_size > 0 else len(questions)
+        return [questions[i:i + size] for i in range(0, len(questions), size)]
+
+    def _batch_evaluate_prompt(self, chunk):
+        # id 为试题在本批次中的序号
+        items = [
+            {
+                "id": str(i + 1),
+                "knowledge": question_data["knowledge"],
+                "question_type": question_data["question_type"],
+                "response": self._eval_input(question_data),
+            }
+            for i, question_data in enumerate(chunk)
+        ]
+        return self.prompts["evaluate_quality_batch"].format(
+            items=json.dumps(items, ensure_ascii=False, indent=2)
+        )
+
+    def _parse_batch_evaluation(self, evaluation_response, chunk):
+        """
+        解析批量评估结果，返回与 chunk 等长的列表；缺失或分数非数值的试题为 None，改为单独评估
+        """
+        items = try_parse_json(evaluation_response, expect=list, default=[])
+
+        by_id = {}
+        for item in items:
+            if isinstance(item, dict):
+                item = {k.lower(): v for k, v in item.items()}
+                by_id[str(item.get("id"))] = item
+
+        results = []
+        for i in range(len(chunk)):
+            item = by_id.get(str(i + 1))
+            valid = item is not None and all(
+                isinstance(item.get(k), (int, float)) for k in self.SCORE_KEYS
+            )
+            results.append(self._evaluation_result(item) if valid else None)
+        return results
+
+    @staticmethod
+    def _failed_items(questions, feedbacks):
+        """批量结果中需要回退为单独评估的位置"""
+        missing = [i for i, feedback in enumerate(feedbacks) if feedback is None]
+        if missing:
+            print(f"⚠️ 批量评估 {len(missing)}/{len(questions)} 道未返回有效评分，改为单独评估")
+        return missing
+
+    def _merge_screens(self, screens, pending, evaluated):
+        """合并预筛通过的结果与 LLM 评估结果，顺序与试题一致"""
+        feedbacks = [self.prescreen.feedback(screen) if self._skips(screen) else None for screen in screens]
+        for i, feedback in zip(pending, evaluated):
+            feedbacks[i] = self._with_screen(feedback, screens[i])
+        return feedbacks
+
+    @track_usage()
+    def evaluate_questions_batch(self, text, questions, data_class="web"):
+        """
+        批量评估试题质量：一次请求评估多道试题，每道试题的解析与阈值判断与 evaluate_quality 相同，
+        返回与 questions 顺序一致的评估结果列表；开启预筛时明显合格的试题不参与 LLM 评估
+        """
+        screens = [self._screen(text, question_data) for question_data in questions]
+        pending = [i for i, screen in enumerate(screens) if not self._skips(screen)]
+        evaluated = self._evaluate_batch_llm(text, [questions[i] for i in pending], data_class)
+        return self._merge_screens(screens, pending, evaluated)
+
+    def _evaluate_batch_llm(self, text, questions, data_class):
+        if self.cascade is None:
+            return self._evaluate_batch_model(text, questions, data_class)
 
-        # 文本格式解析
-        evaluation_response = re.sub(r"```(?:json)?|```", "", evaluation_response.strip())
-        result = json.loads(evaluation_response)
-        # 字段转小写 key（兼容模型大小写误差）
-        result = {k.lower(): v for k, v in result.items()}
+        # 级联：各批次先由小模型评分，需要升级的试题再由 model 批量评估
+        results = []
+        for chunk in self._batch_chunks(questions):
+            responses = self._run_small(self._batch_evaluate_prompt(chunk), json_mode=False)
+            results.extend(self._cascade_batch(responses, chunk))
+        return self._merge_escalated(
+            results, self._evaluate_batch_model(text, self._escalated(questions, results), data_class)
+        )
+
+    def _evaluate_batch_model(self, text, questions, data_class):
+        feedbacks = []
+        for chunk in self._batch_chunks(questions):
+            response = run_agent(self._batch_evaluate_prompt(chunk), model=self.model, num_gen=1, temperature=0.3)
+            feedbacks.extend(self._parse_batch_evaluation(response, chunk))
+
+        for i in self._failed_items(questions, feedbacks):
+            question_data = questions[i]
+            feedbacks[i] = self.evaluate_quality(
+                text, self._eval_input(question_data), question_data["knowledge"],
+                question_data["question_type"], data_class, use_cascade=False,
+            )
+        return feedbacks
+
+    def _cascade_batch(self, responses, chunk):
+        """小模型对一个批次的多个回答 -> 每道试题的 (评估结果, 级联判定)"""
+        parsed = [self._parse_batch_evaluation(response, chunk) for response in responses]
+        return [self._cascade_feedback([sample[i] for sample in parsed]) for i in range(len(chunk))]
+
+    @staticmethod
+    def _escalated(questions, results):
+        return [question_data for question_data, (feedback, _) in zip(questions, results) if feedback is None]
+
+    def _merge_escalated(self, results, escalated_feedbacks):
+        """合并小模型结果与升级后的评估结果，顺序与试题一致"""
+        escalated_feedbacks = iter(escalated_feedbacks)
+        return [
+            feedback if feedback is not None else self._with_cascade(next(escalated_feedbacks), verdict)
+            for feedback, verdict in results
+        ]
+
+    @track_usage()
+    async def evaluate_questions_batch_async(self, text, questions, data_class="web"):
+        """evaluate_questions_batch 的异步版本，各批次及回退请求并发执行"""
+        screens = [self._screen(text, question_data) for question_data in questions]
+        pending = [i for i, screen in enumerate(screens) if not self._skips(screen)]
+        evaluated = await self._evaluate_batch_llm_async(text, [questions[i] for i in pending], data_class)
+        return self._merge_screens(screens, pending, evaluated)
+
+    async def _evaluate_batch_llm_async(self, text, questions, data_class):
+        if self.cascade is None:
+            return await self._evaluate_batch_model_async(text, questions, data_class)
+
+        chunks = self._batch_chunks(questions)
+        responses = await asyncio.gather(
+            *[self._run_small_async(self._batch_evaluate_prompt(chunk), json_mode=False) for chunk in chunks]
+        )
+        results = [
+            result
+            for chunk, chunk_responses in zip(chunks, responses)
+            for result in self._cascade_batch(chunk_responses, chunk)
+        ]
+        return self._merge_escalated(
+            results, await self._evaluate_batch_model_async(text, self._escalated(questions, results), data_class)
+        )
+
+    async def _evaluate_batch_model_async(self, text, questions, data_class):
+        chunks = self._batch_chunks(questions)
+        responses = await asyncio.gather(
+            *[
+                run_agent_async(self._batch_evaluate_prompt(chunk), model=self.model, num_gen=1, temperature=0.3)
+                for chunk in chunks
+            ]
+        )
+        feedbacks = [
+            feedback
+            for chunk, response in zip(chunks, responses)
+            for feedback in self._parse_batch_evaluation(response, chunk)
+        ]
+
+        missing = self._failed_items(questions, feedbacks)
+        fallbacks = await asyncio.gather(
+            *[
+                self.evaluate_quality_async(
+                    text, self._eval_input(questions[i]), questions[i]["knowledge"],
+                    questions[i]["question_type"], data_class, use_cascade=False,
+                )
+                for i in missing
+            ]
+        )
+        for i, feedback in zip(missing, fallbacks):
+            feedbacks[i] = feedback
+        return feedbacks
+
+    def _parse_evaluation(self, evaluation):
+        """将校验后的评估结果（QualityEvaluation）按阈值判断是否需要改写/删除"""
+        return self._evaluation_result({
+            "quality score": evaluation.quality_score,
+            "relevance score": evaluation.relevance_score,
+            "consistency score": evaluation.consistency_score,
+            "improvement suggestions": evaluation.improvement_suggestions,
+        })
+
+    @classmethod
+    def _evaluation_result(cls, result):
+        """按阈值判断是否需要改写/删除，result 的 key 已转为小写"""
         # 6. 判断是否字段缺失或分数太低
         delete_data = any(
             result.get(k) is None or result.get(k) < 6
-            for k in ["quality score", "relevance score", "consistency score"]
+            for k in cls.SCORE_KEYS
         )
-        requires_refinement = result.get("quality score", 0) < 6
+        requires_refinement = (result.get("quality score") or 0) < 6
 
         # 返回结构
         return {
@@ -236,6 +814,21 @@ class ExpertAgent(BaseAgent):
             "improvement_suggestions": result.get("improvement suggestions", ""),
         }
 
+    def _refine_prompt(self, text, response, knowledge_point, data_class, expert_feedback):
+        # 获取用于改进的 prompt
+        prompt_template = self.prompts[f"refine_response_{data_class}"]
+
+        # 填充 prompt 模板
+        return build_prompt(
+            prompt_template,
+            "text",
+            text,
+            response=response,
+            knowledge=knowledge_point,
+            feedback=expert_feedback.get("feedback", " "),
+        )
+
+    @track_usage()
     def refine_response(self, text, response, knowledge_point, data_class, expert_feedback):
         """
         根据评估反馈改进问题和答案。
@@ -246,24 +839,24 @@ class ExpertAgent(BaseAgent):
         - data_class: 数据类别（如 books, articles, web）
         - expert_feedback: 评估反馈，包含改进建议
         """
-        # 获取用于改进的 prompt
-        prompt_template = self.prompts[f"refine_response_{data_class}"]
-
-        # 填充 prompt 模板
-        prompt = prompt_template.format(
-            text=text,
-            response=response,
-            knowledge=knowledge_point,
-            feedback=expert_feedback.get("feedback", " "),
-        )
+        prompt = self._refine_prompt(text, response, knowledge_point, data_class, expert_feedback)
 
         # 调用大模型生成改进后的内容
-        refined_response = run_agent(prompt, model=self.model, num_gen=1, temperature=0.3)
-        refined_response = re.sub(r"```(?:json)?|```", "", refined_response.strip())
-        parsed = json.loads(refined_response)
+        refined = self.run_structured(prompt, QuestionAnswer)
+        return self._parse_refined(refined)
+
+    @track_usage()
+    async def refine_response_async(self, text, response, knowledge_point, data_class, expert_feedback):
+        """refine_response 的异步版本"""
+        prompt = self._refine_prompt(text, response, knowledge_point, data_class, expert_feedback)
+        refined = await self.run_structured_async(prompt, QuestionAnswer)
+        return self._parse_refined(refined)
+
+    @staticmethod
+    def _parse_refined(refined):
         return {
-            "question": parsed.get("question", "").strip(),
-            "answer": parsed.get("answer", "").strip()
+            "question": refined.question.strip(),
+            "answer": refined.answer.strip()
         }
 
 
@@ -275,8 +868,7 @@ class VirtualTeacherAgent(BaseAgent):
 
         self.prompts = CONVERSATION_PROMPTS_CN
 
-    def generate_thinking_chain(self, text, response, data_class):
-        """生成思维链，用于引导学生思考和推理答案"""
+    def _thinking_chain_prompt(self, response, data_class):
         if isinstance(response, dict):
             question = response.get('question', '')
             answer = response.get('answer', '')
@@ -286,33 +878,63 @@ class VirtualTeacherAgent(BaseAgent):
         prompt_template = self.prompts.get(
             f"generate_chain_of_thought_{data_class}", {}
         )
-        prompt = prompt_template.format(response=response)
+        return prompt_template.format(response=response)
+
+    @track_usage()
+    def generate_thinking_chain(self, text, response, data_class):
+        """生成思维链，用于引导学生思考和推理答案"""
+        prompt = self._thinking_chain_prompt(response, data_class)
 
         # 使用模型生成思维链
-        thinking_chain = run_agent(prompt, model=self.model, num_gen=1, temperature=0.5)
-        thinking_chain = re.sub(r"```(?:json)?|```", "", thinking_chain.strip())
-        parsed = json.loads(thinking_chain)
+        thinking_chain = self.run_structured(prompt, ChainOfThought, temperature=0.5)
+        return self._parse_thinking_chain(thinking_chain)
+
+    @track_usage()
+    async def generate_thinking_chain_async(self, text, response, data_class):
+        """generate_thinking_chain 的异步版本"""
+        prompt = self._thinking_chain_prompt(response, data_class)
+        thinking_chain = await self.run_structured_async(prompt, ChainOfThought, temperature=0.5)
+        return self._parse_thinking_chain(thinking_chain)
+
+    @staticmethod
+    def _parse_thinking_chain(thinking_chain):
         # 获取思维链
-        formatted_thinking_chain = parsed.get("CoT", "").strip()
+        formatted_thinking_chain = thinking_chain.CoT.strip()
         # 返回结果
         return formatted_thinking_chain
 
-    def convert_to_conversational_form(self, text, response, data_class):
-        """将选择题转换为更自然的口语化对话形式"""
+    def _conversation_prompt(self, text, response, data_class):
         # 获取对话转换模板
         prompt_template = self.prompts.get(f"convert_to_conversation_{data_class}", {})
-        prompt = prompt_template.format(text=text, response=response)
+        return prompt_template.format(text=text, response=response)
+
+    @track_usage()
+    def convert_to_conversational_form(self, text, response, data_class):
+        """将选择题转换为更自然的口语化对话形式"""
+        prompt = self._conversation_prompt(text, response, data_class)
 
         # 使用模型生成对话形式
-        conversational_response = run_agent(
-            prompt, model=self.model, num_gen=1, temperature=0.5
-        )
-        conversational_response = re.sub(r"```(?:json)?|```", "", conversational_response.strip())
-        # 拼接问题和答案
         try:
-            parsed_response = json.loads(conversational_response)
-            question = parsed_response.get("input", "").strip()
-            answer = parsed_response.get("output", "").strip()
+            conversation = self.run_structured(prompt, Conversation, temperature=0.5)
+        except ValueError:
+            conversation = None
+        return self._parse_conversation(conversation)
+
+    @track_usage()
+    async def convert_to_conversational_form_async(self, text, response, data_class):
+        """convert_to_conversational_form 的异步版本"""
+        prompt = self._conversation_prompt(text, response, data_class)
+        try:
+            conversation = await self.run_structured_async(prompt, Conversation, temperature=0.5)
+        except ValueError:
+            conversation = None
+        return self._parse_conversation(conversation)
+
+    @staticmethod
+    def _parse_conversation(conversation):
+        if conversation is not None:
+            question = conversation.input.strip()
+            answer = conversation.output.strip()
             
             # 拼接问题和答案
             conversational_form = {
@@ -320,8 +942,8 @@ class VirtualTeacherAgent(BaseAgent):
                     "answer": answer
                 }
 
-        except json.JSONDecodeError as e:
-            # 如果返回的结果不能被解析为 JSON，直接返回原始内容
+        else:
+            # 重新请求后仍不符合 schema，返回空对话
             conversational_form = {
                     "question": '',
                     "answer": ''
@@ -331,6 +953,7 @@ class VirtualTeacherAgent(BaseAgent):
         return conversational_form
 
 
+    @track_usage()
     def cot_deepseek(self, response):
         """生成思维链，用于引导学生思考和推理答案"""
         # 获取思维链生成模板
@@ -347,3 +970,7 @@ class VirtualTeacherAgent(BaseAgent):
         # 返回结果
         return thinking_chain
 
+    @track_usage()
+    async def cot_deepseek_async(self, response):
+        """cot_deepseek 的异步版本"""
+        return await run_agent_async(response, model=self.model, num_gen=1, temperature=0.5)
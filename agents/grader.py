@@ -1,9 +1,12 @@
 import json
 from agents.agent import BaseAgent
-from utils.toolkit import extract_grading_result, run_agent, GradingResult
+from utils.toolkit import extract_grading_result, run_agent, run_agent_async, GradingResult
 import re
 from pydantic import BaseModel, RootModel, ValidationError
+import statistics
 from typing import List
+from utils.usage_tracker import track_usage
+from utils.llm_json import parse_json
 
 
 class StudentGrading(BaseModel):
@@ -13,6 +16,11 @@ class StudentGrading(BaseModel):
     fluency_score: str
 
 
+SCORE_FIELDS = ("mastery_score", "accuracy_score", "fluency_score")
+# 级联评分的判定阈值：平均 mastery_score 四舍五入后 ≤2 为 l、=3 为 m、≥4 为 h
+CASCADE_THRESHOLDS = [("mastery_score", 2.5), ("mastery_score", 3.5)]
+
+
 class GradingResultModel(RootModel[List[StudentGrading]]):
     """
     v2 的根模型写法:
@@ -26,13 +34,20 @@ class GradingResultModel(RootModel[List[StudentGrading]]):
 class GradingTeacher(BaseAgent):
     """评卷老师Agent，用于全面评估问答数据质量"""
 
-    def __init__(self, model="qwen"):
+    def __init__(self, model="qwen", num_votes=1, cascade=None):
+        """
+        - num_votes: 自洽性评分的采样次数，>1 时一次 n=num_votes 请求获得多份评分并取中位数
+        - cascade: 级联评分（utils.cascade.CascadePolicy），先由小模型评分，结果不可靠时才调用 model
+        """
         super().__init__(name="GradingTeacher", model=model)
+        self.num_votes = num_votes
+        self.cascade = cascade
         from prompts.finl_eval_prompts import GRADE_PROMPT_CN, GRADE_PROMPT_CN2, GRADE_PROMPT_CN_FINAL
 
         # self.prompt = GRADE_PROMPT_CN  GRADE_PROMPT_CN2
         self.prompt = GRADE_PROMPT_CN_FINAL  
 
+    @track_usage()
     def evaluate_answer(self, text, response, student_answer, data_class=None):
         """
         对问答数据进行评估并给出评分和反馈
@@ -41,16 +56,88 @@ class GradingTeacher(BaseAgent):
         - student_answer: 虚拟学生的回答
         - data_class: 数据类别（如书籍、文章或网络内容）
         """
+        prompt = self._grading_prompt(text, response, student_answer)
+
+        # 级联：先由小模型评分，结果可靠时直接采用
+        verdict = None
+        if self.cascade is not None:
+            # 小模型的多个回答用于估计置信度，不读写缓存
+            grading_result, verdict = self._cascade_grading(run_agent(
+                prompt, model=self.cascade.small_model, num_gen=self.cascade.samples,
+                temperature=self.cascade.temperature, use_cache=False,
+            ))
+            if grading_result is not None:
+                return grading_result
+
+        # 调用大模型进行评估；多份评分用于投票，每次运行都需要新的采样，不读写缓存
+        grading_response = run_agent(
+            prompt, model=self.model, num_gen=self.num_votes, temperature=0.5, use_cache=self.num_votes == 1
+        )
+
+        return self._with_cascade(self._parse_grading(grading_response), verdict)
+
+    @track_usage()
+    async def evaluate_answer_async(self, text, response, student_answer, data_class=None):
+        """evaluate_answer 的异步版本"""
+        prompt = self._grading_prompt(text, response, student_answer)
+
+        verdict = None
+        if self.cascade is not None:
+            grading_result, verdict = self._cascade_grading(await run_agent_async(
+                prompt, model=self.cascade.small_model, num_gen=self.cascade.samples,
+                temperature=self.cascade.temperature, use_cache=False,
+            ))
+            if grading_result is not None:
+                return grading_result
+
+        grading_response = await run_agent_async(
+            prompt, model=self.model, num_gen=self.num_votes, temperature=0.5, use_cache=self.num_votes == 1
+        )
+        return self._with_cascade(self._parse_grading(grading_response), verdict)
+
+    @staticmethod
+    def _mean_mastery(grading):
+        """一份评分中各学生 mastery_score 的平均值；解析失败或没有数值分数时为 None"""
+        scores = [int(item["mastery_score"]) for item in grading.get("results") or []
+                  if str(item["mastery_score"]).isdigit()]
+        return sum(scores) / len(scores) if scores else None
+
+    def _cascade_grading(self, small_response):
+        """
+        根据小模型的多份评分判断是否升级，返回 (评分结果, 级联判定)；
+        需要升级时评分结果为 None，由 model 重新评分
+        """
+        responses = small_response if isinstance(small_response, list) else [small_response]
+        gradings = [self._parse_grading(r) for r in responses]
+        samples = []
+        for grading in gradings:
+            mean = self._mean_mastery(grading)
+            samples.append(None if mean is None else {"mastery_score": mean})
+
+        verdict = self.cascade.assess(samples, CASCADE_THRESHOLDS)
+        if verdict["escalate"]:
+            return None, verdict
+        # 与自洽性评分相同：各学生的各项分数取中位数
+        return self.cascade.annotate(self._vote(gradings), verdict), verdict
+
+    def _with_cascade(self, grading_result, verdict):
+        if verdict is not None:
+            self.cascade.annotate(grading_result, verdict)
+        return grading_result
+
+    def _grading_prompt(self, text, response, student_answer):
         # 创建评估的 prompt
         prompt_template = self.prompt
-        prompt = prompt_template.format(
+        return prompt_template.format(
             text=text,
             response=response,
             student_answer=student_answer,
         )
 
-        # 调用大模型进行评估
-        grading_response = run_agent(prompt, model=self.model, num_gen=1, temperature=0.5)
+    def _parse_grading(self, grading_response):
+        # 多份评分（num_votes > 1）逐份解析后投票
+        if isinstance(grading_response, list):
+            return self._vote([self._parse_grading(r) for r in grading_response])
 
         # 使用正则提取评分和反馈
         try:
@@ -101,6 +188,67 @@ class GradingTeacher(BaseAgent):
     #                 "feedback": "无法提取评分和反馈，请检查输入格式。",
     #             }
 
+    @staticmethod
+    def _summarize(items):
+        """根据各学生的评分计算平均 mastery_score 与总体 mastery_level"""
+        numeric_scores = []
+        for student_item in items:
+            ms = student_item.mastery_score  
+            if ms.isdigit():
+                numeric_scores.append(int(ms))
+
+        if len(numeric_scores) == 0:
+            avg_score = "none"
+            mastery_level = "none"
+        else:
+            avg_val = sum(numeric_scores) / len(numeric_scores)
+            avg_score_rounded = round(avg_val)
+            # 示范: ≤2 -> l, =3 -> m, ≥4 -> h
+            if avg_score_rounded <= 2:
+                mastery_level = "l"
+            elif avg_score_rounded == 3:
+                mastery_level = "m"
+            else:
+                mastery_level = "h"
+            avg_score = int(avg_val)  # 可按需处理成 int(avg_val) 或 round(avg_val,2)
+
+        return {
+            "results": [item.dict() for item in items],
+            "average_mastery_score": avg_score,
+            "mastery_level": mastery_level,
+        }
+
+    def _vote(self, gradings):
+        """
+        自洽性评分：合并多次独立评分，每个学生的各项分数取中位数。
+        gradings 为 extract_grading_result 的结果列表，解析失败的评分不参与投票。
+        """
+        valid = [g["results"] for g in gradings if g.get("results")]
+        if not valid:
+            return gradings[0]
+
+        scores = {}
+        for results in valid:
+            for item in results:
+                student = scores.setdefault(item["id"], {field: [] for field in SCORE_FIELDS})
+                for field in SCORE_FIELDS:
+                    if str(item[field]).isdigit():
+                        student[field].append(int(item[field]))
+
+        items = [
+            StudentGrading(
+                id=student_id,
+                **{
+                    field: str(statistics.median_low(values)) if values else "none"
+                    for field, values in fields.items()
+                },
+            )
+            for student_id, fields in scores.items()
+        ]
+        summary = self._summarize(items)
+        summary["votes"] = len(valid)
+        return summary
+
     def extract_grading_result(self, grading_response: str):
         """
         从非标准JSON格式的字符串中提取评分信息。
@@ -108,62 +256,25 @@ class GradingTeacher(BaseAgent):
         2) 如果失败，回退到正则表达式或其它方法提取。
         3) 在成功解析后，计算平均 mastery_score 并得到一个总体 mastery_level。
         """
-        # 先做一些基本的字符串清理（去除 ```json 等）
-        grading_response = re.sub(r"```json", "", grading_response)
-        grading_response = re.sub(r"```", "", grading_response)
-        grading_response = grading_response.strip()
-
         # =============== 尝试用 Pydantic 直接解析 ===============
         try:
-            # 使用正则匹配 JSON 数组或 JSON 对象
-            match = re.search(r'(\[\s*\{.*?\}\s*\]|\{\s*".*?".*?\})', grading_response, re.DOTALL)
-            if match:
-                grading_response = match.group(1).strip()  # 获取匹配的 JSON 片段
-
-            # 替换 JSON 里的 `null` 为 `"none"`
-            grading_response = re.sub(r'\bnull\b', 'none', grading_response)
-
-            # 先把裸露的 `none` 替换成 `"none"`（字符串格式）
-            grading_response = re.sub(r'(?<!")\bnone\b(?!")', '"none"', grading_response)
-
-            # 统一所有数值类型（整数和小数）为字符串，例如：5 -> "5"
-            grading_response = re.sub(r':\s*(\d+(\.\d+)?)', lambda m: f': "{m.group(1)}"', grading_response)
-
-            # 修正 JSON 格式，去除额外的 `\n`
-            grading_response = grading_response.replace("\n", "").strip()
-
-            parsed_model = GradingResultModel.parse_raw(grading_response)
+            # 提取 JSON 数组或对象并在本地修复格式缺陷，单个对象视为一名学生的评分
+            parsed = parse_json(grading_response)
+            if isinstance(parsed, dict):
+                parsed = [parsed]
+
+            # 统一为字符串：数值 5 -> "5"，null -> "none"
+            parsed = [
+                {k: "none" if v is None else str(v) for k, v in item.items()}
+                for item in parsed
+                if isinstance(item, dict)
+            ]
+
+            parsed_model = GradingResultModel.model_validate(parsed)
             # 这是 List[StudentGrading]
-            items = parsed_model.root
-
-            numeric_scores = []
-            for student_item in items:
-                ms = student_item.mastery_score  
-                if ms.isdigit():
-                    numeric_scores.append(int(ms))
-
-            if len(numeric_scores) == 0:
-                avg_score = "none"
-                mastery_level = "none"
-            else:
-                avg_val = sum(numeric_scores) / len(numeric_scores)
-                avg_score_rounded = round(avg_val)
-                # 示范: ≤2 -> l, =3 -> m, ≥4 -> h
-                if avg_score_rounded <= 2:
-                    mastery_level = "l"
-                elif avg_score_rounded == 3:
-                    mastery_level = "m"
-                else:
-                    mastery_level = "h"
-                avg_score = int(avg_val)  # 可按需处理成 int(avg_val) 或 round(avg_val,2)
-
-            return {
-                "results": [item.dict() for item in items],
-                "average_mastery_score": avg_score,
-                "mastery_level": mastery_level,
-            }
+            return self._summarize(parsed_model.root)
 
-        except ValidationError as e:
+        except (json.JSONDecodeError, ValidationError) as e:
             print("Pydantic无法解析，尝试使用正则或其它方式:", e)
 
             return {
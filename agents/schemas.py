@@ -0,0 +1,66 @@
+"""
+各 agent 期望的模型输出结构（pydantic），配合 BaseAgent.run_structured 使用：
+支持的服务商开启 JSON 模式，输出按 schema 校验，不合格时重新请求而不是丢弃整条数据。
+"""
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+
+class KnowledgePoint(BaseModel):
+    knowledge: str
+    question: str
+    difficulty: str
+
+
+# 知识点抽取：[{"q1": {...}}, {"q2": {...}}]
+KnowledgeExtraction = List[Dict[str, KnowledgePoint]]
+
+
+class MultipleChoiceQuestion(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    question: str = Field(min_length=1)
+    options: List[str] = Field(min_length=4)
+    answer: str
+
+    @field_validator("answer")
+    @classmethod
+    def check_answer(cls, value):
+        value = value.strip().upper()
+        if value not in ("A", "B", "C", "D"):
+            raise ValueError(f"answer 应为 A-D，实际为 {value!r}")
+        return value
+
+
+class QuestionAnswer(BaseModel):
+    """简答题、开放讨论题及改写后的试题"""
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    question: str = Field(min_length=1)
+    answer: str = Field(min_length=1)
+
+
+class QualityEvaluation(BaseModel):
+    """专家评估；分数缺失时按原有逻辑标记删除，类型错误（非数值）视为不合格输出"""
+    quality_score: Optional[Union[int, float]] = None
+    relevance_score: Optional[Union[int, float]] = None
+    consistency_score: Optional[Union[int, float]] = None
+    improvement_suggestions: str = ""
+
+    @model_validator(mode="before")
+    @classmethod
+    def normalize_keys(cls, data):
+        # "Quality Score" / "quality score" -> quality_score（兼容模型大小写误差）
+        if isinstance(data, dict):
+            return {k.strip().lower().replace(" ", "_"): v for k, v in data.items()}
+        return data
+
+
+class Conversation(BaseModel):
+    input: str
+    output: str
+
+
+class ChainOfThought(BaseModel):
+    CoT: str = Field(min_length=1)
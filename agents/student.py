@@ -1,22 +1,23 @@
 # from global_methods import run_chatgpt
-import torch
-
 # from agent import BaseAgent
 from agents.agent import BaseAgent
 from utils.toolkit import *
+from utils.usage_tracker import track_usage
 
 
 class SimulatedLearner(BaseAgent):
     """模拟考生 Agent，用于回答问题"""
 
-    def __init__(self, model_api="qwen", model_paths=None, model_platforms=None):
+    def __init__(self, model_api="qwen", model_paths=None, model_platforms=None, num_samples=1):
         """
         初始化模拟考生Agent
         - model_apis: 模型API
         - model_paths: 路径
         - model_platforms: 平台
+        - num_samples: API 模型每题采样的回答数，多个回答通过一次 n=num_samples 请求获得
         """
         super().__init__(name="SimulatedLearner", model=None)
+        self.num_samples = num_samples
         self.models = []
         self.tokenizers = []
         self.model_names = []
@@ -37,7 +38,8 @@ class SimulatedLearner(BaseAgent):
     def load_model(self, platform, model_path):
         """根据平台加载模型"""
         if platform == "huggingface":
-            # 加载 HuggingFace 模型
+            # 加载 HuggingFace 模型（torch / transformers 只在加载本地模型时导入）
+            import torch
             from transformers import AutoModelForCausalLM, AutoTokenizer
 
             self.tokenizers.append(
@@ -74,6 +76,7 @@ class SimulatedLearner(BaseAgent):
             )
             self.model_names.append(model_path)
 
+    @track_usage()
     def answer_question(self, response_data):
         """
         生成模拟考生的回答
@@ -92,6 +95,7 @@ class SimulatedLearner(BaseAgent):
         # 返回回答
         return learner_answer
 
+    @track_usage()
     def answer_questions_batch(self, response_data_list):
         """批量生成模拟考生的回答"""
 
@@ -108,7 +112,9 @@ class SimulatedLearner(BaseAgent):
                 answers = tokenizer.batch_decode(outputs[:, input_length:], skip_special_tokens=True)
                 all_answers.append(answers)
             else:
-                all_answers.append([run_agent(prompt, model=model) for prompt in prompts])
+                # 每个采样作为一列，与本地模型的回答一起转置
+                samples = [self._api_answers(prompt, model) for prompt in prompts]
+                all_answers.extend(map(list, zip(*samples)))
 
         # 转置以便每个问题有一个回答
         final_answers = list(map(list, zip(*all_answers)))
@@ -131,10 +137,18 @@ class SimulatedLearner(BaseAgent):
                 answers.append(answer)
             else:
                 # 如果是自定义API模型，直接调用 run_agent
-                answers.append(run_agent(prompt, model=model))
+                answers.extend(self._api_answers(prompt, model))
 
         return answers  # 返回多个模型的输出
 
+    def _api_answers(self, prompt, model):
+        """调用 API 模型作答，返回 num_samples 个回答（一次请求）；多个回答需要新的采样，不读写缓存"""
+        if self.num_samples > 1:
+            answers = run_agent(prompt, model=model, num_gen=self.num_samples, use_cache=False)
+            # deepseek 不支持 n 采样，固定返回单个结果
+            return answers if isinstance(answers, list) else [answers]
+        return [run_agent(prompt, model=model)]
+
 
 # 主程序调用示例
 # if __name__ == "__main__":
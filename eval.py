@@ -310,10 +310,15 @@ def main():
     parser.add_argument("--max_new_tokens", type=int, default=2048, help="最大生成长度")
     parser.add_argument("--temperature", type=float, default=0.3, help="生成温度")
     parser.add_argument("--model_mode", type=str, default='cot', help="模板选择")
+    parser.add_argument("--llm_cache", type=str, default=None, help="API 兜底推理的缓存路径，默认不开启（也可通过环境变量 LLM_CACHE_PATH 开启）")
     
 
     args = parser.parse_args()
 
+    if args.llm_cache:
+        from utils.llm_cache import LLMCache
+        set_llm_cache(LLMCache(args.llm_cache))
+
     model, tokenizer = load_model(args.model_path, temperature=args.temperature)
     output_dir = os.path.join(args.output_dir, args.model_path.split("/")[-1])
     os.makedirs(output_dir, exist_ok=True)
@@ -1,22 +1,48 @@
 import os
+import re
 import importlib
-import inspect
 
-# 动态导入所有 *_prompts.py 模块
+# 按名称惰性加载 prompt：首次访问 prompts.XXX_CN 时才导入对应的 *_prompts.py 模块。
+# 名称索引通过扫描源码中顶层的 `XXX_CN = ...` 赋值建立，无需导入模块。
 current_dir = os.path.dirname(__file__)
+_ASSIGNMENT = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*_CN)\s*=", re.MULTILINE)
 
-for file in os.listdir(current_dir):
-    if file.endswith("_prompts.py") and file != "__init__.py":
-        module_name = f".{file[:-3]}"
-        module = importlib.import_module(module_name, __package__)
 
-        # 获取所有以 'CN' 结尾的变量
-        for name, value in inspect.getmembers(module):
-            if name.endswith("_CN"):
-                globals()[name] = value
+def _build_index():
+    index = {}
+    for file in sorted(os.listdir(current_dir)):
+        if file.endswith("_prompts.py"):
+            with open(os.path.join(current_dir, file), "r", encoding="utf-8") as f:
+                for name in _ASSIGNMENT.findall(f.read()):
+                    index.setdefault(name, file[:-3])
+    return index
 
-# 定义 __all__ 避免不必要的变量暴露
-__all__ = [name for name in globals() if name.endswith("_CN")]
+
+# prompt 名称 -> 所在模块名
+_PROMPT_INDEX = _build_index()
+
+# 定义 __all__ 避免不必要的变量暴露（from prompts import * 会导入全部模块）
+__all__ = sorted(_PROMPT_INDEX)
+
+
+def get_prompt(name):
+    """按名称获取 prompt 模板，所在模块在首次访问时导入"""
+    if name not in _PROMPT_INDEX:
+        raise KeyError(f"Unknown prompt: {name}")
+    module = importlib.import_module(f".{_PROMPT_INDEX[name]}", __package__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __getattr__(name):
+    if name in _PROMPT_INDEX:
+        return get_prompt(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_PROMPT_INDEX))
 
 
 # from expert_prompts import (
@@ -97,6 +97,57 @@ EVALUATE_QUALITY_ARTICLE_CN = EVALUATE_QUALITY_BOOK_CN
 # web
 EVALUATE_QUALITY_WEB_CN = EVALUATE_QUALITY_BOOK_CN
 
+# batch：一次请求评估同一语料的多道试题，评分标准与单题评估一致
+EVALUATE_QUALITY_BATCH_CN = """
+# 🎯 角色使命
+你是一位林业领域的资深命题与评估专家，擅长从专业角度批量评估同一份教学材料生成的各类试题质量，并逐题提供优化建议。
+
+## 🧩 核心任务
+请对“待评估试题列表”中的**每一道**试题，基于其“知识点”与“试题内容”，从整体质量、相关性、一致性三个维度打分，并提出改进建议。各题独立评分，互不影响。输出严格的 JSON 数组。
+
+## 🧠 评估评分标准
+请参考以下标准为每项评分，分值范围为 1-10 分：
+
+### 1. Quality Score（整体质量）
+- **0-2 分**：严重错误或无关内容，结构混乱，无法考察知识点。
+- **3-5 分**：部分准确，但存在模糊、表达不清或结构不规范问题。
+- **6-8 分**：整体较好，表达清晰，基本符合教学要求。
+- **9-10 分**：表达清晰、逻辑严谨，完全符合命题规范，具有良好教学价值。
+
+### 2. Relevance Score（专业相关性）
+- **0-2 分**：与林业领域无关或内容误导。
+- **3-5 分**：相关性较弱，偏离专业主题。
+- **6-8 分**：基本相关，但不够聚焦或不深入。
+- **9-10 分**：高度相关，聚焦林业核心内容或关键知识点。
+
+### 3. Consistency Score（知识一致性）
+- **0-2 分**：与知识点严重不符，无法测查目标内容。
+- **3-5 分**：部分涉及知识点，但有偏差或覆盖不充分。
+- **6-8 分**：匹配度较好，但细节或深度仍可提升。
+- **9-10 分**：精准对齐知识点，覆盖全面，考查到位。
+
+### 4. Improvement Suggestions
+请基于评分为每道试题简要提出**1 条明确具体的建议**，用于后续优化试题。
+
+## 🛠 待评估试题列表（JSON，多选题的 response 为csv格式）
+{items}
+
+## ✅ 输出格式（JSON 数组，严格使用英文引号，每道试题一项，id 原样返回）
+请严格按照以下格式输出，不要生成除 JSON 外的任何解释说明：
+
+```json
+[
+  {{
+    "id": "1",
+    "Quality Score": <1-10>,
+    "Relevance Score": <1-10>,
+    "Consistency Score": <1-10>,
+    "Improvement Suggestions": "<简短的中文改进建议>"
+  }}
+]
+❌ 禁止添加任何额外文字、格式说明或非 JSON 内容。
+"""
+
 # ========= refine ==========
 # book
 REFINE_RESPONSE_BOOK_CN = """
@@ -160,6 +211,7 @@ EXPERT_PROMPTS_CN = {
     "evaluate_quality_book": EVALUATE_QUALITY_BOOK_CN,
     "evaluate_quality_article": EVALUATE_QUALITY_ARTICLE_CN,
     "evaluate_quality_web": EVALUATE_QUALITY_WEB_CN,
+    "evaluate_quality_batch": EVALUATE_QUALITY_BATCH_CN,
     "refine_response_book": REFINE_RESPONSE_BOOK_CN,
     "refine_response_article": REFINE_RESPONSE_ARTICLE_CN,
     "refine_response_web": REFINE_RESPONSE_WEB_CN,
@@ -378,6 +378,40 @@ OPEN_DISCUSSION_PROMPT_CN = """
 """
 
 
+# ====== Batch Question Prompt ======
+# 一次请求为同一语料的多个知识点出题，题型由知识点难度决定
+BATCH_QUESTIONS_PROMPT_CN = """
+# 🎯 角色使命
+你是一位专业考试命题设计师，擅长根据同一份背景文本，为多个知识点批量设计结构规范的试题，用于教学评估与智能问答模型训练。
+
+## 🧩 核心任务
+请根据背景文本，为“待出题列表”中的**每一项**各设计一道指定题型的试题，并给出答案：
+- multiple_choice：标准四选一单项选择题，考查记忆与理解（布鲁姆“记忆/理解”层级）
+- short_answer：简答题，回答可在 1~3 句话内完成，考查应用与分析（布鲁姆“应用/分析”层级）
+- open_discussion：开放性探讨题，答案给出建议性的答题要点，考查评价与创造（布鲁姆“评价/创造”层级）
+
+## ⚠️ 约束条件（重要！）
+✔️ 每一项必须且只能生成一道试题，题型与该项的 question_type 一致，id 原样返回  
+✔️ 所有内容必须基于背景文本、知识点与原始问题，严禁虚构知识  
+✔️ 选择题选项必须为 4 项且仅 1 个正确答案，answer 为正确选项字母（A/B/C/D）  
+✔️ 各题相互独立，不得相互引用  
+❌ 禁止输出任何解释、格式说明或附加文字
+
+## 📋 待出题列表（JSON）
+{items}
+
+## ✅ 输出格式（标准 JSON 数组，字段名使用英文双引号，顺序与待出题列表一致）
+```json
+[
+  {{"id": "1", "question_type": "multiple_choice", "question": "单项选择题题干", "options": ["选项A", "选项B", "选项C", "选项D"], "answer": "B"}},
+  {{"id": "2", "question_type": "short_answer", "question": "简答题题干", "answer": "参考答案"}},
+  {{"id": "3", "question_type": "open_discussion", "question": "探讨题题干", "answer": "答题要点"}}
+]
+```
+背景文本：{full_text}
+"""
+
+
 # 统一管理 Prompt 字典
 QUESTION_PROMPTS_CN = {
     "knowledge_extraction_article": KNOWLEDGE_EXTRACTION_ARTICLE_CN,
@@ -386,6 +420,7 @@ QUESTION_PROMPTS_CN = {
     "multiple_choice": MULTIPLE_CHOICE_PROMPT_CN,
     "short_answer": SHORT_ANSWER_PROMPT_CN,
     "open_discussion": OPEN_DISCUSSION_PROMPT_CN,
+    "batch_questions": BATCH_QUESTIONS_PROMPT_CN,
 }
 
 
@@ -0,0 +1,5 @@
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
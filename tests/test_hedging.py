@@ -0,0 +1,116 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+import utils.global_methods as gm
+from utils.hedging import HedgePolicy
+from utils.rate_limiter import configure_rate_limit
+from utils.retry import get_circuit_breaker
+
+
+def _completion(content):
+    return ChatCompletion.model_validate({
+        "id": "test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "qwen-plus",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    })
+
+
+class FakeAsyncClient:
+    """第一次调用很慢（对冲中落后的请求），之后的调用立即返回"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **request):
+        self.calls += 1
+        if self.calls % 2 == 1:
+            await asyncio.sleep(10)
+        return _completion("ok")
+
+
+def _hedge_policy():
+    policy = HedgePolicy(min_samples=1, min_delay=0.01, budget=1.0)
+    policy.tracker("qwen").record(0.01)
+    return policy
+
+
+def test_cancelled_hedge_releases_limiter_slot(monkeypatch):
+    client = FakeAsyncClient()
+    monkeypatch.setattr(gm.LLM_CLIENT_REGISTRY, "get_async_provider_client", lambda provider: client)
+    limiter = configure_rate_limit("dashscope", max_concurrency=8)
+    monkeypatch.setattr(gm, "_HEDGE_POLICY", _hedge_policy())
+
+    async def main():
+        for _ in range(3):
+            assert await gm.run_agent_async("hello", model="qwen", use_cache=False) == "ok"
+
+    asyncio.run(main())
+    assert client.calls == 6
+    assert limiter.in_flight == 0
+    assert get_circuit_breaker("dashscope").state == "closed"
+    assert not get_circuit_breaker("dashscope")._probing
+
+
+def test_sync_hedge_records_every_finished_attempt():
+    policy = _hedge_policy()
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.2)
+        return "ok"
+
+    assert policy.run("qwen", fn) == "ok"
+    tracker = policy.tracker("qwen")
+    # 对冲请求胜出后，落后的请求完成时同样记录耗时
+    deadline = time.monotonic() + 2
+    while len(tracker) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(tracker) == 3
+    assert tracker.percentile(1.0) >= 0.2
+
+
+def test_caller_cancelled_before_hedge_cancels_primary():
+    policy = HedgePolicy(min_samples=1, min_delay=5.0, budget=1.0)
+    policy.tracker("qwen").record(0.01)
+    state = {"started": 0, "cancelled": 0}
+
+    async def slow():
+        state["started"] += 1
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    async def main():
+        call = asyncio.ensure_future(policy.run_async("qwen", slow))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        try:
+            await call
+        except asyncio.CancelledError:
+            pass
+        # 返回时主请求已被取消（而不是等到事件循环关闭时）
+        assert state == {"started": 1, "cancelled": 1}
+
+    asyncio.run(main())
+
+
+def test_sync_hedge_delay_excludes_executor_queueing():
+    # 线程池只有 1 个线程且被占用：主请求排队期间不应触发对冲
+    policy = HedgePolicy(min_samples=1, min_delay=0.05, budget=1.0, max_workers=1)
+    policy.tracker("qwen").record(0.01)
+    blocker = policy._executor.submit(time.sleep, 0.3)
+
+    assert policy.run("qwen", lambda: "ok") == "ok"
+    blocker.result()
+    assert policy.hedges_fired == 0
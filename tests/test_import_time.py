@@ -0,0 +1,15 @@
+import pytest
+
+from tools.bench.bench_import_time import DEFAULT_BUDGETS_MS, HEAVY_MODULES, measure
+
+
+@pytest.mark.parametrize("module", ["agents", "prompts", "utils.prescreen"])
+def test_import_time_within_budget(module):
+    elapsed, profile = measure(module, repeat=3)
+    imported = {name for name, *_ in profile}
+
+    heavy = [name for name in HEAVY_MODULES if name in imported]
+    assert not heavy, f"import {module} 导入了重量级模块: {', '.join(heavy)}"
+    assert elapsed <= DEFAULT_BUDGETS_MS[module], (
+        f"import {module} 耗时 {elapsed:.1f}ms，超出预算 {DEFAULT_BUDGETS_MS[module]}ms"
+    )
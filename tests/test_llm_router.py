@@ -0,0 +1,66 @@
+import asyncio
+
+from utils.llm_router import Endpoint, EndpointPool
+
+
+def test_cancelled_call_async_releases_endpoint():
+    endpoint = Endpoint("router-test")
+    pool = EndpointPool("router-test", [endpoint])
+
+    async def slow(endpoint):
+        await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.ensure_future(pool.call_async(slow))
+        await asyncio.sleep(0.05)
+        assert endpoint.in_flight == 1
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
+    assert endpoint.in_flight == 0
+    # 取消不计为失败，也不影响平均延迟
+    assert endpoint.failures == 0
+    assert endpoint.latency == 1.0
+
+
+def test_call_failover_counts_failure():
+    first, second = Endpoint("router-a"), Endpoint("router-b", weight=0.5)
+    pool = EndpointPool("router", [first, second])
+
+    def fn(endpoint):
+        if endpoint is first:
+            raise TimeoutError("timeout")
+        return endpoint.name
+
+    assert pool.call(fn) == "router-b"
+    assert first.failures == 1 and first.in_flight == 0
+    assert second.failures == 0 and second.in_flight == 0
+
+
+def test_non_upstream_errors_do_not_penalize_endpoint():
+    from utils.retry import CircuitOpenError
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    endpoint = Endpoint("router-c")
+    pool = EndpointPool("router-c", [endpoint])
+
+    def bad_request(endpoint):
+        raise BadRequest("invalid parameter")
+
+    def circuit_open(endpoint):
+        raise CircuitOpenError("open")
+
+    for fn in (bad_request, circuit_open):
+        try:
+            pool.call(fn)
+        except Exception:
+            pass
+    assert endpoint.failures == 0
+    assert endpoint.in_flight == 0
+    assert endpoint.latency == 1.0
@@ -0,0 +1,28 @@
+from utils.prescreen import QuestionPrescreen
+from tools.analysis.low_relevance_extractor import filter_questions_across_fields
+
+
+def _screen_result():
+    return {"grounding": 0.9, "knowledge_coverage": 0.8, "issues": [], "passed": True, "audit": False}
+
+
+def test_prescreened_feedback_passes_low_relevance_extractor():
+    skipped = QuestionPrescreen.feedback(_screen_result())
+    assert skipped["relevance_score"] is None
+
+    entry = {
+        "id": "e1",
+        "question_setter": {"questions": ["q0", "q1", "q2"]},
+        "expert_agent": {"refined_questions": [
+            skipped,
+            {"relevance_score": 3, "requires_refinement": False},
+            {"relevance_score": 8, "requires_refinement": False},
+        ]},
+        "virtual_teacher": {"processed_results": ["r0", "r1", "r2"]},
+    }
+    filtered = filter_questions_across_fields(entry, threshold=6)
+
+    # 预筛跳过评估的试题保留，低相关度试题删除
+    assert filtered["question_setter"]["questions"] == ["q0", "q2"]
+    assert filtered["expert_agent"]["refined_questions"][0]["prescreen"]["passed"] is True
+    assert filtered["virtual_teacher"]["processed_results"] == ["r0", "r2"]
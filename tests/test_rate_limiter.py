@@ -0,0 +1,25 @@
+import asyncio
+
+from utils.rate_limiter import AdaptiveRateLimiter
+
+
+def test_acquire_async_cancelled_while_waiting_for_budget_releases_slot():
+    # rpm=1：第二个请求需要等待约 60s 的预算
+    limiter = AdaptiveRateLimiter("test", rpm=1, tpm=1000, max_concurrency=4)
+    limiter.acquire(est_tokens=10)
+    limiter.release(est_tokens=10)
+
+    async def main():
+        task = asyncio.ensure_future(limiter.acquire_async(est_tokens=10))
+        await asyncio.sleep(0.05)
+        assert limiter.in_flight == 1
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+    # 预占的 token 预算已归还
+    assert limiter._token_bucket.tokens > 1000 - 10 - 1
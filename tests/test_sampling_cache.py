@@ -0,0 +1,49 @@
+import utils.global_methods as gm
+from utils.llm_cache import LLMCache
+from agents import GradingTeacher, SimulatedLearner
+
+
+def _fake_qwen(calls):
+    def run_qwen(prompt, num_gen=1, **kwargs):
+        calls.append(num_gen)
+        if num_gen > 1:
+            return [f"sample {i}" for i in range(num_gen)]
+        return "answer"
+    return run_qwen
+
+
+def _use_cache(monkeypatch, tmp_path, calls):
+    monkeypatch.setattr(gm, "run_qwen", _fake_qwen(calls))
+    monkeypatch.setattr(gm, "_LLM_CACHE", LLMCache(str(tmp_path / "cache.sqlite")))
+    monkeypatch.setattr(gm, "_HEDGE_POLICY", None)
+
+
+def test_learner_samples_are_not_replayed_from_cache(monkeypatch, tmp_path):
+    calls = []
+    _use_cache(monkeypatch, tmp_path, calls)
+    learner = SimulatedLearner(model_api="qwen", num_samples=3)
+    learner.answer_question("q")
+    learner.answer_question("q")
+    assert calls == [3, 3]
+
+
+def test_grader_votes_are_not_replayed_from_cache(monkeypatch, tmp_path):
+    calls = []
+    _use_cache(monkeypatch, tmp_path, calls)
+    grader = GradingTeacher(model="qwen", num_votes=3)
+    for _ in range(2):
+        try:
+            grader.evaluate_answer("text", "question", ["answer"])
+        except Exception:
+            # 伪造的回答无法解析为评分，只关心请求次数
+            pass
+    assert calls == [3, 3]
+
+
+def test_single_answer_still_uses_cache(monkeypatch, tmp_path):
+    calls = []
+    _use_cache(monkeypatch, tmp_path, calls)
+    learner = SimulatedLearner(model_api="qwen", num_samples=1)
+    learner.answer_question("q")
+    learner.answer_question("q")
+    assert calls == [1]
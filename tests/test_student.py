@@ -0,0 +1,30 @@
+import agents.student as student
+from agents.student import SimulatedLearner
+
+
+def _fake_run_agent(prompt, model="qwen", num_gen=1, **kwargs):
+    if "deepseek" in model:
+        return {"reasoning": "think", "answer": f"{model}: {prompt[-2:]}"}
+    if num_gen > 1:
+        return [f"{model}-{i}: {prompt[-2:]}" for i in range(num_gen)]
+    return f"{model}: {prompt[-2:]}"
+
+
+def test_deepseek_answers_are_not_split_into_dict_keys(monkeypatch):
+    monkeypatch.setattr(student, "run_agent", _fake_run_agent)
+    learner = SimulatedLearner(model_api="deepseek-r1", num_samples=3)
+
+    answers = learner.answer_question("q1")
+    assert len(answers) == 1
+    assert answers[0]["answer"].startswith("deepseek-r1")
+
+    batch = learner.answer_questions_batch(["q1", "q2"])
+    assert len(batch) == 2
+    assert all(len(answers) == 1 and isinstance(answers[0], dict) for answers in batch)
+
+
+def test_api_samples_are_returned_per_question(monkeypatch):
+    monkeypatch.setattr(student, "run_agent", _fake_run_agent)
+    learner = SimulatedLearner(model_api="qwen", num_samples=3)
+    batch = learner.answer_questions_batch(["q1", "q2"])
+    assert [len(answers) for answers in batch] == [3, 3]
@@ -0,0 +1,40 @@
+import csv
+from types import SimpleNamespace
+
+from utils.usage_tracker import UsageTracker, usage_tags
+
+
+def _usage(prompt, completion, cached=None):
+    details = SimpleNamespace(cached_tokens=cached) if cached is not None else None
+    return SimpleNamespace(
+        prompt_tokens=prompt, completion_tokens=completion,
+        total_tokens=prompt + completion, prompt_tokens_details=details,
+    )
+
+
+def test_tracker_aggregates_without_buffering_records(tmp_path):
+    csv_path = tmp_path / "usage.csv"
+    tracker = UsageTracker(csv_path=str(csv_path))
+    for i in range(1000):
+        with usage_tags(agent="ExpertAgent", step=2, entry_id=f"e{i % 10}"):
+            tracker.record("dashscope", "qwen-plus", _usage(100, 50, cached=20), 0.5)
+    with usage_tags(agent="GradingTeacher", step=5, entry_id="e0"):
+        tracker.record("openai", "gpt-4", _usage(10, 10), 1.5)
+
+    assert not hasattr(tracker, "records")
+    report = tracker.report()
+    assert report["total"]["calls"] == 1001
+    assert report["total"]["total_tokens"] == 1000 * 150 + 20
+    assert report["total"]["prefix_hit_rate"] == 0.2
+    assert report["by_step"]["2"]["calls"] == 1000
+    assert report["by_step"]["5"]["latency_mean"] == 1.5
+    assert report["by_provider"]["openai"]["calls"] == 1
+    assert report["by_entry"]["e0"]["calls"] == 101
+    assert len(report["by_entry"]) == 10
+    assert abs(report["by_model"]["qwen-plus"]["cost"] - 1000 * (100 * 0.0008 + 50 * 0.002) / 1000) < 1e-9
+
+    tracker.close()
+    with open(csv_path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 1001
+    assert rows[-1]["model"] == "gpt-4"
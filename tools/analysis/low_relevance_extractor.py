@@ -3,19 +3,21 @@ import os
 import logging
 from datetime import datetime
 
-# 配置日志
-timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(
-            f"/home/wyp/project/ForestLLM/outputs/logs/filter_{timestamp}.log",
-            mode="w",
-            encoding="utf-8",
-        ),
-    ],
-)
+
+def setup_logging():
+    """配置日志（在 main 中调用，导入本模块时不创建日志文件）"""
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler(
+                f"/home/wyp/project/ForestLLM/outputs/logs/filter_{timestamp}.log",
+                mode="w",
+                encoding="utf-8",
+            ),
+        ],
+    )
 
 
 def load_data(file_path):
@@ -58,6 +60,7 @@ def filter_questions_across_fields(entry, threshold=6):
 
     说明:
       - 若某字段不存在，或长度不足，则仅在存在的字段中进行删除。
+      - relevance_score 为 None 的试题（本地预筛通过而跳过 LLM 评估，或评分解析失败）没有评分，予以保留。
       - steps 通常是一个字典，比如 {"1": "completed", "2": "completed"}，并无按题目索引的记录，不作处理。
     """
 
@@ -90,7 +93,7 @@ def filter_questions_across_fields(entry, threshold=6):
     for i in range(min_len):
         rq = refined_questions[i]
         score = rq.get("relevance_score", 0)
-        if score >= threshold:
+        if score is None or score >= threshold:
             # 该试题保留
             filtered_questions.append(questions[i])
             filtered_refined_qs.append(rq)
@@ -140,6 +143,8 @@ def process_data(input_file, output_file, threshold=6):
 
 
 def main():
+    setup_logging()
+
     # 路径示例，可根据需要修改
     input_path = "/home/wyp/project/ForestLLM/outputs/article/qwen_article_output_01_deduplicated.json"
     output_path = "/home/wyp/project/ForestLLM/outputs/article/qwen_article_output_02_lowrelevance_filtered.json"
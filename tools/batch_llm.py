@@ -0,0 +1,98 @@
+"""
+LLM 离线批处理工具。
+
+1. 以批处理模式运行某一步，把所有待执行的请求写入批处理文件（不实时调用 API）：
+    python tools/run_mutil.py ... --step 2 --batch-dir outputs/batch/step2
+2. 将 outputs/batch/step2/<provider>_batch.jsonl 提交到服务商 Batch API，下载结果文件；
+   本地测试时可用 mock-run 代替：
+    python tools/batch_llm.py mock-run --batch outputs/batch/step2/dashscope_batch.jsonl --results results.jsonl
+3. 回填结果到 LLM 缓存（按 custom_id 即缓存 key 对应回原请求）：
+    python tools/batch_llm.py ingest --results results.jsonl --cache outputs/0321/llm_cache.sqlite
+4. 去掉 --batch-dir 重跑该步，所有请求命中缓存，结果按 id 写回各条数据。
+   多轮依赖的调用（如先抽取知识点再逐点出题）每轮推进一层，重复 1-3 直到没有新的待执行请求。
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import json
+import argparse
+from utils.batch_llm import iter_batch_results
+from utils.llm_cache import LLMCache
+from utils.global_methods import parse_completion_body, LLM_CLIENT_REGISTRY
+
+
+def ingest(results_files, cache_path):
+    """将批处理结果写入 LLM 缓存，返回 (成功数, 失败数)"""
+    cache = LLMCache(cache_path)
+    ok, failed = 0, 0
+    for results_file in results_files:
+        for custom_id, body, error in iter_batch_results(results_file):
+            if error is not None or body is None:
+                failed += 1
+                print(f"⚠️ 请求 {custom_id} 失败: {error}")
+                continue
+            cache.put_by_key(custom_id, body.get("model", ""), parse_completion_body(body))
+            ok += 1
+    cache.close()
+    return ok, failed
+
+
+def mock_run(batch_file, results_file, base_url=None, reply="{}"):
+    """
+    本地执行批处理文件，生成与服务商格式一致的结果文件。
+    - 指定 base_url 时逐条请求该 OpenAI 兼容服务（如 tools/bench/mock_openai_server.py）
+    - 否则直接返回固定内容 reply
+    """
+    from tools.bench.mock_openai_server import build_completion
+
+    client = LLM_CLIENT_REGISTRY.get_client(base_url, "sk-mock") if base_url else None
+    count = 0
+    with open(batch_file, "r", encoding="utf-8") as fin, open(results_file, "w", encoding="utf-8") as fout:
+        for line in fin:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request["body"]
+            if client is not None:
+                completion = client.chat.completions.create(**body).model_dump()
+            else:
+                completion = build_completion(body, reply)
+            result = {
+                "id": f"batch_req_{count}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": completion},
+                "error": None,
+            }
+            fout.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 离线批处理：本地模拟执行与结果回填")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="回填批处理结果到 LLM 缓存")
+    ingest_parser.add_argument("--results", nargs="+", required=True, help="批处理结果 JSONL 文件")
+    ingest_parser.add_argument("--cache", required=True, help="run_mutil.py 使用的 LLM 缓存路径")
+
+    mock_parser = subparsers.add_parser("mock-run", help="本地模拟执行批处理文件")
+    mock_parser.add_argument("--batch", required=True, help="批处理请求 JSONL 文件")
+    mock_parser.add_argument("--results", required=True, help="输出结果 JSONL 文件")
+    mock_parser.add_argument("--base-url", default=None, help="OpenAI 兼容服务地址，不指定时返回固定内容")
+    mock_parser.add_argument("--reply", default="{}", help="未指定 base-url 时返回的固定内容")
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        ok, failed = ingest(args.results, args.cache)
+        print(f"回填完成: 成功 {ok} 条，失败 {failed} 条")
+    else:
+        count = mock_run(args.batch, args.results, base_url=args.base_url, reply=args.reply)
+        print(f"模拟执行完成: {count} 条请求 -> {args.results}")
+
+
+if __name__ == "__main__":
+    main()
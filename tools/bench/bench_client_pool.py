@@ -0,0 +1,76 @@
+"""
+对比“每次调用新建 OpenAI 客户端”与“注册表复用长连接客户端”的单次调用开销。
+
+用法:
+    python tools/bench/bench_client_pool.py --calls 500 --num_works 8
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..', '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI
+from utils.global_methods import LLMClientRegistry
+from tools.bench.mock_openai_server import start_mock_server
+
+
+def call_fresh_client(base_url):
+    """旧实现：每次调用都新建客户端（新的连接池与握手）"""
+    client = OpenAI(api_key="sk-mock", base_url=base_url)
+    client.chat.completions.create(
+        model="qwen-plus", messages=[{"role": "user", "content": "ping"}]
+    )
+    client.close()
+
+
+def call_registry_client(registry, base_url):
+    """新实现：从注册表获取共享的长连接客户端"""
+    client = registry.get_client(base_url, "sk-mock")
+    client.chat.completions.create(
+        model="qwen-plus", messages=[{"role": "user", "content": "ping"}]
+    )
+
+
+def run_case(fn, calls, num_works):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_works) as executor:
+        list(executor.map(lambda _: fn(), range(calls)))
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed / calls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", default=500, type=int)
+    parser.add_argument("--num_works", default=8, type=int)
+    args = parser.parse_args()
+
+    server = start_mock_server()
+    registry = LLMClientRegistry(pool_size=args.num_works)
+
+    # 预热，避免首次导入/建连影响结果
+    call_fresh_client(server.base_url)
+    call_registry_client(registry, server.base_url)
+
+    before, before_ms = run_case(
+        lambda: call_fresh_client(server.base_url), args.calls, args.num_works
+    )
+    after, after_ms = run_case(
+        lambda: call_registry_client(registry, server.base_url), args.calls, args.num_works
+    )
+
+    print(f"calls={args.calls} num_works={args.num_works}")
+    print(f"before (fresh client):  total {before:.2f}s  {before_ms:.2f} ms/call")
+    print(f"after  (pooled client): total {after:.2f}s  {after_ms:.2f} ms/call")
+    print(f"speedup: {before / after:.2f}x")
+
+    registry.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+导入耗时基准：以 python -X importtime 在独立进程中导入各模块，统计累计导入耗时并检查预算。
+
+- 每个模块重复导入 --repeat 次取中位数（每次都是新进程，不受缓存的模块对象影响）
+- 超出预算，或导入了只应在具体代码路径中加载的重量级模块（torch、transformers 等）时以非零状态退出，
+  可直接作为 CI 检查
+
+用法:
+    python tools/bench/bench_import_time.py
+    python tools/bench/bench_import_time.py --budget agents=800 --budget prompts=20 --top 15
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..', '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import re
+import argparse
+import statistics
+import subprocess
+
+# 各模块的累计导入耗时预算（毫秒），主要开销来自 openai / pydantic
+DEFAULT_BUDGETS_MS = {
+    "agents": 1500,
+    "utils.global_methods": 1500,
+    "utils.toolkit": 1500,
+    "utils.llm_json": 300,
+    "utils.prescreen": 50,
+    "prompts": 50,
+}
+
+# 只应在用到时才导入的重量级模块
+HEAVY_MODULES = ["torch", "transformers", "modelscope", "google.generativeai", "anthropic", "numpy"]
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(module):
+    """在新进程中导入 module，按 importtime 输出顺序返回 [(模块名, 自身耗时 us, 累计耗时 us, 层级)]"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.abspath(prj_path),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} 失败:\n{result.stderr[-2000:]}")
+
+    profile = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            profile.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return profile
+
+
+def _entry(profile, module):
+    """module 在明细中的位置（取最后一次出现，即 -c 中的导入）"""
+    return max(i for i, (name, *_) in enumerate(profile) if name == module)
+
+
+def direct_imports(profile, module):
+    """module 的直接依赖及其累计耗时：importtime 中子模块紧接在父模块之前输出，层级多一级"""
+    index = _entry(profile, module)
+    depth = profile[index][3]
+    children = []
+    for name, _, cumulative, level in reversed(profile[:index]):
+        if level <= depth:
+            break
+        if level == depth + 1:
+            children.append((cumulative, name))
+    return sorted(children, reverse=True)
+
+
+def measure(module, repeat):
+    """返回 (累计导入耗时中位数 ms, 最后一次的导入明细)"""
+    times = []
+    for _ in range(repeat):
+        profile = import_profile(module)
+        times.append(profile[_entry(profile, module)][2] / 1000)
+    return statistics.median(times), profile
+
+
+def parse_budgets(items):
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for item in items or []:
+        module, _, ms = item.partition("=")
+        budgets[module] = float(ms)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", action="append", help="模块预算 module=ms，可重复；未指定的模块使用默认预算")
+    parser.add_argument("--repeat", default=5, type=int, help="每个模块的导入次数，取中位数")
+    parser.add_argument("--top", default=0, type=int, help="列出每个模块中累计耗时最高的 N 个直接依赖")
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    failures = []
+    print(f"{'module':<24}{'median ms':>12}{'budget ms':>12}  heavy imports")
+    for module, budget in budgets.items():
+        elapsed, profile = measure(module, args.repeat)
+        imported = {name for name, *_ in profile}
+        heavy = [name for name in HEAVY_MODULES if name in imported]
+        status = "" if elapsed <= budget and not heavy else "  <-- FAIL"
+        print(f"{module:<24}{elapsed:>12.1f}{budget:>12.0f}  {', '.join(heavy) or '-'}{status}")
+
+        if elapsed > budget:
+            failures.append(f"{module}: {elapsed:.1f}ms > {budget:.0f}ms")
+        if heavy:
+            failures.append(f"{module}: 导入了 {', '.join(heavy)}")
+
+        if args.top:
+            for cumulative, name in direct_imports(profile, module)[:args.top]:
+                print(f"    {name:<36}{cumulative / 1000:>10.1f} ms")
+
+    if failures:
+        print("\n导入耗时检查未通过:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\n导入耗时检查通过")
+
+
+if __name__ == "__main__":
+    main()
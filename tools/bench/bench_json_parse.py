@@ -0,0 +1,174 @@
+"""
+LLM 输出 JSON 解析的微基准：对比旧写法（去掉 ```json 后直接 json.loads）与 utils.llm_json.parse_json
+的解析成功率和单次耗时。
+
+输出样本来源：
+- --cache: LLM 缓存（SQLite）中记录的真实响应
+- 默认: mock 服务的预制响应，并按固定种子注入常见格式缺陷（解释文字、尾逗号、单引号、换行、未转义引号、截断）
+
+用法:
+    python tools/bench/bench_json_parse.py --cache outputs/llm_cache.sqlite
+    python tools/bench/bench_json_parse.py --samples 2000 --seed 0
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..', '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import re
+import json
+import time
+import random
+import sqlite3
+import argparse
+from collections import defaultdict
+
+from utils.llm_json import parse_json
+from tools.bench.canned_responses import (
+    _knowledge_extraction,
+    _multiple_choice,
+    _question_answer,
+    _evaluate_quality,
+    _conversation,
+    _chain_of_thought,
+    _grade,
+)
+
+
+def legacy_parse(text):
+    """旧写法：各 agent 中重复的去代码块 + json.loads"""
+    return json.loads(re.sub(r"```(?:json)?|```", "", text.strip()))
+
+
+# ---------- 样本 ----------
+def _fence(text, rng):
+    return f"```json\n{text}\n```"
+
+
+def _preamble(text, rng):
+    return f"好的，以下是按要求生成的结果：\n{text}\n希望对您有帮助。"
+
+
+def _trailing_comma(text, rng):
+    return re.sub(r"(\S)(\s*[}\]])", r"\1,\2", text, count=1)
+
+
+def _single_quotes(text, rng):
+    return text.replace('"', "'")
+
+
+def _raw_newline(text, rng):
+    return text.replace("。", "。\n", 1)
+
+
+def _inner_quotes(text, rng):
+    return text.replace("森林", '"森林"', 1)
+
+
+def _truncated(text, rng):
+    return text[: int(len(text) * rng.uniform(0.6, 0.95))]
+
+
+DEFECTS = {
+    "clean": lambda text, rng: text,
+    "fence": _fence,
+    "preamble": _preamble,
+    "trailing_comma": _trailing_comma,
+    "single_quotes": _single_quotes,
+    "raw_newline": _raw_newline,
+    "inner_quotes": _inner_quotes,
+    "truncated": _truncated,
+}
+
+PAYLOADS = [
+    lambda rng: _knowledge_extraction(rng),
+    lambda rng: _multiple_choice(rng),
+    lambda rng: _question_answer(rng),
+    lambda rng: _evaluate_quality(rng, 0.3),
+    lambda rng: _conversation(rng),
+    lambda rng: _chain_of_thought(rng),
+    lambda rng: _grade(rng),
+]
+
+
+def synthetic_samples(n, seed):
+    """预制响应 + 缺陷注入，返回 [(类别, 文本)]"""
+    rng = random.Random(seed)
+    names = list(DEFECTS)
+    samples = []
+    for _ in range(n):
+        payload = rng.choice(PAYLOADS)(rng)
+        text = json.dumps(payload, ensure_ascii=False, indent=2)
+        defect = rng.choice(names)
+        samples.append((defect, DEFECTS[defect](text, rng)))
+    return samples
+
+
+def cached_samples(path):
+    """LLM 缓存中的真实响应（n>1 的请求展开为多条）"""
+    conn = sqlite3.connect(path)
+    samples = []
+    for (response,) in conn.execute("SELECT response FROM llm_cache"):
+        value = json.loads(response)
+        for text in value if isinstance(value, list) else [value]:
+            if isinstance(text, str):
+                samples.append(("recorded", text))
+    conn.close()
+    return samples
+
+
+# ---------- 统计 ----------
+def run(parser, samples, repeat):
+    """返回 {类别: [成功数, 总数]} 与每次解析的平均耗时（微秒）"""
+    stats = defaultdict(lambda: [0, 0])
+    for category, text in samples:
+        try:
+            parser(text)
+            stats[category][0] += 1
+        except ValueError:
+            pass
+        stats[category][1] += 1
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, text in samples:
+            try:
+                parser(text)
+            except ValueError:
+                pass
+    elapsed = time.perf_counter() - start
+    return stats, elapsed / (repeat * len(samples)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache", default=None, help="LLM 缓存 SQLite 路径，使用其中记录的真实响应")
+    parser.add_argument("--samples", default=2000, type=int, help="合成样本数（未指定 --cache 时）")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--repeat", default=5, type=int, help="计时重复次数")
+    args = parser.parse_args()
+
+    samples = cached_samples(args.cache) if args.cache else synthetic_samples(args.samples, args.seed)
+    if not samples:
+        print("没有可用的样本")
+        return
+
+    results = {name: run(fn, samples, args.repeat) for name, fn in [("legacy", legacy_parse), ("llm_json", parse_json)]}
+
+    categories = sorted({category for category, _ in samples})
+    print(f"{'category':<16}" + "".join(f"{name:>12}" for name in results))
+    for category in categories + ["total"]:
+        row = f"{category:<16}"
+        for stats, _ in results.values():
+            if category == "total":
+                ok, total = map(sum, zip(*stats.values()))
+            else:
+                ok, total = stats[category]
+            row += f"{ok / total:>12.1%}"
+        print(row)
+    print(f"{'us/parse':<16}" + "".join(f"{us:>12.1f}" for _, us in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+基于本地 mock 服务的端到端流水线压测：在不同 --num_works 下运行 tools/run_mutil.py，
+统计吞吐量（entries/s）与各步骤的 LLM 调用延迟，无需网络与费用。
+
+用法:
+    python tools/bench/bench_pipeline.py --entries 40 --num-works 1,4,16 --step 3 --latency lognormal:0.5,0.5
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..', '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from tools.bench.mock_openai_server import start_mock_server
+
+RUN_MUTIL = os.path.join(prj_path, "tools", "run_mutil.py")
+
+SAMPLE_TEXT = (
+    "森林生态系统由乔木、灌木、草本植物以及动物和微生物共同组成。"
+    "林地碳汇能力受树种组成、林龄结构、立地条件与经营方式的共同影响。"
+    "近自然林经营通过模拟天然林的演替过程，提高林分稳定性与生物多样性。"
+)
+
+
+def write_dataset(path, entries, data_class):
+    """生成合成语料，每条文本略有不同以避免命中缓存或去重"""
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(entries):
+            entry = {"id": f"bench-{i}", "text": f"第{i}篇。" + SAMPLE_TEXT * 5, "class": data_class}
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def run_case(server, data_file, work_dir, num_works, step, data_class, extra_args=()):
+    """运行一次 run_mutil，返回耗时、输出条数与 token 用量报告"""
+    out_file = os.path.join(work_dir, f"bench_w{num_works}.jsonl")
+    usage_prefix = os.path.join(work_dir, f"usage_w{num_works}")
+    env = dict(os.environ, OPENAI_BASE_URL=server.base_url, DASHSCOPE_BASE_URL=server.base_url)
+    cmd = [
+        sys.executable, RUN_MUTIL,
+        "--data-file", data_file,
+        "--out-dir", out_file,
+        "--data_class", data_class,
+        "--step", str(step),
+        "--num_works", str(num_works),
+        "--llm-cache-mode", "off",
+        "--usage-report", usage_prefix,
+        *extra_args,
+    ]
+    start = time.perf_counter()
+    subprocess.run(cmd, env=env, check=True)
+    elapsed = time.perf_counter() - start
+
+    with open(out_file, "r", encoding="utf-8") as f:
+        completed = sum(1 for line in f if line.strip())
+    with open(usage_prefix + ".json", "r", encoding="utf-8") as f:
+        usage = json.load(f)
+    return elapsed, completed, usage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", default=40, type=int, help="合成语料条数")
+    parser.add_argument("--num-works", default="1,4,16", help="逗号分隔的 --num_works 取值")
+    parser.add_argument("--step", default=3, type=int, choices=[1, 2, 3], help="执行到的阶段（4/5 依赖本地模型）")
+    parser.add_argument("--data-class", default="article", choices=["book", "article", "web"])
+    parser.add_argument("--latency", default="lognormal:0.5,0.5", help="mock 延迟分布，见 mock_openai_server.parse_latency")
+    parser.add_argument("--error-rate", default=0.0, type=float)
+    parser.add_argument("--rate-limit-rate", default=0.0, type=float)
+    parser.add_argument("--malformed-rate", default=0.0, type=float, help="未开启 JSON 模式的请求返回无法解析内容的比例")
+    parser.add_argument("--seed", default=0, type=int, help="mock 服务随机种子")
+    parser.add_argument("--question-workers", default=4, type=int, help="透传给 run_mutil 的条目内并发试题数")
+    parser.add_argument("--question-batch-size", default=0, type=int, help="透传给 run_mutil 的批量出题大小")
+    parser.add_argument("--expert-batch-size", default=0, type=int, help="透传给 run_mutil 的批量评估大小")
+    parser.add_argument("--prescreen", action="store_true", help="透传给 run_mutil：专家评估前本地预筛")
+    parser.add_argument("--prescreen-audit", default=0.0, type=float, help="透传给 run_mutil 的预筛抽样评估比例")
+    parser.add_argument("--cascade-model", default=None, help="透传给 run_mutil 的级联小模型")
+    parser.add_argument("--pipeline", action="store_true", help="透传给 run_mutil：流水线模式，各步骤线程池同时工作")
+    parser.add_argument("--stage-workers", default=None, help="透传给 run_mutil 的各步骤线程数，如 1=4,2=8,3=4")
+    parser.add_argument("--report", default=None, help="结果 JSON 保存路径")
+    args = parser.parse_args()
+
+    server = start_mock_server(
+        latency=args.latency,
+        canned=True,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    print(f"Mock server: {server.base_url} (latency={args.latency})")
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_file = os.path.join(work_dir, "bench_data.jsonl")
+        write_dataset(data_file, args.entries, args.data_class)
+
+        for num_works in [int(x) for x in args.num_works.split(",")]:
+            requests_before = server.request_count
+            elapsed, completed, usage = run_case(
+                server, data_file, work_dir, num_works, args.step, args.data_class,
+                extra_args=[
+                    "--question-workers", str(args.question_workers),
+                    "--question-batch-size", str(args.question_batch_size),
+                    "--expert-batch-size", str(args.expert_batch_size),
+                    "--prescreen-audit", str(args.prescreen_audit),
+                ] + (["--prescreen"] if args.prescreen else [])
+                  + (["--cascade-model", args.cascade_model] if args.cascade_model else [])
+                  + (["--pipeline"] if args.pipeline else [])
+                  + (["--stage-workers", args.stage_workers] if args.stage_workers else []),
+            )
+            result = {
+                "num_works": num_works,
+                "seconds": round(elapsed, 2),
+                "entries": completed,
+                "entries_per_s": round(completed / elapsed, 3),
+                "llm_requests": server.request_count - requests_before,
+                "step_latency_mean": {
+                    step: round(stats["latency_mean"], 3) for step, stats in usage["by_step"].items()
+                },
+            }
+            results.append(result)
+            print(
+                f"num_works={num_works:<4} {elapsed:7.2f}s  {result['entries_per_s']:7.3f} entries/s  "
+                f"requests={result['llm_requests']}  step latency={result['step_latency_mean']}"
+            )
+
+    print(f"mock 请求分类统计: {dict(server.counts)}  请求参数: {dict(server.mode_counts)}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(
+                {"config": vars(args), "results": results, "requests": dict(server.counts)},
+                f, ensure_ascii=False, indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
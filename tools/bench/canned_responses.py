@@ -0,0 +1,144 @@
+"""
+mock 服务使用的“预制”响应：按 prompts/ 中的模板识别 prompt 所属类别，返回各 agent 能正确解析的 JSON。
+"""
+import re
+import json
+import random
+
+from prompts.question_prompts import QUESTION_PROMPTS_CN
+from prompts.expert_prompts import EXPERT_PROMPTS_CN
+from prompts.traininginstitute_prompts import CONVERSATION_PROMPTS_CN
+from prompts.finl_eval_prompts import GRADE_PROMPT_CN_FINAL
+
+_PLACEHOLDER = re.compile(r"(?<!\{)\{[a-z_]+\}(?!\})")
+_DATA_CLASS_SUFFIX = re.compile(r"_(book|article|web)$")
+
+
+def _fingerprint(template):
+    """模板中最长的固定文本片段（去掉占位符并还原 {{ }} 转义），用于识别 prompt"""
+    pieces = _PLACEHOLDER.split(template)
+    longest = max(pieces, key=len).replace("{{", "{").replace("}}", "}").strip()
+    return longest[:200]
+
+
+def _families():
+    templates = {**QUESTION_PROMPTS_CN, **EXPERT_PROMPTS_CN, **CONVERSATION_PROMPTS_CN}
+    templates["grade"] = GRADE_PROMPT_CN_FINAL
+    families = []
+    for key, template in templates.items():
+        # knowledge_extraction_book -> knowledge_extraction
+        families.append((_DATA_CLASS_SUFFIX.sub("", key), _fingerprint(template)))
+    # 较长的指纹优先匹配，避免被公共片段误判
+    return sorted(families, key=lambda f: len(f[1]), reverse=True)
+
+
+FAMILIES = _families()
+
+
+def classify_prompt(prompt):
+    """返回 prompt 所属类别；未识别的（如模拟考生直接作答）返回 "answer" """
+    for family, fingerprint in FAMILIES:
+        if fingerprint and fingerprint in prompt:
+            return family
+    return "answer"
+
+
+def _knowledge_extraction(rng):
+    return [
+        {f"q{i + 1}": {
+            "knowledge": f"森林生态知识点{i + 1}",
+            "question": f"关于森林生态知识点{i + 1}的问题？",
+            "difficulty": difficulty,
+        }}
+        for i, difficulty in enumerate(["simple", "medium", "complex"])
+    ]
+
+
+def _multiple_choice(rng):
+    return {
+        "question": "下列哪一项是森林生态系统的生产者？",
+        "options": ["A. 乔木", "B. 真菌", "C. 昆虫", "D. 鸟类"],
+        "answer": "A",
+    }
+
+
+def _question_answer(rng):
+    return {"question": "简述森林碳汇的主要影响因素。", "answer": "树种组成、林龄结构与经营方式。"}
+
+
+_BATCH_ITEM = re.compile(r'"id": "(\d+)",\s*"question_type": "(\w+)"')
+
+
+def _batch_questions(prompt, rng, invalid_rate=0.1):
+    # 按 prompt 中的待出题列表逐项作答，按 invalid_rate 返回不合格的试题，覆盖单独出题的回退分支
+    items = []
+    for item_id, q_type in _BATCH_ITEM.findall(prompt):
+        item = _multiple_choice(rng) if q_type == "multiple_choice" else _question_answer(rng)
+        if rng.random() < invalid_rate:
+            item["answer"] = ""
+        items.append({"id": item_id, "question_type": q_type, **item})
+    return items
+
+
+def _evaluate_quality_batch(prompt, rng, refine_rate):
+    return [
+        {"id": item_id, **_evaluate_quality(rng, refine_rate)}
+        for item_id in re.findall(r'"id": "(\d+)"', prompt)
+    ]
+
+
+def _evaluate_quality(rng, refine_rate):
+    # 按 refine_rate 返回低分，覆盖改写分支
+    quality = 5 if rng.random() < refine_rate else 8
+    return {
+        "Quality Score": quality,
+        "Relevance Score": 8,
+        "Consistency Score": 8,
+        "Improvement Suggestions": "可进一步明确考查的知识点。" if quality < 6 else "",
+    }
+
+
+def _conversation(rng):
+    return {"input": "森林生态系统里，谁是生产者呀？", "output": "主要是乔木等绿色植物，它们通过光合作用固定能量。"}
+
+
+def _chain_of_thought(rng):
+    return {"CoT": "用户询问……。首先分析生态系统组成，接着判断能量来源，最后得出结论。"}
+
+
+def _grade(rng):
+    return [
+        {"id": str(i), "mastery_score": str(rng.randint(2, 5)),
+         "accuracy_score": str(rng.randint(2, 5)), "fluency_score": str(rng.randint(3, 5))}
+        for i in range(3)
+    ]
+
+
+def canned_reply(prompt, refine_rate=0.3, rng=random):
+    """
+    根据 prompt 类别生成响应内容，返回 (类别, 文本)。
+    rng 为随机数生成器，传入固定种子的 random.Random 即可复现。
+    """
+    family = classify_prompt(prompt)
+
+    if family == "knowledge_extraction":
+        payload = _knowledge_extraction(rng)
+    elif family == "batch_questions":
+        payload = _batch_questions(prompt, rng)
+    elif family == "multiple_choice":
+        payload = _multiple_choice(rng)
+    elif family in ("short_answer", "open_discussion", "refine_response"):
+        payload = _question_answer(rng)
+    elif family == "evaluate_quality":
+        payload = _evaluate_quality(rng, refine_rate)
+    elif family == "evaluate_quality_batch":
+        payload = _evaluate_quality_batch(prompt, rng, refine_rate)
+    elif family == "convert_to_conversation":
+        payload = _conversation(rng)
+    elif family == "generate_chain_of_thought":
+        payload = _chain_of_thought(rng)
+    elif family == "grade":
+        payload = _grade(rng)
+    else:
+        return family, "A"
+    return family, json.dumps(payload, ensure_ascii=False)
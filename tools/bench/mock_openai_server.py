@@ -0,0 +1,263 @@
+"""
+本地 OpenAI 兼容 mock 服务，用于在无网络、无费用的情况下压测 LLM 调用链路。
+- --canned 时按 prompts/ 中的模板识别 prompt 类别，返回各 agent 可解析的 JSON
+- 延迟支持固定值或分布（uniform / lognormal / exp），并可按比例注入 500 与 429 错误
+
+用法:
+    python tools/bench/mock_openai_server.py --port 8000 --canned --latency lognormal:0.8,0.5 --rate-limit-rate 0.02
+    DASHSCOPE_BASE_URL=http://127.0.0.1:8000/v1 python tools/run_mutil.py ...
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..', '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tools.bench.canned_responses import canned_reply
+
+
+# 模型不遵循输出格式时的典型回复（无法在本地修复）
+MALFORMED_REPLY = "抱歉，我需要更多信息才能按要求的格式生成结果。"
+
+
+def parse_latency(spec):
+    """
+    将延迟配置解析为采样函数（单位：秒）：
+        0.2                 固定 0.2s
+        uniform:0.1,0.5     [0.1, 0.5] 均匀分布
+        lognormal:0.8,0.5   中位数 0.8s、sigma=0.5 的对数正态分布（长尾）
+        exp:0.3             均值 0.3s 的指数分布
+    """
+    if isinstance(spec, (int, float)):
+        return lambda: float(spec)
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        value = float(kind)
+        return lambda: value
+    args = [float(x) for x in params.split(",")]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(args[0]), args[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / args[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """处理 /v1/chat/completions 请求，返回固定内容"""
+
+    # keep-alive 需要 HTTP/1.1
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        server = self.server
+        latency = server.sample_latency()
+        if latency:
+            time.sleep(latency)
+
+        # 错误注入：429 带 Retry-After，500 模拟服务端故障
+        roll = server.rng.random()
+        if roll < server.rate_limit_rate:
+            server.count_request("429")
+            self._send_json(429, {"error": {"message": "mock rate limit", "type": "rate_limit"}},
+                            headers={"Retry-After": "1"})
+            return
+        if roll < server.rate_limit_rate + server.error_rate:
+            server.count_request("500")
+            self._send_json(500, {"error": {"message": "mock server error", "type": "server_error"}})
+            return
+
+        prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+        reply = server.reply
+        family = "fixed"
+        if server.canned:
+            # n > 1 时每个 choice 独立生成，模拟多次采样
+            replies = [
+                canned_reply(prompt, refine_rate=server.refine_rate, rng=server.rng)
+                for _ in range(request.get("n") or 1)
+            ]
+            family = replies[0][0]
+            # JSON 模式（response_format）下服务端保证输出合法 JSON，否则按 malformed_rate 返回无法解析的内容
+            json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+            reply = [
+                MALFORMED_REPLY if not json_mode and server.rng.random() < server.malformed_rate else content
+                for _, content in replies
+            ]
+            if json_mode:
+                server.count_request_mode("json_mode")
+        server.count_request(family)
+        self._send_json(200, build_completion(request, reply, server.prefix_cached(prompt)))
+
+
+def build_completion(request, content, cached_tokens=None):
+    """
+    构造一个符合 OpenAI 格式的 chat.completion 响应，content 为列表时依次作为各 choice 的内容。
+    cached_tokens 不为 None 时在 usage.prompt_tokens_details 中返回前缀缓存命中数。
+    """
+    n = request.get("n") or 1
+    contents = content if isinstance(content, list) else [content] * n
+    prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+    completion_tokens = sum(len(c) for c in contents)
+    usage = {
+        "prompt_tokens": len(prompt),
+        "completion_tokens": completion_tokens,
+        "total_tokens": len(prompt) + completion_tokens,
+    }
+    if cached_tokens is not None:
+        usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+    return {
+        "id": f"chatcmpl-mock-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "mock"),
+        "choices": [
+            {
+                "index": i,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }
+            for i, text in enumerate(contents)
+        ],
+        "usage": usage,
+    }
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, reply="{}", canned=False,
+                 error_rate=0.0, rate_limit_rate=0.0, refine_rate=0.3, seed=None, prefix_block=64,
+                 malformed_rate=0.0):
+        """
+        :param latency: 每次请求的延迟，固定秒数或分布配置（见 parse_latency）
+        :param reply: 非 canned 模式下固定返回的内容
+        :param canned: 按 prompt 类别返回预制 JSON（见 canned_responses.py）
+        :param error_rate: 返回 500 的比例
+        :param rate_limit_rate: 返回 429 的比例
+        :param refine_rate: 质量评估返回低分（触发改写）的比例
+        :param seed: 随机种子（错误注入与预制响应），便于复现
+        :param prefix_block: 模拟前缀缓存的块大小（字符），0 表示不模拟
+        :param malformed_rate: 未开启 JSON 模式的请求返回无法解析内容的比例
+        """
+        super().__init__((host, port), MockOpenAIHandler)
+        self.sample_latency = parse_latency(latency)
+        self.reply = reply
+        self.canned = canned
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.refine_rate = refine_rate
+        self.malformed_rate = malformed_rate
+        self.rng = random.Random(seed)
+        self.prefix_block = prefix_block
+        self._prefix_hashes = set()
+        self.request_count = 0
+        self.counts = Counter()
+        # 按请求参数统计（如 JSON 模式），不计入 request_count
+        self.mode_counts = Counter()
+        self._count_lock = threading.Lock()
+
+    def count_request(self, kind="fixed"):
+        with self._count_lock:
+            self.request_count += 1
+            self.counts[kind] += 1
+
+    def count_request_mode(self, mode):
+        with self._count_lock:
+            self.mode_counts[mode] += 1
+
+    def prefix_cached(self, prompt, max_hashes=1_000_000):
+        """
+        模拟 vLLM 式的块级前缀缓存：返回与历史请求共享的最长整块前缀长度，并记录本次请求的前缀块。
+        未开启模拟时返回 None（与不支持该字段的服务端一致）。
+        """
+        if not self.prefix_block:
+            return None
+        digest = hashlib.sha1()
+        hashes = []
+        for end in range(self.prefix_block, len(prompt) + 1, self.prefix_block):
+            digest.update(prompt[end - self.prefix_block:end].encode("utf-8"))
+            hashes.append(digest.hexdigest())
+        with self._count_lock:
+            cached = 0
+            for i, h in enumerate(hashes):
+                if h not in self._prefix_hashes:
+                    break
+                cached = (i + 1) * self.prefix_block
+            if len(self._prefix_hashes) > max_hashes:
+                self._prefix_hashes.clear()
+            self._prefix_hashes.update(hashes)
+        return cached
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_mock_server(host="127.0.0.1", port=0, **kwargs):
+    """在后台线程中启动 mock 服务，返回 server 实例（通过 server.base_url 访问）"""
+    server = MockOpenAIServer(host, port, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8000, type=int)
+    parser.add_argument("--latency", default="0", help="延迟（秒）或分布，如 uniform:0.1,0.5 / lognormal:0.8,0.5 / exp:0.3")
+    parser.add_argument("--canned", action="store_true", help="按 prompt 类别返回预制 JSON")
+    parser.add_argument("--error-rate", default=0.0, type=float, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", default=0.0, type=float, help="返回 429 的比例")
+    parser.add_argument("--refine-rate", default=0.3, type=float, help="质量评估触发改写的比例")
+    parser.add_argument("--malformed-rate", default=0.0, type=float, help="未开启 JSON 模式的请求返回无法解析内容的比例")
+    parser.add_argument("--seed", default=None, type=int, help="随机种子")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        args.host, args.port,
+        latency=args.latency,
+        canned=args.canned,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        refine_rate=args.refine_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"请求统计: {dict(server.counts)}")
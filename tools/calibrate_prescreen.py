@@ -0,0 +1,156 @@
+"""
+校准专家评估前的本地预筛（utils.prescreen.QuestionPrescreen）：用 Step 2 输出中 LLM 给出的评估结果作为标注，
+统计预筛判定与 LLM 判定的一致性。
+
+- 标注：LLM 评估为无需改写且无需删除（requires_refinement / delete_data 均为 False）视为合格
+- 使用 Step 2 开启 --prescreen 时记录的预筛特征，只统计有 LLM 评分的试题；
+  预筛跳过的试题没有 LLM 评分，需用 --prescreen-audit 抽样（1.0 为全部评估）收集
+- 数据按 --seed 随机划分为调参集与留出集：在调参集上扫描阈值，
+  选出通过精度不低于 --target-precision 且跳过比例最高的阈值，在留出集上报告一致性
+
+用法:
+    python tools/calibrate_prescreen.py --data outputs/qwen_book_output.jsonl --holdout 0.3 --report prescreen_report.json
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import json
+import random
+import argparse
+
+from utils.prescreen import QuestionPrescreen
+
+
+def load_samples(path):
+    """读取 Step 2 输出，返回 [(预筛特征, LLM 是否判定合格)]"""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            for feedback in entry.get("expert_agent", {}).get("refined_questions", []):
+                if not feedback or feedback.get("quality_score") is None or "prescreen" not in feedback:
+                    continue
+                llm_ok = not feedback.get("requires_refinement") and not feedback.get("delete_data")
+                samples.append((feedback["prescreen"], llm_ok))
+    return samples
+
+
+def confusion(samples, prescreen, min_grounding=None, min_knowledge=None):
+    """预筛通过/不通过 × LLM 合格/不合格 的混淆矩阵及一致性指标"""
+    counts = {"pass_ok": 0, "pass_bad": 0, "fail_ok": 0, "fail_bad": 0}
+    for features, llm_ok in samples:
+        passed = prescreen.decide(features, min_grounding, min_knowledge)
+        counts[("pass_" if passed else "fail_") + ("ok" if llm_ok else "bad")] += 1
+
+    total = len(samples)
+    passed = counts["pass_ok"] + counts["pass_bad"]
+    return {
+        **counts,
+        "total": total,
+        # 与 LLM 判定一致的比例
+        "agreement": (counts["pass_ok"] + counts["fail_bad"]) / total if total else None,
+        # 预筛通过的试题中 LLM 也判定合格的比例（跳过评估的试题中漏掉的坏题 = 1 - precision）
+        "pass_precision": counts["pass_ok"] / passed if passed else None,
+        "skip_rate": passed / total if total else None,
+    }
+
+
+def sweep(samples, prescreen, groundings, knowledges):
+    """扫描阈值组合，返回各组合的一致性指标"""
+    return [
+        {"min_grounding": g, "min_knowledge": k, **confusion(samples, prescreen, g, k)}
+        for g in groundings
+        for k in knowledges
+    ]
+
+
+def choose(results, target_precision):
+    """通过精度达标的阈值中选跳过比例最高的；都不达标时返回 None"""
+    eligible = [r for r in results if r["pass_precision"] is not None and r["pass_precision"] >= target_precision]
+    if not eligible:
+        return None
+    return max(eligible, key=lambda r: (r["skip_rate"], r["pass_precision"]))
+
+
+def _frange(start, stop, step):
+    values = []
+    value = start
+    while value <= stop + 1e-9:
+        values.append(round(value, 4))
+        value += step
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", required=True, help="Step 2 输出 JSONL（含 LLM 评估结果）")
+    parser.add_argument("--sample", default=None, type=int, help="最多使用的试题数，默认全部")
+    parser.add_argument("--holdout", default=0.3, type=float, help="留出集比例")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--min-grounding", default=0.6, type=float, help="当前预筛阈值")
+    parser.add_argument("--min-knowledge", default=0.3, type=float, help="当前预筛阈值")
+    parser.add_argument("--target-precision", default=0.95, type=float, help="选择阈值时要求的最低通过精度")
+    parser.add_argument("--report", default=None, help="校准报告 JSON 输出路径")
+    args = parser.parse_args()
+
+    prescreen = QuestionPrescreen(min_grounding=args.min_grounding, min_knowledge=args.min_knowledge)
+    samples = load_samples(args.data)
+    if not samples:
+        print("没有同时带预筛特征与 LLM 评分的试题，请以 --prescreen --prescreen-audit 1.0 运行 Step 2")
+        return
+
+    rng = random.Random(args.seed)
+    rng.shuffle(samples)
+    if args.sample:
+        samples = samples[:args.sample]
+    n_holdout = int(len(samples) * args.holdout)
+    holdout, tune = samples[:n_holdout], samples[n_holdout:]
+
+    results = sweep(tune, prescreen, _frange(0.3, 0.9, 0.05), _frange(0.0, 0.6, 0.1))
+    chosen = choose(results, args.target_precision)
+    report = {
+        "samples": len(samples),
+        "llm_ok_rate": sum(llm_ok for _, llm_ok in samples) / len(samples),
+        "current": {
+            "min_grounding": args.min_grounding,
+            "min_knowledge": args.min_knowledge,
+            "holdout": confusion(holdout, prescreen),
+        },
+        "chosen": None,
+        "sweep": results,
+    }
+    if chosen is not None:
+        report["chosen"] = {
+            "min_grounding": chosen["min_grounding"],
+            "min_knowledge": chosen["min_knowledge"],
+            "tune": {k: v for k, v in chosen.items() if k not in ("min_grounding", "min_knowledge")},
+            "holdout": confusion(holdout, prescreen, chosen["min_grounding"], chosen["min_knowledge"]),
+        }
+
+    def line(name, stats):
+        fmt = lambda v: "-" if v is None else f"{v:.1%}"
+        print(f"{name:<28} n={stats['total']:<6} agreement={fmt(stats['agreement'])}  "
+              f"pass_precision={fmt(stats['pass_precision'])}  skip_rate={fmt(stats['skip_rate'])}  "
+              f"[pass_ok={stats['pass_ok']} pass_bad={stats['pass_bad']} "
+              f"fail_ok={stats['fail_ok']} fail_bad={stats['fail_bad']}]")
+
+    print(f"样本 {len(samples)}（调参 {len(tune)} / 留出 {len(holdout)}），LLM 判定合格 {report['llm_ok_rate']:.1%}")
+    line(f"current g={args.min_grounding} k={args.min_knowledge}", report["current"]["holdout"])
+    if chosen is not None:
+        line(f"chosen  g={chosen['min_grounding']} k={chosen['min_knowledge']}", report["chosen"]["holdout"])
+    else:
+        print(f"没有通过精度 ≥ {args.target_precision:.0%} 的阈值组合")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告保存在 {args.report}")
+
+
+if __name__ == "__main__":
+    main()
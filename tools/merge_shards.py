@@ -0,0 +1,145 @@
+"""
+合并 tools/run_mutil.py --shard i/N 各分片的输出：生成去重的单一输出 JSONL 及对应的断点存储，
+每个 ID 保留最新状态。
+
+- 每个分片读取其断点存储（<输出文件名>.checkpoints.sqlite，含流水线模式下的中间结果），
+  以及输出 JSONL 中尚未同步到断点存储的部分；没有断点存储时只读 JSONL（同一 ID 以最后一行为准）
+- 同一 ID 出现在多个分片时（如改变分片数后重跑），保留已完成步骤最多的版本，相同时以后给出的分片为准，
+  并报告重复条目数
+- 合并结果的断点存储与输出 JSONL 同名，可直接用 run_mutil 不分片地继续后续步骤
+- 只读取分片文件，不修改
+
+用法:
+    python tools/merge_shards.py outputs/qwen_book_output.shard-*-of-4.jsonl --out outputs/qwen_book_output.jsonl
+"""
+import os
+import sys
+prj_path = os.path.join(os.path.dirname(__file__), '..')
+if prj_path not in sys.path:
+    sys.path.append(prj_path)
+
+import json
+import glob
+import argparse
+
+from utils.checkpoint_store import CheckpointStore
+
+
+def checkpoint_path(jsonl_path):
+    return os.path.splitext(jsonl_path)[0] + ".checkpoints.sqlite"
+
+
+def completed_steps(entry):
+    return sum(1 for status in entry.get("steps", {}).values() if status == "completed")
+
+
+def iter_jsonl(path, offset=0):
+    """从字节偏移 offset 处逐行读取 JSONL（末尾不完整的行忽略）"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if line.endswith(b"\n") and line.strip():
+                entry = json.loads(line)
+                if "id" in entry:
+                    yield entry
+
+
+def iter_shard(path):
+    """产出一个分片的条目：先是断点存储中的最新状态，再是 JSONL 中尚未同步的追加部分"""
+    if os.path.exists(checkpoint_path(path)):
+        store = CheckpointStore(checkpoint_path(path))
+        try:
+            yield from store.iter_entries()
+            offset = store.synced_offset(path)
+        finally:
+            store.close()
+    else:
+        offset = 0
+    if os.path.exists(path):
+        yield from iter_jsonl(path, offset)
+
+
+def merge(paths, merged, batch_size=1000):
+    """
+    把各分片合并到断点存储 merged，返回统计信息。
+    同一 ID 保留已完成步骤最多的版本，相同时后出现的为准。
+    """
+    stats = {"shards": {}, "duplicates": 0}
+    for path in paths:
+        seen = set()
+        batch = {}
+
+        def flush():
+            merged.put_many(list(batch.values()))
+            batch.clear()
+
+        for entry in iter_shard(path):
+            entry_id = entry["id"]
+            if entry_id not in seen:
+                seen.add(entry_id)
+                if entry_id in merged:
+                    stats["duplicates"] += 1
+            current = batch.get(entry_id) or merged.get(entry_id)
+            if current is None or completed_steps(entry) >= completed_steps(current):
+                batch[entry_id] = entry
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        stats["shards"][path] = len(seen)
+    return stats
+
+
+def write_output(merged, out_file):
+    """按 ID 顺序写出合并后的 JSONL，并记录同步偏移，之后 run_mutil 不会重复导入"""
+    steps = {}
+    with open(out_file, "w", encoding="utf-8") as f:
+        for entry in merged.iter_entries():
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            for step, status in entry.get("steps", {}).items():
+                if status == "completed":
+                    steps[step] = steps.get(step, 0) + 1
+    merged.put_many([], source=out_file, offset=os.path.getsize(out_file))
+    return dict(sorted(steps.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="+", help="各分片的输出 JSONL（支持通配符）")
+    parser.add_argument("--out", required=True, help="合并后的输出 JSONL")
+    parser.add_argument("--force", action="store_true", help="覆盖已存在的合并输出")
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.inputs:
+        matched = sorted(glob.glob(pattern)) or [pattern]
+        paths.extend(p for p in matched if p not in paths)
+    missing = [p for p in paths if not os.path.exists(p) and not os.path.exists(checkpoint_path(p))]
+    if missing:
+        sys.exit(f"找不到分片输出: {', '.join(missing)}")
+    if os.path.abspath(args.out) in {os.path.abspath(p) for p in paths}:
+        sys.exit("合并输出不能与分片输出相同")
+
+    targets = [args.out, checkpoint_path(args.out)]
+    existing = [p for p in targets if os.path.exists(p)]
+    if existing and not args.force:
+        sys.exit(f"合并输出已存在: {', '.join(existing)}，使用 --force 覆盖")
+    for path in existing + [checkpoint_path(args.out) + suffix for suffix in ("-wal", "-shm")]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    merged = CheckpointStore(checkpoint_path(args.out))
+    try:
+        stats = merge(paths, merged)
+        steps = write_output(merged, args.out)
+        total = len(merged)
+    finally:
+        merged.close()
+
+    for path, count in stats["shards"].items():
+        print(f"{path}: {count} 条")
+    print(f"合并后 {total} 条，跨分片重复 {stats['duplicates']} 条，各步骤完成数 {steps}")
+    print(f"输出保存在 {args.out}，断点存储 {checkpoint_path(args.out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import pandas as pd
 import argparse
 import re
 from agents import VirtualTeacherAgent
+from utils.llm_json import parse_json, try_parse_json
 
 # 初始化 VirtualTeacherAgent
 virtual_teacher_r1 = VirtualTeacherAgent(model="deepseek-r1")
@@ -16,12 +17,9 @@ def extract_conversational_form(item, log_file="conversation_errors.log"):
     """
     response = item.get("virtual_teacher", {}).get("conversational_form", "{}")
 
-    response = re.sub(r"```json", "", response)  # 移除 ```json
-    response = re.sub(r"```", "", response)  # 移除 ```
-    response = response.strip()
-
     try:
-        conversational_data = json.loads(response)
+        # 本地修复常见格式缺陷，仍失败时才重新请求模型
+        conversational_data = parse_json(response, expect=dict)
         return conversational_data.get("input", ""), conversational_data.get(
             "output", ""
         )
@@ -61,6 +59,11 @@ def extract_question_and_answer(response):
     """
     解析 response，提取 question 和 answer，确保解析准确，支持多行 answer。
     """
+    # 合法（或可本地修复）的 JSON 直接取字段，否则按文本格式匹配
+    parsed = try_parse_json(response, expect=dict)
+    if parsed is not None and parsed.get("question") and parsed.get("answer"):
+        return str(parsed["question"]).strip(), str(parsed["answer"]).strip()
+
     response = response.strip()
 
     # 去除 json 格式标注
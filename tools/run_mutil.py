@@ -8,10 +8,11 @@ import json
 import hashlib
 import logging
 import argparse
+import contextvars
 from queue import Queue, Empty
-from threading import Thread, Event
+from threading import Thread, Event, BoundedSemaphore
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from agents import (
     QuestionSetter,
     ExpertAgent,
@@ -20,6 +21,25 @@ from agents import (
     GradingTeacher,
 )
 from utils.toolkit import clean_book_text, filter_web_text
+from utils.global_methods import (
+    configure_llm_pool,
+    configure_endpoints,
+    endpoint_report,
+    set_llm_cache,
+    set_batch_recorder,
+    set_hedge_policy,
+    set_usage_tracker,
+    LLM_PROVIDERS,
+)
+from utils.batch_llm import BatchRecorder, BatchPending
+from utils.rate_limiter import configure_rate_limit, rate_limit_report
+from utils.llm_cache import LLMCache, CACHE_MODES
+from utils.hedging import HedgePolicy
+from utils.usage_tracker import UsageTracker, usage_tags
+from utils.prescreen import QuestionPrescreen
+from utils.cascade import CascadePolicy
+from utils.checkpoint_store import CheckpointStore
+from utils.pipeline import StagePipeline
 from datetime import datetime
 import time
 
@@ -41,13 +61,14 @@ logging.basicConfig(
 
 # ===== 多线程操作 ===== #
 # 保存数据的线程函数
-def data_saver(queue: Queue, output_file: str, stop_event: Event, batch_size: int = 5):
+def data_saver(queue: Queue, output_file: str, checkpoints: CheckpointStore, stop_event: Event, batch_size: int = 5):
     """
-    从队列中读取数据并批量保存到 JSONL 文件。
-    文件写入采用“读-改-写”策略，支持根据 ID 更新 steps。
+    从队列中读取数据并批量保存到 JSONL 文件，同时写入断点存储。
+    JSONL 只追加；同一 ID 的最新状态（含 steps）以断点存储为准。
     
     :param queue: 存储数据的线程安全队列
     :param output_file: 输出 JSONL 文件路径
+    :param checkpoints: 按 ID 索引的断点存储
     :param stop_event: 停止信号，用于安全关闭线程
     :param batch_size: 每次写入的最小数据量
     """
@@ -62,30 +83,70 @@ def data_saver(queue: Queue, output_file: str, stop_event: Event, batch_size: in
             continue
 
         if len(buffer) >= batch_size:
-            _write_to_file(output_file, buffer)
+            _write_to_file(output_file, buffer, checkpoints)
             buffer.clear()
 
     # 程序结束时写入剩余数据
     if buffer:
-        _write_to_file(output_file, buffer)
+        _write_to_file(output_file, buffer, checkpoints)
 
 
-def _write_to_file(output_file: str, new_data: list):
+def _write_to_file(output_file: str, new_data: list, checkpoints: CheckpointStore = None):
     """
     将数据写入 .jsonl 文件，直接追加写入，不做去重。
     后续可通过独立脚本去重。
+    写入后在同一事务内更新断点存储及其已同步的文件偏移。
     """
     with open(output_file, "a", encoding="utf-8") as f:
         for entry in new_data:
             f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        offset = f.tell()
+    if checkpoints is not None:
+        checkpoints.put_many(new_data, source=output_file, offset=offset)
 
 # ==== tools ==== #
-def load_data(data_file):
-    """从JSONL文件中加载数据"""
-    data = []
+def iter_data(data_file):
+    """逐行读取 JSONL 文件，按需产出数据条目，内存占用与文件大小无关"""
     with open(data_file, "r", encoding="utf-8") as f:
         for line in f:
-            data.append(json.loads(line.strip()))
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_shard(spec):
+    """解析 --shard i/N（i 从 0 开始），返回 (i, N)"""
+    index, _, count = spec.partition("/")
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"无效的分片 {spec}，应为 i/N 且 0 <= i < N")
+    return index, count
+
+
+def shard_of(entry_id, count):
+    """按 ID 哈希确定条目所属分片，与机器、进程和输入顺序无关"""
+    return int(hashlib.sha256(entry_id.encode("utf-8")).hexdigest()[:16], 16) % count
+
+
+def iter_entries(data_file, shard=None):
+    """
+    逐条产出待处理的数据条目：补全 ID，并只保留属于当前分片的条目。
+    :param shard: (i, N)，None 表示处理全部条目
+    """
+    for entry in iter_data(data_file):
+        if "id" not in entry:
+            entry["id"] = generate_entry_id(entry)
+        if shard is None or shard_of(entry["id"], shard[1]) == shard[0]:
+            yield entry
+
+
+def shard_suffix(shard):
+    """分片输出文件名后缀，未分片时为空"""
+    return f".shard-{shard[0]}-of-{shard[1]}" if shard else ""
+
+
+def load_data(data_file):
+    """从JSONL文件中加载数据"""
+    data = list(iter_data(data_file))
     logging.info(f"加载了 {len(data)} 条数据")
     return data
 
@@ -119,52 +180,43 @@ def infer_data_class(data_file):
         return "unknown"
 
 # 加载存在数据
-def load_existing_data(out_folder, model_name, data_class):
+def load_existing_data(out_folder, model_name, data_class, shard=None):
     """
-    兼容从 .json/.jsonl 文件读取已有数据，统一输出为 jsonl。
+    确定输出 jsonl 路径，并打开与之对应的断点存储（<输出文件名>.checkpoints.sqlite）。
+    输出文件中上次同步之后追加的数据（如旧版本写入的结果）会增量导入断点存储。
+    分片运行时每个分片写入各自的输出与断点存储（<输出文件名>.shard-i-of-N.jsonl），互不争用，
+    完成后用 tools/merge_shards.py 合并。
+    :return: (输出文件路径, 断点存储)
     """
     if out_folder.endswith("jsonl"): 
         out_file = out_folder  # 直接是完整的 jsonl 文件路径
     else:
         out_file = os.path.join(out_folder, f"{model_name}_{data_class}_output.jsonl")  # 自动拼接命名
+    if shard:
+        out_file = os.path.splitext(out_file)[0] + shard_suffix(shard) + ".jsonl"
 
-    id_set = set()
-    existing_data = []
+    checkpoints = CheckpointStore(os.path.splitext(out_file)[0] + ".checkpoints.sqlite")
+    imported = checkpoints.sync_jsonl(out_file)
+    if imported:
+        logging.info(f"从已有处理数据文件导入 {imported} 条: {out_file}")
 
-    if os.path.exists(out_file):
-        logging.info(f"加载已有处理数据文件: {out_file}")
-        with open(out_file, "r", encoding="utf-8") as f:
-            existing_data = [json.loads(line.strip()) for line in f if line.strip()]
-
-    # 提取已存在的 id
-    for entry in existing_data:
-        if "id" in entry:
-            id_set.add(entry["id"])
-
-    logging.info(f"已有数据数量: {len(existing_data)}，将继续保存到: {out_file}")
-    return out_file, id_set, existing_data
+    logging.info(f"已有数据数量: {len(checkpoints)}，将继续保存到: {out_file}")
+    return out_file, checkpoints
 
 
 
 # 检查当前数据是否存在
-def find_entry_by_id(out_file, entry_id):
+def find_entry_by_id(checkpoints, entry_id):
     """
-    在已保存的 JSON 文件中查找指定 ID 的数据条目，包含步骤状态信息。
-    :param out_file: 保存数据的 JSON 文件路径
+    在断点存储中查找指定 ID 的数据条目（最新状态），包含步骤状态信息。
+    :param checkpoints: CheckpointStore 实例
     :param entry_id: 要查找的唯一 ID
     :return: 找到的完整数据条目（包括 steps 信息），未找到则返回 {"id": entry_id, "steps": {}}
     """
-    if not os.path.exists(out_file):
-        logging.warning(f"文件不存在: {out_file}")
+    entry = checkpoints.get(entry_id)
+    if entry is None:
         return {"id": entry_id, "steps": {}}
-
-    with open(out_file, "r", encoding="utf-8") as f:
-        for line in f:
-            entry = json.loads(line.strip())
-            if entry.get("id") == entry_id:
-                return entry
-
-    return {"id": entry_id, "steps": {}}
+    return entry
 
 
 def preprocess_text(entry):
@@ -200,6 +252,96 @@ def preprocess_text(entry):
     return text
 
 
+# ===== 试题级并发 ===== #
+# 条目内各试题的处理提交到共享线程池，条目耗时约为最慢一题而非各题之和；由 main 根据 --question-workers 配置
+_QUESTION_EXECUTOR = None
+# 逐题结果保存到断点存储，条目中途失败后重跑只处理缺失或失败的试题；由 main 配置
+_QUESTION_CHECKPOINTS = None
+
+
+def set_question_executor(executor):
+    global _QUESTION_EXECUTOR
+    _QUESTION_EXECUTOR = executor
+
+
+def set_question_checkpoints(checkpoints):
+    global _QUESTION_CHECKPOINTS
+    _QUESTION_CHECKPOINTS = checkpoints
+
+
+def question_fingerprint(item):
+    """试题输入的指纹：输入改变（如重新出题、试题被改写）后不复用旧结果"""
+    item_str = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(item_str.encode("utf-8")).hexdigest()[:16]
+
+
+def map_questions(fn, items, entry_id=None, step=None):
+    """
+    对条目内的每道试题执行 fn，结果按原顺序返回；未配置线程池时顺序执行。
+    子任务复制当前上下文，LLM 调用仍记入所在条目与步骤的用量标签。
+    给出 entry_id 与 step 时逐题保存结果：已保存且输入未变的试题直接复用；
+    某题失败时其余试题照常完成并保存，之后抛出第一个异常（批处理挂起优先）。
+    """
+    checkpoints = _QUESTION_CHECKPOINTS if entry_id is not None and step is not None else None
+    saved = checkpoints.get_questions(entry_id, step) if checkpoints is not None else {}
+    reused = []
+
+    def run(index, item):
+        fingerprint = question_fingerprint(item) if checkpoints is not None else None
+        if index in saved and saved[index][0] == fingerprint:
+            reused.append(index)
+            return saved[index][1]
+        result = fn(item)
+        if checkpoints is not None:
+            checkpoints.put_question(entry_id, step, index, fingerprint, result)
+        return result
+
+    results, errors = [None] * len(items), []
+    if _QUESTION_EXECUTOR is None or len(items) <= 1:
+        for index, item in enumerate(items):
+            try:
+                results[index] = run(index, item)
+            except Exception as e:
+                errors.append(e)
+    else:
+        futures = [
+            _QUESTION_EXECUTOR.submit(contextvars.copy_context().run, run, index, item)
+            for index, item in enumerate(items)
+        ]
+        for index, future in enumerate(futures):
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                errors.append(e)
+
+    if errors:
+        if checkpoints is not None:
+            logging.warning(
+                f"Step {step}: {len(errors)}/{len(items)} 道试题失败，其余结果已保存 entry_id={entry_id}"
+            )
+        raise next((e for e in errors if isinstance(e, BatchPending)), errors[0])
+    if reused:
+        logging.info(f"Step {step}: 复用已保存的试题结果 {len(reused)}/{len(items)} entry_id={entry_id}")
+    return results
+
+
+def current_questions(entry):
+    """返回 (原始试题, 当前试题) 列表：需要优化的试题使用专家优化后的版本"""
+    questions = entry["question_setter"]["questions"]
+    refined_questions = entry.get("expert_agent", {}).get("refined_questions", [])
+
+    results = []
+    for index, question_data in enumerate(questions):
+        # 判断是否有优化后的试题
+        if index < len(refined_questions) and refined_questions[index].get(
+            "requires_refinement", False
+        ):
+            results.append((question_data, refined_questions[index]["refined_response"]))
+        else:
+            results.append((question_data, question_data["response"]))
+    return results
+
+
 # 生成唯一 ID
 def generate_entry_id(entry):
     entry_str = json.dumps(entry, sort_keys=True, ensure_ascii=False)
@@ -207,6 +349,7 @@ def generate_entry_id(entry):
 
 
 # 1️⃣ **Question Setter**
+@usage_tags(step=1)
 def process_question_setter(entry, question_setter):
     """
     直接处理 QuestionSetter 逻辑。
@@ -226,6 +369,7 @@ def process_question_setter(entry, question_setter):
 
 
 # 2️⃣ **Expert Agent**
+@usage_tags(step=2)
 def process_expert_agent(entry, expert_agent):
     """
     直接处理 ExpertAgent 逻辑。
@@ -233,12 +377,27 @@ def process_expert_agent(entry, expert_agent):
     :param expert_agent: ExpertAgent 实例
     """
     entry_id = entry["id"]  # 使用 entry 中的 ID
-    refined_questions = [
-        expert_agent.evaluate_and_refine_question(
-            entry["text"], q, entry.get("class", "")
+    questions = entry["question_setter"]["questions"]
+    if expert_agent.batch_size > 0:
+        # 批量评估：一次请求给出各题评分，仅需要改写的试题逐题并发改写
+        feedbacks = expert_agent.evaluate_questions_batch(
+            entry["text"], questions, entry.get("class", "")
+        )
+        refined_questions = map_questions(
+            lambda item: expert_agent.apply_feedback(
+                entry["text"], item[0], entry.get("class", ""), item[1]
+            ),
+            list(zip(questions, feedbacks)),
+            entry["id"], 2,
+        )
+    else:
+        refined_questions = map_questions(
+            lambda q: expert_agent.evaluate_and_refine_question(
+                entry["text"], q, entry.get("class", "")
+            ),
+            questions,
+            entry["id"], 2,
         )
-        for q in entry["question_setter"]["questions"]
-    ]
 
     # 添加处理结果到 entry
     entry["expert_agent"] = {"refined_questions": refined_questions}
@@ -248,6 +407,7 @@ def process_expert_agent(entry, expert_agent):
 
 
 # 3️⃣ **Virtual Teacher**
+@usage_tags(step=3)
 def process_virtual_teacher(entry, virtual_teacher):
     """
     直接处理 VirtualTeacher 逻辑，确保数据顺序一致，无需额外保存索引。
@@ -255,22 +415,9 @@ def process_virtual_teacher(entry, virtual_teacher):
     :param virtual_teacher: VirtualTeacher 实例
     """
     entry_id = entry["id"]  # 使用 entry 中的 ID
-    processed_results = []
-
-    # 获取 question_setter 和 refined_questions
-    questions = entry["question_setter"]["questions"]
-    refined_questions = entry.get("expert_agent", {}).get("refined_questions", [])
-
-    # 遍历试题，根据索引处理优化试题或原始试题
-    for index, question_data in enumerate(questions):
-        # 判断是否有优化后的试题
-        if index < len(refined_questions) and refined_questions[index].get(
-            "requires_refinement", False
-        ):
-            current_question = refined_questions[index]["refined_response"]
-        else:
-            current_question = question_data["response"]
 
+    def process_question(item):
+        question_data, current_question = item
         # 判断题型，执行相应处理
         if question_data.get("question_type") == "multiple_choice":
             conversational_form = virtual_teacher.convert_to_conversational_form(
@@ -286,10 +433,10 @@ def process_virtual_teacher(entry, virtual_teacher):
                 entry["text"], current_question, entry.get("class", "")
             )
 
-        # 保存结果
-        processed_results.append(
-            {"conversational_form": conversational_form, "CoT": cot}
-        )
+        return {"conversational_form": conversational_form, "CoT": cot}
+
+    # 各试题并发处理，结果与试题顺序一致
+    processed_results = map_questions(process_question, current_questions(entry), entry["id"], 3)
 
     # 添加处理结果到 entry
     entry["virtual_teacher"] = {"processed_results": processed_results}
@@ -299,6 +446,7 @@ def process_virtual_teacher(entry, virtual_teacher):
 
 
 # 4️⃣ **Simulated Learner**
+@usage_tags(step=4)
 def process_learner(entry, learner):
     """
     直接处理 SimulatedLearner 逻辑，判断是否使用优化试题或原始试题。
@@ -306,25 +454,13 @@ def process_learner(entry, learner):
     :param learner: SimulatedLearner 实例
     """
     entry_id = entry["id"]  # 使用 entry 中的 ID
-    learner_answers = []
 
-    # 获取 question_setter 和 refined_questions
-    questions = entry["question_setter"]["questions"]
-    refined_questions = entry.get("expert_agent", {}).get("refined_questions", [])
-
-    # 遍历试题，根据索引处理优化试题或原始试题
-    for index, question_data in enumerate(questions):
-        # 判断是否有优化后的试题
-        if index < len(refined_questions) and refined_questions[index].get(
-            "requires_refinement", False
-        ):
-            current_question = refined_questions[index]["refined_response"]
-        else:
-            current_question = question_data["response"]
-
-        # 生成答案
-        learner_answer = learner.answer_question(current_question)
-        learner_answers.append({"answer": learner_answer})
+    # 生成答案
+    learner_answers = map_questions(
+        lambda item: {"answer": learner.answer_question(item[1])},
+        current_questions(entry),
+        entry["id"], 4,
+    )
 
     # 添加处理结果到 entry
     entry["simulated_learner"] = {"learner_answers": learner_answers}
@@ -334,6 +470,7 @@ def process_learner(entry, learner):
 
 
 # 5️⃣ **Grading Teacher**
+@usage_tags(step=5)
 def process_grader(entry, grader):
     """
     直接处理 GradingTeacher 逻辑，基于专家的原始试题或优化试题，与学生作答进行评估推理。
@@ -341,35 +478,25 @@ def process_grader(entry, grader):
     :param grader: GradingTeacher 实例
     """
     entry_id = entry["id"]  # 使用 entry 中的 ID
-    evaluations = []
 
-    # 获取原始试题和优化试题
-    questions = entry["question_setter"]["questions"]
-    refined_questions = entry.get("expert_agent", {}).get("refined_questions", [])
+    # 获取原始试题和优化试题，以及对应的学生作答
     learner_answers = entry["simulated_learner"]["learner_answers"]
 
-    # 遍历每个试题
-    for index, question_data in enumerate(questions):
-        # 判断是否有优化后的试题
-        if index < len(refined_questions) and refined_questions[index].get(
-            "requires_refinement", False
-        ):
-            current_question = refined_questions[index]["refined_response"]
-        else:
-            current_question = question_data["response"]
-
-        # 获取对应的学生作答
-        learner_answer = learner_answers[index]["answer"]
+    def grade_question(item):
+        (question_data, current_question), learner_answer = item
 
         # 确保有学生作答后再评估
         if learner_answer:
             evaluation = grader.evaluate_answer(
                 entry["text"], current_question, learner_answer, entry.get("class", "")
             )
-            evaluations.append({"evaluation": evaluation})
-        else:
-            # 如果没有对应学生作答，记录空评估
-            evaluations.append({"evaluation": None})
+            return {"evaluation": evaluation}
+        # 如果没有对应学生作答，记录空评估
+        return {"evaluation": None}
+
+    # 学生作答也作为试题输入的一部分，作答改变后重新评分
+    items = [(pair, learner_answers[index]["answer"]) for index, pair in enumerate(current_questions(entry))]
+    evaluations = map_questions(grade_question, items, entry["id"], 5)
 
     # 添加处理结果到 entry
     entry["grading_teacher"] = {"evaluations": evaluations}
@@ -380,13 +507,54 @@ def process_grader(entry, grader):
 # ===== tools end ===== #
 
 
+# 步骤依赖关系：执行某一步骤前需要完成的步骤
+STEP_DEPENDENCIES = {1: [], 2: [1], 3: [1, 2], 4: [1, 2], 5: [1, 2, 3, 4]}
+
+STEP_PROCESSORS = {
+    1: process_question_setter,
+    2: process_expert_agent,
+    3: process_virtual_teacher,
+    4: process_learner,
+    5: process_grader,
+}
+
+
+def prepare_entry(entry, checkpoints, data_class):
+    """
+    补全 ID 与数据类型，预处理文本，并合并断点存储中已有的处理结果。
+    :return: 合并后的条目（含 steps 与预处理后的 text），低价值或无效文本返回 None
+    """
+    # 如果 entry 中没有 ID，则生成并存储
+    if "id" not in entry:
+        entry["id"] = generate_entry_id(entry)
+
+    # 如果 entry 中没有 data_class，则存储
+    if "class" not in entry:
+        entry["class"] = data_class
+
+    # 文本预处理  📌📌📌  text 在此处被改变
+    entry["text"] = preprocess_text(entry)
+    if entry["text"] is None:
+        # logging.info(f"数据由于低价值或无效而被跳过")
+        return None
+
+    # 合并 entry 数据到 existing_entry 为了把原始语料加进去
+    existing_entry = find_entry_by_id(checkpoints, entry["id"])
+    existing_entry.update(entry)
+    existing_entry.setdefault("steps", {})
+    return existing_entry
+
+
 # ===== main start ===== #
 # 包装 process_entry，添加到队列
 def process_entry_with_logging(entry, queue: Queue, *args):
     try:
         text_info = entry["text"][:20]
         logging.info(f"Processing entry: {text_info}")
-        result = process_entry(entry, *args)  # 调用主处理函数
+        if "id" not in entry:
+            entry["id"] = generate_entry_id(entry)
+        with usage_tags(entry_id=entry["id"]):
+            result = process_entry(entry, *args)  # 调用主处理函数
 
         # 检查返回值，避免 None 被加入队列
         if result is not None:
@@ -395,18 +563,21 @@ def process_entry_with_logging(entry, queue: Queue, *args):
             logging.warning(
                 f"跳过空返回值数据: {text_info}"
             )
+    except BatchPending:
+        # 批处理模式：请求已写入批处理文件，待结果回填后重跑
+        logging.info(f"Batch pending: {text_info}")
     except Exception as e:
         logging.error(f"Error processing entry: {text_info}. Details: {e}")
 
 
 # 加载数据函数省略
-def process_entry(entry, out_file, question_setter,
+def process_entry(entry, checkpoints, question_setter,
     expert_agent, virtual_teacher, learner,
     grader, step, data_class):
     """
     处理单个数据条目，包括所有阶段，支持阶段性执行，并动态补全前置步骤。
     :param entry: 单条数据条目
-    :param out_file: 保存的 JSON 文件路径
+    :param checkpoints: 断点存储（CheckpointStore），用于查找已处理的步骤
     :param question_setter: QuestionSetter 实例
     :param expert_agent: ExpertAgent 实例
     :param virtual_teacher: VirtualTeacher 实例
@@ -416,38 +587,20 @@ def process_entry(entry, out_file, question_setter,
     :data_class: 数据类型 web article book
     """
 
-    # 如果 entry 中没有 ID，则生成并存储
-    if "id" not in entry:
-        entry["id"] = generate_entry_id(entry)
-    entry_id = entry["id"]  # 直接从 entry 中获取 ID
-
-    # 如果 entry 中没有 data_class，则存储
-    if "class" not in entry:
-        entry["class"] = data_class
-
-    # 文本预处理  📌📌📌  text 在此处被改变
     text_info = entry["text"][:20]
-    entry["text"] = preprocess_text(entry)
-    if entry["text"] is None:
-        # logging.info(f"数据由于低价值或无效而被跳过")
-        return None
 
-    # 1️⃣ **检查是否已处理过该条数据**
-    existing_entry = find_entry_by_id(out_file, entry_id)
-    if existing_entry and existing_entry.get("steps", {}).get(str(step)) == "completed":
-        logging.info(f"Step {step}: 已完成，跳过 entry_id={entry_id}")
+    # 1️⃣ **预处理并与已处理过的数据合并**
+    existing_entry = prepare_entry(entry, checkpoints, data_class)
+    if existing_entry is None:
+        return None
+    if existing_entry.get("steps", {}).get(str(step)) == "completed":
+        logging.info(f"Step {step}: 已完成，跳过 entry_id={existing_entry['id']}")
         return None
-
-    # 合并 entry 数据到 existing_entry 为了把原始语料加进去
-    existing_entry.update(entry)
 
     steps = existing_entry.get("steps", {})
 
-    # 2️⃣ **定义步骤依赖关系**
-    step_dependencies = {1: [], 2: [1], 3: [1, 2], 4: [1, 2], 5: [1, 2, 3, 4]}
-
-    # 3️⃣ **逐步检查和执行步骤**
-    for required_step in step_dependencies[step]:
+    # 2️⃣ **逐步检查和执行依赖步骤**
+    for required_step in STEP_DEPENDENCIES[step]:
         if str(required_step) not in steps or steps[str(required_step)] != "completed":
             if required_step == 1:
                 existing_entry = process_question_setter(
@@ -473,7 +626,7 @@ def process_entry(entry, out_file, question_setter,
                 steps["4"] = "completed"
                 logging.info(f"Step 4: SimulatedLearner 自动补全完成")
 
-    # 4️⃣ **执行目标步骤**
+    # 3️⃣ **执行目标步骤**
     if str(step) not in steps or steps[str(step)] != "completed":
         if step == 1:
             existing_entry = process_question_setter(existing_entry, question_setter)
@@ -491,7 +644,7 @@ def process_entry(entry, out_file, question_setter,
     else:
         logging.info(f"Step {step}: 已存在，跳过")
 
-    # 5️⃣ **保存数据状态**
+    # 4️⃣ **保存数据状态**
     existing_entry["steps"] = steps
     if "text" in existing_entry:
         del existing_entry["text"]  # 删除 text 数据以节省存储空间
@@ -499,9 +652,122 @@ def process_entry(entry, out_file, question_setter,
     return existing_entry  # 返回处理完成的数据条目
 
 
+# ===== 流水线模式 ===== #
+def pipeline_route(entry, step):
+    """流水线中条目尚未完成的步骤（按依赖顺序，以目标步骤结尾）"""
+    steps = entry.get("steps", {})
+    return [s for s in STEP_DEPENDENCIES[step] + [step] if steps.get(str(s)) != "completed"]
+
+
+def make_stage(step, agent, checkpoints):
+    """
+    流水线中单个步骤的处理函数：执行该步骤并把中间结果写入断点存储（不含原文），
+    中断后重跑时条目从下一个未完成的步骤继续。
+    """
+    processor = STEP_PROCESSORS[step]
+
+    def run(entry):
+        with usage_tags(entry_id=entry["id"]):
+            entry = processor(entry, agent)
+        entry["steps"][str(step)] = "completed"
+        checkpoints.put({k: v for k, v in entry.items() if k != "text"})
+        return entry
+
+    return run
+
+
+def parse_stage_workers(spec, default):
+    """解析 --stage-workers，如 "1=4,2=8,5=2"；未指定的步骤使用 default"""
+    workers = {step: default for step in STEP_PROCESSORS}
+    for item in (spec or "").split(","):
+        if item.strip():
+            step, _, count = item.partition("=")
+            workers[int(step)] = int(count)
+    return workers
+
+
 # ===== main end ===== #
 
 
+def run_steps(args, data_file, shard, checkpoints, data_queue, max_pending,
+              question_setter, expert_agent, virtual_teacher, learner, grader):
+    """单步模式：每个条目在一个工作线程中补全依赖步骤并执行 --step"""
+    # 多线程处理数据：逐条读取输入，在途条目数不超过 max_pending（背压），内存占用与语料大小无关
+    window = BoundedSemaphore(max_pending)
+    progress = tqdm(desc="Processing Entries", unit="entry")
+    skipped = 0
+
+    def on_done(future):
+        window.release()
+        progress.update(1)
+        try:
+            future.result()
+        except Exception as e:
+            logging.error(f"Error in future result: {e}")
+
+    with ThreadPoolExecutor(max_workers=args.num_works) as executor:  # 根据硬件调整线程数
+        for entry in iter_entries(data_file, shard):
+            # 断点续跑：只按 ID 查询步骤状态，已完成的条目不再提交
+            if checkpoints.step_status(entry["id"], args.step) == "completed":
+                skipped += 1
+                continue
+
+            window.acquire()
+            future = executor.submit(process_entry_with_logging, entry, data_queue, checkpoints,
+                                     question_setter, expert_agent, virtual_teacher,
+                                     learner, grader, args.step, args.data_class, )
+            future.add_done_callback(on_done)
+    progress.close()
+    logging.info(f"Step {args.step}: 跳过已完成的条目 {skipped} 条")
+
+
+def run_pipeline(args, data_file, shard, checkpoints, data_queue, max_pending, stage_workers, agents):
+    """
+    流水线模式：Step 1 到 --step 每个步骤一个线程池，条目完成一步后立即进入下一步，各步骤同时工作。
+    条目从断点存储中第一个未完成的步骤开始；在途条目数不超过 max_pending（背压）。
+    """
+    steps = STEP_DEPENDENCIES[args.step] + [args.step]
+    progress = tqdm(desc="Pipeline Entries", unit="entry")
+
+    def on_done(entry):
+        del entry["text"]  # 删除 text 数据以节省存储空间
+        data_queue.put(entry)
+        progress.update(1)
+
+    def on_error(entry, step, e):
+        progress.update(1)
+        if isinstance(e, BatchPending):
+            # 批处理模式：请求已写入批处理文件，已完成的步骤保存在断点存储中，待结果回填后重跑
+            logging.info(f"Batch pending: step {step}, entry_id={entry['id']}")
+        else:
+            logging.error(f"Error processing entry at step {step}: entry_id={entry['id']}. Details: {e}")
+
+    pipeline = StagePipeline(
+        [(step, make_stage(step, agents[step], checkpoints), stage_workers[step]) for step in steps],
+        max_pending=max_pending,
+        on_done=on_done,
+        on_error=on_error,
+    )
+    skipped = 0
+    for entry in iter_entries(data_file, shard):
+        # 断点续跑：已完成目标步骤的条目不再提交
+        if checkpoints.step_status(entry["id"], args.step) == "completed":
+            skipped += 1
+            continue
+        try:
+            existing_entry = prepare_entry(entry, checkpoints, args.data_class)
+        except Exception as e:
+            logging.error(f"Error preparing entry: entry_id={entry['id']}. Details: {e}")
+            continue
+        if existing_entry is None:
+            continue
+        pipeline.submit(existing_entry, pipeline_route(existing_entry, args.step))
+    pipeline.join()
+    progress.close()
+    logging.info(f"Step {args.step}: 跳过已完成的条目 {skipped} 条")
+    logging.info(f"流水线统计: {pipeline.stats()}")
+
+
 # 🔧 **参数解析**
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -512,6 +778,36 @@ def parse_args():
     parser.add_argument("--model", default="qwen", choices=["chatgpt_o1-preview", "gpt-4", "chatgpt", "qwen"], type=str)
     parser.add_argument("--num_works", default=1, type=int)
     parser.add_argument("--step", type=int, choices=[1, 2, 3, 4, 5], required=True, help="执行阶段",)
+    parser.add_argument("--shard", default=None, help="分片 i/N（i 从 0 开始）：按 ID 哈希只处理第 i 片，输出与断点存储按分片命名，完成后用 tools/merge_shards.py 合并")
+    parser.add_argument("--llm-cache", default=None, help="LLM 响应缓存 SQLite 路径，默认保存在输出目录下（分片运行时每个分片一个）")
+    parser.add_argument("--llm-cache-mode", default="read_write", choices=CACHE_MODES, help="缓存模式；模拟考生多次采样、评分投票与级联小模型采样总是请求新结果，不读写缓存（批处理模式除外）")
+    parser.add_argument("--llm-cache-ttl", default=None, type=float, help="缓存过期时间（秒）")
+    parser.add_argument("--llm-cache-max-entries", default=None, type=int, help="缓存最大条数，超出后按 LRU 淘汰")
+    parser.add_argument("--batch-dir", default=None, help="批处理模式：待执行请求写入该目录，见 tools/batch_llm.py")
+    parser.add_argument("--rpm", default=None, type=int, help="每个服务商每分钟请求数上限")
+    parser.add_argument("--tpm", default=None, type=int, help="每个服务商每分钟 token 数上限")
+    parser.add_argument("--usage-report", default=None, help="token 用量报告路径前缀，默认保存在输出目录下（生成 .json 汇总与 .csv 明细）")
+    parser.add_argument("--max-pending", default=0, type=int, help="同时提交给线程池的条目数上限（读取输入的背压窗口），0 表示 2 × num_works")
+    parser.add_argument("--pipeline", action="store_true", help="流水线模式：一次运行完成 Step 1 到 --step 的全部步骤，条目完成一步后立即进入下一步")
+    parser.add_argument("--stage-workers", default=None, help="流水线模式下各步骤的线程数，如 1=4,2=8,3=4,4=1,5=4；未指定的步骤使用 --num_works")
+    parser.add_argument("--question-workers", default=4, type=int, help="每个条目内并发处理的试题数，1 表示逐题顺序处理")
+    parser.add_argument("--question-batch-size", default=0, type=int, help="批量出题：每次请求包含的试题数，0 表示逐个知识点出题")
+    parser.add_argument("--expert-batch-size", default=0, type=int, help="批量评估：每次请求包含的试题数，0 表示逐题评估")
+    parser.add_argument("--prescreen", action="store_true", help="专家评估前本地预筛，明显合格的试题跳过 LLM 评估")
+    parser.add_argument("--prescreen-min-grounding", default=0.6, type=float, help="预筛：试题词面出现在原文中的最低比例")
+    parser.add_argument("--prescreen-min-knowledge", default=0.3, type=float, help="预筛：知识点词面出现在试题中的最低比例")
+    parser.add_argument("--prescreen-audit", default=0.0, type=float, help="预筛通过的试题中仍交给 LLM 评估的比例（校准用，1.0 为只记录不跳过）")
+    parser.add_argument("--cascade-model", default=None, help="级联评估的小模型（如 qwen-turbo），开启后 Step 2/5 先由小模型评分，结果不可靠时再调用大模型")
+    parser.add_argument("--cascade-samples", default=3, type=int, help="小模型每次评分的回答数（一次 n 采样请求），用于估计置信度")
+    parser.add_argument("--cascade-min-confidence", default=0.66, type=float, help="小模型回答中与多数判定一致的比例低于该值时升级（默认 3 个回答中 2 个一致即可）")
+    parser.add_argument("--cascade-margin", default=1.0, type=float, help="专家评估（0-10 分）：分数距判定阈值 6 小于该值时升级")
+    parser.add_argument("--cascade-grade-margin", default=0.3, type=float, help="评分（1-5 分）：平均 mastery 分距等级分界小于该值时升级")
+    parser.add_argument("--learner-samples", default=1, type=int, help="API 模拟考生每题的回答数（一次 n 采样请求）")
+    parser.add_argument("--grader-votes", default=1, type=int, help="评分的自洽性投票次数（一次 n 采样请求，取中位数）")
+    parser.add_argument("--endpoints", default=None, help="端点池配置 JSON：同一服务商的多个端点按负载分流并自动切换")
+    parser.add_argument("--hedge", action="store_true", help="开启对冲请求：调用超过 p95 延迟时再发一个相同请求")
+    parser.add_argument("--hedge-percentile", default=0.95, type=float, help="触发对冲的延迟分位数")
+    parser.add_argument("--hedge-budget", default=0.05, type=float, help="对冲请求占总请求数的比例上限")
     return parser.parse_args()
 
 
@@ -532,17 +828,99 @@ def main():
     #     logging.error("无法推断 data_class，请检查数据文件。")
         # data_class = args.data_class
 
+    # 分片：按 ID 哈希划分语料，各机器 / 进程只处理自己的分片
+    shard = parse_shard(args.shard) if args.shard else None
+    if shard:
+        logging.info(f"分片: {shard[0]}/{shard[1]}")
+
     # 加载已存在的数据
-    out_file, existing_ids, existing_data = load_existing_data(
-        out_folder, args.model, args.data_class
+    out_file, checkpoints = load_existing_data(
+        out_folder, args.model, args.data_class, shard
     )
 
-    # 加载数据和初始化
-    data = load_data(data_file)
+    # 同时在途的 LLM 请求数：条目线程数 × 条目内并发试题数；流水线模式下各步骤的线程同时工作
+    stage_workers = parse_stage_workers(args.stage_workers, args.num_works)
+    if args.pipeline:
+        entry_workers = sum(stage_workers[s] for s in STEP_DEPENDENCIES[args.step] + [args.step])
+    else:
+        entry_workers = args.num_works
+    max_inflight = entry_workers * max(1, args.question_workers)
+    # LLM 连接池大小与在途请求数保持一致
+    configure_llm_pool(pool_size=max_inflight)
+    # 多端点：新注册的端点也会在下面获得各自的限流器
+    if args.endpoints:
+        pools = configure_endpoints(args.endpoints)
+        logging.info(f"端点池: { {p: [e.name for e in pool.endpoints] for p, pool in pools.items()} }")
+    # 每个服务商一个自适应限流器：并发上限从在途请求数起步，遇到 429 自动降速
+    for provider in LLM_PROVIDERS:
+        configure_rate_limit(provider, rpm=args.rpm, tpm=args.tpm, max_concurrency=max_inflight)
+
+    # LLM 响应缓存：重跑或崩溃恢复时已付费的请求直接命中
+    llm_cache = None
+    if args.llm_cache_mode != "off":
+        cache_path = args.llm_cache or os.path.join(
+            os.path.dirname(out_file), f"llm_cache{shard_suffix(shard)}.sqlite"
+        )
+        llm_cache = LLMCache(
+            cache_path,
+            mode=args.llm_cache_mode,
+            ttl=args.llm_cache_ttl,
+            max_entries=args.llm_cache_max_entries,
+        )
+        set_llm_cache(llm_cache)
+        logging.info(f"LLM 缓存: {cache_path} ({args.llm_cache_mode})")
+
+    # 批处理模式：缓存未命中的请求写入批处理文件，不实时调用
+    batch_recorder = None
+    if args.batch_dir:
+        if llm_cache is None:
+            raise ValueError("批处理模式依赖 LLM 缓存回填结果，请勿同时使用 --llm-cache-mode off")
+        batch_recorder = BatchRecorder(args.batch_dir)
+        set_batch_recorder(batch_recorder)
+        logging.info(f"批处理模式: 请求写入 {args.batch_dir}")
+
+    # 对冲请求：削减长尾延迟，额外花费受 --hedge-budget 限制
+    hedge_policy = None
+    if args.hedge:
+        # 主请求与对冲请求各占一个线程，线程池按在途请求数的两倍配置，避免排队
+        hedge_policy = HedgePolicy(
+            percentile=args.hedge_percentile, budget=args.hedge_budget, max_workers=2 * max_inflight
+        )
+        set_hedge_policy(hedge_policy)
+        logging.info(f"对冲请求: p{int(args.hedge_percentile * 100)} 触发，预算 {args.hedge_budget:.0%}")
+
+    # token 用量与延迟统计：按 agent / step / entry 汇总
+    # 汇总只保留累计值，逐次调用的明细直接写入 CSV
+    usage_prefix = args.usage_report or os.path.join(
+        os.path.dirname(out_file), f"usage_step{args.step}{shard_suffix(shard)}"
+    )
+    usage_tracker = UsageTracker(csv_path=usage_prefix + ".csv")
+    set_usage_tracker(usage_tracker)
 
     # 初始化代理
-    question_setter = QuestionSetter(model="qwen")
-    expert_agent = ExpertAgent(model="qwen")
+    question_setter = QuestionSetter(model="qwen", batch_size=args.question_batch_size)
+    prescreen = None
+    if args.prescreen:
+        prescreen = QuestionPrescreen(
+            min_grounding=args.prescreen_min_grounding,
+            min_knowledge=args.prescreen_min_knowledge,
+            audit_rate=args.prescreen_audit,
+        )
+    # 级联评估：专家评估与评分各自统计升级率
+    expert_cascade = grader_cascade = None
+    if args.cascade_model:
+        expert_cascade, grader_cascade = [
+            CascadePolicy(
+                args.cascade_model,
+                samples=args.cascade_samples,
+                margin=margin,
+                min_confidence=args.cascade_min_confidence,
+            )
+            for margin in (args.cascade_margin, args.cascade_grade_margin)
+        ]
+    expert_agent = ExpertAgent(
+        model="qwen", batch_size=args.expert_batch_size, prescreen=prescreen, cascade=expert_cascade
+    )
     virtual_teacher = VirtualTeacherAgent(model="qwen")
     if args.step >= 4:
         learner = SimulatedLearner(
@@ -553,39 +931,65 @@ def main():
                 "/home/wyp/project/swift/models/llama_3_1_8b_ins",
             ],
             model_platforms=["modelscope", "modelscope", "modelscope"],
+            num_samples=args.learner_samples,
         )
     else:
         learner = SimulatedLearner(
             model_api=list(args.model),
+            num_samples=args.learner_samples,
         )
-    grader = GradingTeacher(model="gpt-4")
+    grader = GradingTeacher(model="gpt-4", num_votes=args.grader_votes, cascade=grader_cascade)
 
-    # 初始化队列和保存线程
-    data_queue = Queue()
+    # 初始化队列和保存线程；队列有界，保存线程跟不上时工作线程在 put 处等待
+    max_pending = args.max_pending or 2 * entry_workers
+    data_queue = Queue(maxsize=max(max_pending, entry_workers))
     stop_event = Event()
-    saver_thread = Thread(target=data_saver, args=(data_queue, out_file, stop_event, args.num_works))
+    saver_thread = Thread(target=data_saver, args=(data_queue, out_file, checkpoints, stop_event, args.num_works))
     saver_thread.start()
 
-    # 多线程处理数据
-    with ThreadPoolExecutor(max_workers=args.num_works) as executor:  # 根据硬件调整线程数
-        futures = {executor.submit(process_entry_with_logging, entry, data_queue, out_file,
-                                   question_setter, expert_agent, virtual_teacher,
-                                   learner, grader, args.step, args.data_class, ): entry 
-                    for entry in data
-                    }
-
-        # 使用 tqdm 监控进度
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing Entries", unit="entry"):
-            try:
-                future.result()
-            except Exception as e:
-                logging.error(f"Error in future result: {e}")
+    # 试题级子任务的共享线程池，与条目线程池分开，避免条目线程互相等待造成死锁
+    question_executor = None
+    if args.question_workers > 1:
+        question_executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="question")
+        set_question_executor(question_executor)
+    set_question_checkpoints(checkpoints)
+
+    if args.pipeline:
+        run_pipeline(args, data_file, shard, checkpoints, data_queue, max_pending, stage_workers, {
+            1: question_setter, 2: expert_agent, 3: virtual_teacher, 4: learner, 5: grader,
+        })
+    else:
+        run_steps(args, data_file, shard, checkpoints, data_queue, max_pending,
+                  question_setter, expert_agent, virtual_teacher, learner, grader)
+
+    if question_executor is not None:
+        question_executor.shutdown()
 
     # 等待队列完成所有任务
     data_queue.join()
     stop_event.set()
     saver_thread.join()
 
+    if batch_recorder is not None:
+        logging.info(f"新增批处理请求 {batch_recorder.pending} 条，保存在 {args.batch_dir}")
+    logging.info(f"限流器状态: {rate_limit_report()}")
+    if args.endpoints:
+        logging.info(f"端点池状态: {endpoint_report()}")
+    usage_tracker.write_json(usage_prefix + ".json")
+    usage_tracker.close()
+    logging.info(f"token 用量: {usage_tracker.report()['total']}，报告保存在 {usage_prefix}.json/.csv")
+    if prescreen is not None:
+        logging.info(f"预筛统计: {prescreen.stats()}")
+    if args.cascade_model:
+        logging.info(f"级联统计: 专家评估 {expert_cascade.stats()}，评分 {grader_cascade.stats()}")
+    if hedge_policy is not None:
+        logging.info(f"对冲统计: {hedge_policy.stats()}")
+    if llm_cache is not None:
+        logging.info(f"LLM 缓存统计: {llm_cache.stats()}")
+        llm_cache.close()
+
+    logging.info(f"断点存储统计: {checkpoints.stats()}")
+    checkpoints.close()
     logging.info(f"所有数据已保存到 {out_file}")
 
 
@@ -0,0 +1,69 @@
+import os
+import json
+import threading
+
+
+class BatchPending(Exception):
+    """批处理模式下 LLM 请求已写入批处理文件，结果需等批处理完成后回填"""
+
+
+class BatchRecorder:
+    """
+    将待执行的 LLM 请求写成服务商批处理格式的 JSONL（OpenAI / DashScope Batch API 通用）：
+        {"custom_id": ..., "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+    每个服务商一个文件，custom_id 为 LLM 缓存 key，同一请求只写一次。
+    """
+
+    def __init__(self, out_dir, endpoint="/v1/chat/completions"):
+        self.out_dir = out_dir
+        self.endpoint = endpoint
+        self.pending = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+        os.makedirs(out_dir, exist_ok=True)
+
+        # 追加写入时跳过文件中已有的请求，支持多次运行累积同一批次
+        for name in os.listdir(out_dir):
+            if name.endswith("_batch.jsonl"):
+                with open(os.path.join(out_dir, name), "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            self._seen.add(json.loads(line)["custom_id"])
+
+    def batch_file(self, provider):
+        return os.path.join(self.out_dir, f"{provider}_batch.jsonl")
+
+    def add(self, provider, custom_id, body):
+        """记录一条请求，返回是否为新请求"""
+        with self._lock:
+            if custom_id in self._seen:
+                return False
+            self._seen.add(custom_id)
+            line = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": self.endpoint,
+                "body": body,
+            }
+            with open(self.batch_file(provider), "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self.pending += 1
+            return True
+
+
+def iter_batch_results(results_file):
+    """
+    读取批处理结果文件，逐条返回 (custom_id, completion_body, error)。
+    兼容 OpenAI/DashScope 的结果格式：
+        {"custom_id": ..., "response": {"status_code": 200, "body": {...}}, "error": null}
+    """
+    with open(results_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            error = item.get("error")
+            if error is None and response.get("status_code", 200) != 200:
+                error = response.get("body")
+            yield item["custom_id"], response.get("body"), error
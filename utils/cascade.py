@@ -0,0 +1,88 @@
+import statistics
+import threading
+from collections import Counter
+
+
+class CascadePolicy:
+    """
+    小模型优先的级联评估：先用便宜的小模型评分，只有结果不可靠时才升级到大模型。
+    - small_model: 小模型名称（run_agent 可识别的模型名，如 qwen-turbo、gpt-3.5-turbo，
+      本地模型可通过端点池映射）
+    - samples: 小模型一次 n 采样请求的回答数，置信度 = 与多数判定一致的回答比例（解析失败的回答计入分母）
+    - margin: 任一分数（各回答的中位数）与判定阈值的距离小于 margin 时升级
+    - min_confidence: 置信度低于该值时升级
+    """
+
+    def __init__(self, small_model, samples=3, margin=1.0, min_confidence=0.66, temperature=0.7):
+        self.small_model = small_model
+        self.samples = samples
+        self.margin = margin
+        self.min_confidence = min_confidence
+        self.temperature = temperature
+
+        self.calls = 0
+        self.escalated = 0
+        self.reasons = Counter()
+        self._lock = threading.Lock()
+
+    def assess(self, samples, thresholds):
+        """
+        根据小模型的多个回答判断是否升级。
+
+        :param samples: 各回答解析出的分数 {name: value}，解析失败为 None
+        :param thresholds: 判定阈值 [(name, cut)]，分数 >= cut 与 < cut 为不同判定；同一分数可有多个阈值
+        :return: {"escalate", "reason", "confidence", "scores": 各分数中位数, "index": 与多数判定一致的第一个回答}
+        """
+        valid = [(i, sample) for i, sample in enumerate(samples) if sample is not None]
+        verdict = {"escalate": True, "reason": None, "confidence": 0.0, "scores": {}, "index": None}
+
+        if not valid:
+            verdict["reason"] = "parse_failed"
+        else:
+            decisions = {
+                i: tuple(sample.get(name) is not None and sample[name] >= cut for name, cut in thresholds)
+                for i, sample in valid
+            }
+            majority, count = Counter(decisions.values()).most_common(1)[0]
+            verdict["confidence"] = count / len(samples)
+            verdict["index"] = next(i for i, decision in decisions.items() if decision == majority)
+
+            for name in dict(thresholds):
+                values = [sample[name] for _, sample in valid if sample.get(name) is not None]
+                verdict["scores"][name] = statistics.median(values) if values else None
+
+            if any(score is None for score in verdict["scores"].values()):
+                verdict["reason"] = "missing_score"
+            elif verdict["confidence"] < self.min_confidence:
+                verdict["reason"] = "low_confidence"
+            elif any(abs(verdict["scores"][name] - cut) < self.margin for name, cut in thresholds):
+                verdict["reason"] = "near_threshold"
+            else:
+                verdict["escalate"] = False
+
+        with self._lock:
+            self.calls += 1
+            if verdict["escalate"]:
+                self.escalated += 1
+                self.reasons[verdict["reason"]] += 1
+        return verdict
+
+    def annotate(self, result, verdict):
+        """在评估结果中记录级联判定，便于事后核对升级原因"""
+        result["cascade"] = {
+            "small_model": self.small_model,
+            "escalated": verdict["escalate"],
+            "reason": verdict["reason"],
+            "confidence": round(verdict["confidence"], 3),
+        }
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "small_model": self.small_model,
+                "calls": self.calls,
+                "escalated": self.escalated,
+                "escalation_rate": self.escalated / self.calls if self.calls else 0.0,
+                "reasons": dict(self.reasons),
+            }
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class CheckpointStore:
+    """
+    按 entry id 索引的断点存储（SQLite），替代逐行扫描输出 JSONL 查找条目。
+    - 每个条目保存最新的完整数据（含各步骤结果）与步骤状态，按 id 直接查询
+    - put / put_many / update_step 各在一个事务内完成，读者只会看到完整的旧版本或新版本
+    - 输出 JSONL 仍是下游脚本读取的结果文件：sync_jsonl 从记录的字节偏移处增量导入，
+      同一 id 以最后一行为准；写入 JSONL 后调用 put_many(..., source=, offset=) 同步推进偏移
+    - 步骤内逐题结果（question_results）单独保存：条目中途失败时已完成的试题不丢失，
+      重跑只处理缺失或失败的试题；条目写入时其已完成步骤的逐题结果随之清除
+    """
+
+    def __init__(self, path):
+        """
+        :param path: SQLite 文件路径
+        """
+        self.path = path
+        self.reads = 0
+        self.writes = 0
+
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                id TEXT PRIMARY KEY,
+                entry TEXT NOT NULL,
+                steps TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS question_results (
+                entry_id TEXT NOT NULL,
+                step TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                result TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (entry_id, step, idx)
+            )
+            """
+        )
+
+    @staticmethod
+    def _offset_key(source):
+        return f"offset:{os.path.abspath(source)}"
+
+    def _put_rows(self, entries, now):
+        """写入条目（调用方需持有锁并处于事务中）"""
+        rows = []
+        for entry in entries:
+            if "id" not in entry:
+                raise ValueError("checkpoint entry must have an id")
+            rows.append((
+                entry["id"],
+                json.dumps(entry, ensure_ascii=False),
+                json.dumps(entry.get("steps", {}), ensure_ascii=False),
+                now,
+            ))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO checkpoints (id, entry, steps, updated) VALUES (?, ?, ?, ?)", rows
+        )
+        # 已完成步骤的逐题结果已包含在条目中
+        self._conn.executemany(
+            "DELETE FROM question_results WHERE entry_id = ? AND step = ?",
+            [
+                (entry["id"], str(step))
+                for entry in entries
+                for step, status in entry.get("steps", {}).items()
+                if status == "completed"
+            ],
+        )
+        self.writes += len(rows)
+
+    def get(self, entry_id):
+        """查询条目的最新数据，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM checkpoints WHERE id = ?", (entry_id,)).fetchone()
+            self.reads += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def step_status(self, entry_id, step):
+        """查询条目某一步骤的状态（如 "completed"），无记录时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT steps FROM checkpoints WHERE id = ?", (entry_id,)).fetchone()
+            self.reads += 1
+        return json.loads(row[0]).get(str(step)) if row is not None else None
+
+    def put(self, entry):
+        """写入（覆盖）一个条目"""
+        self.put_many([entry])
+
+    def put_many(self, entries, source=None, offset=None):
+        """
+        在一个事务内写入多个条目。
+        :param source: 条目已追加写入的 JSONL 路径，与 offset 一起记录已同步的位置
+        :param offset: 写入后 JSONL 的文件长度（字节）
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._put_rows(entries, now)
+                if source is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO checkpoint_meta (key, value) VALUES (?, ?)",
+                        (self._offset_key(source), str(offset)),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_step(self, entry_id, step, payload=None, status="completed"):
+        """
+        原子地更新一个步骤：合并该步骤的结果字段并设置步骤状态，返回更新后的条目。
+        :param payload: 要合并到条目中的字段（如 {"expert_agent": {...}}）
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT entry FROM checkpoints WHERE id = ?", (entry_id,)).fetchone()
+                entry = json.loads(row[0]) if row is not None else {"id": entry_id, "steps": {}}
+                entry.update(payload or {})
+                entry.setdefault("steps", {})[str(step)] = status
+                self._put_rows([entry], now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return entry
+
+    def synced_offset(self, source):
+        """JSONL 中已同步到断点存储的字节偏移；文件比记录的偏移短（被重写或截断）时为 0"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM checkpoint_meta WHERE key = ?", (self._offset_key(source),)
+            ).fetchone()
+        offset = int(row[0]) if row is not None else 0
+        if not os.path.exists(source) or os.path.getsize(source) < offset:
+            offset = 0
+        return offset
+
+    def get_questions(self, entry_id, step):
+        """查询条目某一步骤已保存的逐题结果，返回 {题号: (指纹, 结果)}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, fingerprint, result FROM question_results WHERE entry_id = ? AND step = ?",
+                (entry_id, str(step)),
+            ).fetchall()
+            self.reads += 1
+        return {idx: (fingerprint, json.loads(result)) for idx, fingerprint, result in rows}
+
+    def put_question(self, entry_id, step, index, fingerprint, result):
+        """
+        保存一道试题在某一步骤的结果。
+        :param fingerprint: 试题输入的指纹，输入改变（如重新出题）后旧结果不再复用
+        """
+        row = (entry_id, str(step), index, fingerprint, json.dumps(result, ensure_ascii=False), time.time())
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO question_results "
+                "(entry_id, step, idx, fingerprint, result, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self.writes += 1
+
+    def sync_jsonl(self, source):
+        """
+        从 JSONL 中导入上次同步之后追加的条目（末尾不完整的行留到下次），返回导入的条目数。
+        文件比记录的偏移短（被重写或截断）时从头导入。
+        """
+        if not os.path.exists(source):
+            return 0
+        offset = self.synced_offset(source)
+
+        entries = {}
+        with open(source, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                if line.strip():
+                    entry = json.loads(line)
+                    if "id" in entry:
+                        # 同一 id 以最后一行为准
+                        entries[entry["id"]] = entry
+        self.put_many(list(entries.values()), source=source, offset=offset)
+        return len(entries)
+
+    def iter_entries(self, page_size=1000):
+        """按 id 顺序分页遍历全部条目，内存占用与条目总数无关"""
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, entry FROM checkpoints WHERE id > ? ORDER BY id LIMIT ?", (last_id, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, entry in rows:
+                yield json.loads(entry)
+            last_id = rows[-1][0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+
+    def __contains__(self, entry_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM checkpoints WHERE id = ?", (entry_id,)
+            ).fetchone() is not None
+
+    def stats(self):
+        with self._lock:
+            questions = self._conn.execute("SELECT COUNT(*) FROM question_results").fetchone()[0]
+        return {"entries": len(self), "pending_questions": questions, "reads": self.reads, "writes": self.writes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,20 +1,325 @@
 import openai
-import numpy as np
 import json
 import time
 import sys
 import os
-from openai import OpenAI
-import requests
+import asyncio
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from utils.llm_cache import LLMCache, make_cache_key
+from utils.batch_llm import BatchPending
+from utils.llm_router import Endpoint, EndpointPool
+from utils.usage_tracker import UsageTracker
+from utils.llm_json import parse_json
+from utils.rate_limiter import (
+    get_rate_limiter,
+    estimate_tokens,
+    is_rate_limit_error,
+    retry_after_seconds,
+)
+from utils.retry import (
+    DEFAULT_RETRY_POLICY,
+    RetryPolicy,
+    RetryExhaustedError,
+    call_with_retry,
+    call_with_retry_async,
+    get_circuit_breaker,
+    is_retryable_error,
+)
+
+# numpy、google.generativeai、anthropic 等只在对应函数内导入，避免拖慢所有脚本的启动
+
+
+# ===== LLM 客户端注册表 ===== #
+# 各服务商的默认接入配置，可通过环境变量覆盖（例如指向本地 mock 服务做压测）
+LLM_PROVIDERS = {
+    "openai": {
+        "base_url": os.environ.get("OPENAI_BASE_URL", "https://xiaoai.plus/v1"),
+        "api_key": os.environ.get(
+            "OPENAI_API_KEY", "sk-I2PKH5ezPg9zEk6ny8T0HQtkm4g24ALXd6akjRtcuHHfkfrb"
+        ),
+    },
+    "dashscope": {
+        "base_url": os.environ.get(
+            "DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
+        ),
+        "api_key": os.environ.get(
+            "DASHSCOPE_API_KEY", "sk-9fca3e0e00994b96835cf550bb254ba0"
+        ),
+    },
+}
+
+
+class LLMClientRegistry:
+    """
+    长连接复用的 OpenAI 兼容客户端注册表。
+    每个 (base_url, api_key) 只构建一个客户端，共享同一个 keep-alive 连接池，
+    避免每次调用都重新建立 HTTP 连接和 TLS 握手。
+    """
 
-try:
-    import google.generativeai as genai
-    from anthropic import Anthropic
-except:
-    pass
+    def __init__(self, pool_size=16, keepalive_expiry=60.0, timeout=120.0, async_concurrency=128):
+        """
+        :param pool_size: 每个客户端的最大连接数（建议与 --num_works 一致）
+        :param keepalive_expiry: 空闲连接保持时间（秒）
+        :param timeout: 单次请求超时时间（秒）
+        :param async_concurrency: 异步路径下每个服务商同时在途的最大请求数
+        """
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.async_concurrency = async_concurrency
+        self._clients = {}
+        # 异步客户端与信号量都绑定在事件循环上，按 (…, loop) 分别缓存
+        self._async_clients = {}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def configure(self, pool_size=None, keepalive_expiry=None, timeout=None, async_concurrency=None):
+        """调整连接池参数，已创建的客户端会被关闭并在下次使用时按新参数重建"""
+        with self._lock:
+            if pool_size is not None:
+                self.pool_size = max(1, int(pool_size))
+            if keepalive_expiry is not None:
+                self.keepalive_expiry = keepalive_expiry
+            if timeout is not None:
+                self.timeout = timeout
+            if async_concurrency is not None:
+                self.async_concurrency = max(1, int(async_concurrency))
+                self._semaphores.clear()
+            self._close_clients()
+
+    def _limits(self, size):
+        return httpx.Limits(
+            max_connections=size,
+            max_keepalive_connections=size,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _build_http_client(self):
+        return httpx.Client(limits=self._limits(self.pool_size), timeout=self.timeout)
+
+    def get_client(self, base_url, api_key):
+        """获取 (base_url, api_key) 对应的长连接客户端，不存在时创建"""
+        key = (base_url, api_key)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                # 关闭 SDK 内置重试，429 等错误交给限流器统一处理
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=self._build_http_client(),
+                    max_retries=0,
+                )
+                self._clients[key] = client
+        return client
+
+    def get_provider_client(self, provider):
+        """根据 LLM_PROVIDERS 中的服务商名称获取客户端"""
+        if provider not in LLM_PROVIDERS:
+            raise ValueError(f"Unknown provider: {provider}")
+        config = LLM_PROVIDERS[provider]
+        return self.get_client(config["base_url"], config["api_key"])
+
+    def get_async_client(self, base_url, api_key):
+        """获取当前事件循环下 (base_url, api_key) 对应的 AsyncOpenAI 客户端"""
+        key = (base_url, api_key, asyncio.get_running_loop())
+        client = self._async_clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._async_clients.get(key)
+                if client is None:
+                    client = AsyncOpenAI(
+                        api_key=api_key,
+                        base_url=base_url,
+                        http_client=httpx.AsyncClient(
+                            limits=self._limits(self.async_concurrency),
+                            timeout=self.timeout,
+                        ),
+                        max_retries=0,
+                    )
+                    self._async_clients[key] = client
+        return client
+
+    def get_async_provider_client(self, provider):
+        """根据服务商名称获取异步客户端"""
+        if provider not in LLM_PROVIDERS:
+            raise ValueError(f"Unknown provider: {provider}")
+        config = LLM_PROVIDERS[provider]
+        return self.get_async_client(config["base_url"], config["api_key"])
+
+    def get_semaphore(self, provider):
+        """获取当前事件循环下服务商的并发信号量，用于限制在途请求数"""
+        key = (provider, asyncio.get_running_loop())
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            with self._lock:
+                semaphore = self._semaphores.setdefault(
+                    key, asyncio.Semaphore(self.async_concurrency)
+                )
+        return semaphore
+
+    def _close_clients(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+    def close(self):
+        """关闭所有同步客户端及其连接池"""
+        with self._lock:
+            self._close_clients()
+
+    async def aclose(self):
+        """关闭当前事件循环下创建的异步客户端"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            keys = [key for key in self._async_clients if key[-1] is loop]
+            clients = [self._async_clients.pop(key) for key in keys]
+            for key in [key for key in self._semaphores if key[-1] is loop]:
+                del self._semaphores[key]
+        for client in clients:
+            await client.close()
+
+
+LLM_CLIENT_REGISTRY = LLMClientRegistry()
+
+
+def configure_llm_pool(pool_size=None, keepalive_expiry=None, timeout=None, async_concurrency=None):
+    """按工作线程数（或异步并发数）配置全局连接池大小"""
+    LLM_CLIENT_REGISTRY.configure(
+        pool_size=pool_size,
+        keepalive_expiry=keepalive_expiry,
+        timeout=timeout,
+        async_concurrency=async_concurrency,
+    )
+
+
+def register_provider(name, base_url, api_key):
+    """注册或覆盖一个 OpenAI 兼容服务商"""
+    LLM_PROVIDERS[name] = {"base_url": base_url, "api_key": api_key}
+
+
+def get_llm_client(provider):
+    """获取服务商对应的共享客户端"""
+    return LLM_CLIENT_REGISTRY.get_provider_client(provider)
+
+
+# ===== 多端点负载均衡 ===== #
+# 逻辑服务商 -> EndpointPool；未配置端点池的服务商直接使用 LLM_PROVIDERS 中的单一端点
+_ENDPOINT_POOLS = {}
+
+
+def configure_endpoints(config):
+    """
+    为逻辑服务商配置加权端点池，config 为 dict 或 JSON 文件路径，格式：
+        {
+            "dashscope": [
+                {"name": "dashscope", "weight": 1},
+                {"name": "local-a", "base_url": "http://10.0.0.2:8000/v1", "api_key": "EMPTY",
+                 "weight": 2, "models": {"qwen-plus": "qwen2.5-72b-instruct"}}
+            ]
+        }
+    带 base_url 的端点会注册为新的服务商，否则引用 LLM_PROVIDERS 中已有的服务商。
+    """
+    if isinstance(config, str):
+        with open(config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+    for provider, endpoints in config.items():
+        pool = []
+        for item in endpoints:
+            name = item["name"]
+            if "base_url" in item:
+                register_provider(name, item["base_url"], item.get("api_key", "EMPTY"))
+            elif name not in LLM_PROVIDERS:
+                raise ValueError(f"Unknown provider: {name}")
+            pool.append(Endpoint(name, weight=item.get("weight", 1.0), models=item.get("models")))
+        _ENDPOINT_POOLS[provider] = EndpointPool(provider, pool)
+    return dict(_ENDPOINT_POOLS)
+
+
+def endpoint_report():
+    """所有端点池的当前状态"""
+    return {provider: pool.stats() for provider, pool in _ENDPOINT_POOLS.items()}
+
+
+def resolve_provider(model):
+    """根据模型名称推断服务商"""
+    if "qwen" in model or "deepseek" in model:
+        return "dashscope"
+    elif "gpt" in model:
+        return "openai"
+    raise ValueError(f"Unsupported model: {model}")
+
+
+# ===== LLM 响应缓存 ===== #
+# 设置环境变量 LLM_CACHE_PATH 即可为所有脚本默认开启持久化缓存
+_LLM_CACHE = LLMCache(os.environ["LLM_CACHE_PATH"]) if os.environ.get("LLM_CACHE_PATH") else None
+
+
+def set_llm_cache(cache):
+    """设置全局 LLM 响应缓存（传入 None 关闭缓存）"""
+    global _LLM_CACHE
+    _LLM_CACHE = cache
+
+
+def get_llm_cache():
+    """获取全局 LLM 响应缓存，未开启时返回 None"""
+    return _LLM_CACHE
+
+
+# ===== 离线批处理模式 ===== #
+_BATCH_RECORDER = None
+
+
+def set_batch_recorder(recorder):
+    """
+    开启批处理模式：缓存未命中的请求写入 recorder 而不实时调用，并抛出 BatchPending。
+    批处理结果通过 tools/batch_llm.py ingest 回填到 LLM 缓存后，重跑即可命中。
+    """
+    global _BATCH_RECORDER
+    _BATCH_RECORDER = recorder
+
+
+# ===== 对冲请求 ===== #
+_HEDGE_POLICY = None
+
+
+def set_hedge_policy(policy):
+    """
+    开启对冲请求（传入 None 关闭）：run_agent 调用耗时超过该模型观测到的 p95 时，
+    再发一个相同请求并取先返回的结果，对冲比例受 policy.budget 限制。
+    """
+    global _HEDGE_POLICY
+    _HEDGE_POLICY = policy
+
+
+def get_hedge_policy():
+    """获取当前对冲策略，未开启时返回 None"""
+    return _HEDGE_POLICY
+
+
+# ===== token 用量统计 ===== #
+_USAGE_TRACKER = None
+
+
+def set_usage_tracker(tracker):
+    """开启 token 用量与延迟统计（传入 None 关闭），标签见 utils.usage_tracker.track_usage"""
+    global _USAGE_TRACKER
+    _USAGE_TRACKER = tracker
+
+
+def get_usage_tracker():
+    return _USAGE_TRACKER
 
 
 def get_openai_embedding(texts, model="text-embedding-ada-002"):
+    import numpy as np
+
     texts = [text.replace("\n", " ") for text in texts]
     return np.array(
         [
@@ -29,6 +334,7 @@ def set_anthropic_key():
 
 
 def set_gemini_key():
+    import google.generativeai as genai
 
     # Or use `os.getenv('GOOGLE_API_KEY')` to fetch an environment variable.
     genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
@@ -50,47 +356,48 @@ def run_json_trials(
     input=None,
 ):
 
-    run_loop = True
-    counter = 0
-    while run_loop:
-        try:
-            if examples is not None and input is not None:
-                output = run_chatgpt_with_examples(
-                    query,
-                    examples,
-                    input,
-                    num_gen=num_gen,
-                    wait_time=wait_time,
-                    num_tokens_request=num_tokens_request,
-                    use_16k=use_16k,
-                    temperature=temperature,
-                ).strip()
-            else:
-                output = run_chatgpt(
-                    query,
-                    num_gen=num_gen,
-                    wait_time=wait_time,
-                    model=model,
-                    num_tokens_request=num_tokens_request,
-                    use_16k=use_16k,
-                    temperature=temperature,
-                )
-            output = output.replace("json", "")  # this frequently happens
-            facts = json.loads(output.strip())
-            run_loop = False
-        except json.decoder.JSONDecodeError:
-            counter += 1
-            time.sleep(1)
-            print("Retrying to avoid JsonDecodeError, trial %s ..." % counter)
-            print(output)
-            if counter == 10:
-                print("Exiting after 10 trials")
-                sys.exit()
-            continue
-    return facts
+    # 先在本地修复 JSON 格式缺陷，仍无法解析时才重新请求；网络类错误已由 _create_completion 统一重试
+    output = None
+
+    def attempt():
+        nonlocal output
+        if examples is not None and input is not None:
+            output = run_chatgpt_with_examples(
+                query,
+                examples,
+                input,
+                num_gen=num_gen,
+                wait_time=wait_time,
+                num_tokens_request=num_tokens_request,
+                use_16k=use_16k,
+                temperature=temperature,
+            ).strip()
+        else:
+            output = run_chatgpt(
+                query,
+                num_gen=num_gen,
+                wait_time=wait_time,
+                model=model,
+                num_tokens_request=num_tokens_request,
+                use_16k=use_16k,
+                temperature=temperature,
+            )
+        return parse_json(output)
+
+    try:
+        return call_with_retry(
+            attempt,
+            policy=RetryPolicy(max_attempts=10, base_delay=1.0, max_delay=8.0),
+            retryable=lambda e: isinstance(e, json.decoder.JSONDecodeError),
+            name="run_json_trials",
+        )
+    except RetryExhaustedError:
+        print(output)
+        raise
 
 
 def run_claude(query, max_new_tokens, model_name):
+    from anthropic import Anthropic
 
     if model_name == "claude-sonnet":
         model_name = "claude-3-sonnet-20240229"
@@ -137,51 +444,226 @@ def run_chatgpt_with_examples(
     temperature=1.0,
 ):
 
-    completion = None
-
     messages = [{"role": "system", "content": query}]
     for inp, out in examples:
         messages.append({"role": "user", "content": inp})
         messages.append({"role": "system", "content": out})
     messages.append({"role": "user", "content": input})
 
-    while completion is None:
-        wait_time = wait_time * 2
-        try:
-            completion = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo" if not use_16k else "gpt-3.5-turbo-16k",
-                temperature=temperature,
-                max_tokens=num_tokens_request,
-                n=num_gen,
-                messages=messages,
-            )
-        except openai.error.APIError as e:
-            # Handle API error here, e.g. retry or log
-            print(
-                f"OpenAI API returned an API Error: {e}; waiting for {wait_time} seconds"
-            )
-            time.sleep(wait_time)
-            pass
-        except openai.error.APIConnectionError as e:
-            # Handle connection error here
-            print(
-                f"Failed to connect to OpenAI API: {e}; waiting for {wait_time} seconds"
+    # 限流与 429 重试由 _create_completion 中的自适应限流器统一处理
+    completion = _create_completion(
+        "openai",
+        {
+            "model": "gpt-3.5-turbo" if not use_16k else "gpt-3.5-turbo-16k",
+            "temperature": temperature,
+            "max_tokens": num_tokens_request,
+            "n": num_gen,
+            "messages": messages,
+        },
+    )
+
+    return _parse_completion("gpt-3.5-turbo", completion, num_gen)
+
+
+# 支持 response_format={"type": "json_object"}（JSON 模式）的模型，
+# JSON 模式要求顶层为对象，返回数组的 prompt 不应开启
+JSON_MODE_MODELS = {"qwen-plus", "qwen-max", "qwen-turbo", "gpt-3.5-turbo", "gpt-3.5-turbo-16k", "gpt-4-1106-preview"}
+
+
+def _chat_request(model, query, num_gen=1, temperature=1.0, num_tokens_request=1000, use_16k=False, json_mode=False):
+    """
+    构造 chat.completions.create 的请求参数，同步与异步调用路径共用。
+    json_mode=True 时对支持的模型开启 JSON 模式，其余模型忽略。
+    """
+    request = _base_chat_request(model, query, num_gen, temperature, num_tokens_request, use_16k)
+    if json_mode and request["model"] in JSON_MODE_MODELS:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+
+def _base_chat_request(model, query, num_gen, temperature, num_tokens_request, use_16k):
+    if "deepseek" in model:
+        return {
+            "model": "deepseek-r1",
+            "temperature": temperature,
+            "n": num_gen,
+            "messages": [{"role": "user", "content": query}],
+        }
+    if "qwen" in model:
+        return {
+            # "qwen" 为默认模型的别名，其余名称（qwen-turbo、qwen2.5-7b-instruct 等）原样使用
+            "model": "qwen-plus" if model == "qwen" else model,  # qwen-max0.02 0.06 qwen-plus0.0008 0.002 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models  qwen-max-0919  qwen-max  qwen2.5-72b-instruct
+            "temperature": temperature,
+            # "max_tokens": num_tokens_request,
+            "n": num_gen,
+            "messages": [{"role": "user", "content": query}],
+        }
+    if "gpt-3.5-turbo" in model:
+        return {
+            "model": "gpt-3.5-turbo-16k" if use_16k else "gpt-3.5-turbo",
+            "temperature": temperature,
+            "max_tokens": num_tokens_request,
+            "n": num_gen,
+            "messages": [{"role": "system", "content": query}],
+        }
+    if "gpt-4" in model:
+        model_name = "gpt-4-1106-preview"
+    elif model == "chatgpt_o1-preview":
+        model_name = "o1-preview"
+    else:
+        raise ValueError(f"Model {model} is not supported.")
+    return {
+        "model": model_name,
+        "temperature": temperature,
+        "max_tokens": num_tokens_request,
+        "n": num_gen,
+        "messages": [{"role": "user", "content": query}],
+    }
+
+
+def _request_tokens(request):
+    return estimate_tokens("".join(m["content"] for m in request["messages"]))
+
+
+def _record_failure(provider, limiter, est_tokens, error):
+    """按错误类型更新限流器与熔断器状态"""
+    breaker = get_circuit_breaker(provider)
+    throttled = is_rate_limit_error(error)
+    limiter.release(est_tokens, throttled=throttled, failed=True)
+    if throttled:
+        # 429 说明服务可用，只降速不计入熔断
+        wait = retry_after_seconds(error)
+        if wait:
+            limiter.backoff(wait)
+        breaker.release_probe()
+    elif is_retryable_error(error):
+        breaker.record_failure()
+    else:
+        breaker.release_probe()
+
+
+def _record_success(provider, limiter, est_tokens, completion, request, latency):
+    usage = getattr(completion, "usage", None)
+    limiter.release(est_tokens, used_tokens=getattr(usage, "total_tokens", None))
+    get_circuit_breaker(provider).record_success()
+    if _USAGE_TRACKER is not None:
+        _USAGE_TRACKER.record(provider, request["model"], usage, latency)
+
+
+def _attempt_completion(provider, request, est_tokens):
+    """在单个服务商（端点）上发送一次请求，结果计入其限流器与熔断器"""
+    client = get_llm_client(provider)
+    limiter = get_rate_limiter(provider)
+    get_circuit_breaker(provider).allow()
+    limiter.acquire(est_tokens)
+    start = time.monotonic()
+    try:
+        completion = client.chat.completions.create(**request)
+    except Exception as e:
+        _record_failure(provider, limiter, est_tokens, e)
+        raise
+    _record_success(provider, limiter, est_tokens, completion, request, time.monotonic() - start)
+    return completion
+
+
+async def _attempt_completion_async(provider, request, est_tokens):
+    """_attempt_completion 的异步版本，额外受服务商信号量约束"""
+    client = LLM_CLIENT_REGISTRY.get_async_provider_client(provider)
+    limiter = get_rate_limiter(provider)
+    breaker = get_circuit_breaker(provider)
+    breaker.allow()
+    try:
+        async with LLM_CLIENT_REGISTRY.get_semaphore(provider):
+            await limiter.acquire_async(est_tokens)
+            start = time.monotonic()
+            try:
+                completion = await client.chat.completions.create(**request)
+            except asyncio.CancelledError:
+                # 被取消（如对冲中落后的请求）：不计入失败，只归还并发槽位
+                limiter.release(est_tokens, failed=True)
+                raise
+            except Exception as e:
+                _record_failure(provider, limiter, est_tokens, e)
+                raise
+    except asyncio.CancelledError:
+        breaker.release_probe()
+        raise
+    _record_success(provider, limiter, est_tokens, completion, request, time.monotonic() - start)
+    return completion
+
+
+def _create_completion(provider, request, retry_policy=DEFAULT_RETRY_POLICY):
+    """
+    发送 chat.completions 请求（同步）。
+    - 熔断器打开时快速失败（CircuitOpenError），不占用工作线程
+    - 请求经过服务商共享的自适应限流器准入，429 时乘性降速
+    - 可重试错误（网络/超时/429/5xx）按带抖动的指数退避重试
+    - 服务商配置了端点池时，按负载选择端点并在出错时切换（见 configure_endpoints）
+    """
+    est_tokens = _request_tokens(request)
+    pool = _ENDPOINT_POOLS.get(provider)
+
+    if pool is None:
+        def attempt():
+            return _attempt_completion(provider, request, est_tokens)
+    else:
+        def attempt():
+            return pool.call(
+                lambda endpoint: _attempt_completion(endpoint.name, endpoint.prepare(request), est_tokens)
             )
-            time.sleep(wait_time)
-            pass
-        except openai.error.RateLimitError as e:
-            # Handle rate limit error (we recommend using exponential backoff)
-            print(f"OpenAI API request exceeded rate limit: {e}")
-            pass
-        except openai.error.ServiceUnavailableError as e:
-            # Handle rate limit error (we recommend using exponential backoff)
-            print(
-                f"OpenAI API request exceeded rate limit: {e}; waiting for {wait_time} seconds"
+
+    return call_with_retry(attempt, policy=retry_policy, name=provider)
+
+
+async def _create_completion_async(provider, request, retry_policy=DEFAULT_RETRY_POLICY):
+    """_create_completion 的异步版本"""
+    est_tokens = _request_tokens(request)
+    pool = _ENDPOINT_POOLS.get(provider)
+
+    if pool is None:
+        def attempt():
+            return _attempt_completion_async(provider, request, est_tokens)
+    else:
+        def attempt():
+            return pool.call_async(
+                lambda endpoint: _attempt_completion_async(endpoint.name, endpoint.prepare(request), est_tokens)
             )
-            time.sleep(wait_time)
-            pass
 
-    return completion.choices[0].message.content
+    return await call_with_retry_async(attempt, policy=retry_policy, name=provider)
+
+
+def parse_completion_body(body, num_gen=None):
+    """
+    将批处理结果中的 completion JSON 解析为与 run_agent 相同的返回值。
+    num_gen 为 None 时按返回的 choices 数量推断。
+    """
+    from openai.types.chat import ChatCompletion
+
+    if num_gen is None:
+        num_gen = len(body.get("choices") or [])
+    return _parse_completion(body.get("model", ""), ChatCompletion.model_validate(body), num_gen)
+
+
+def _parse_choice(model, choice):
+    """从单个 choice 中提取结果；deepseek-r1 额外返回思考过程"""
+    if "deepseek" in model:
+        return {
+            "reasoning": getattr(choice.message, "reasoning_content", None),  # 思考过程
+            "answer": choice.message.content  # 最终答案
+        }
+    return choice.message.content
+
+
+def _parse_completion(model, completion, num_gen=1):
+    """
+    从 completion 中提取结果：
+    - num_gen == 1 时返回第一个 choice 的内容（与原有调用方兼容）
+    - num_gen > 1 时按 index 顺序返回全部 choice 组成的列表，一次请求拿到多个候选
+    """
+    if num_gen > 1:
+        choices = sorted(completion.choices, key=lambda c: c.index)
+        return [_parse_choice(model, choice) for choice in choices]
+    return _parse_choice(model, completion.choices[0])
 
 
 def run_chatgpt(
@@ -192,77 +674,46 @@ def run_chatgpt(
     use_16k=False,
     temperature=1.0,
     wait_time=1,
+    json_mode=False,
 ):
     """
     通用的 ChatGPT 和 OpenAI API 调用函数，支持多种模型。
     """
 
-    client = OpenAI(
-        api_key="sk-I2PKH5ezPg9zEk6ny8T0HQtkm4g24ALXd6akjRtcuHHfkfrb",
-        base_url="https://xiaoai.plus/v1",
-        # "sk-Fbqjug5suyrFtiNxQ87Up4Wx02NLP2bRVhc2orBA8lEHsqot"
-    )  # This is the default and can be omitted
-
-    completion = None
-    while completion is None:
-
-        if "gpt-3.5-turbo" in model:
-            messages = [{"role": "system", "content": query}]
-            completion = client.chat.completions.create(
-                model="gpt-3.5-turbo-16k" if use_16k else "gpt-3.5-turbo",
-                temperature=temperature,
-                max_tokens=num_tokens_request,
-                n=num_gen,
-                messages=messages,
-            )
-        elif "gpt-4" in model:
-            messages = [{"role": "user", "content": query}]
-            completion = client.chat.completions.create(
-                model="gpt-4-1106-preview",
-                temperature=temperature,
-                max_tokens=num_tokens_request,
-                n=num_gen,
-                messages=messages,
-            )
-        elif model == "chatgpt_o1-preview":
-            messages = [{"role": "user", "content": query}]
-            completion = client.chat.completions.create(
-                model="o1-preview",
-                temperature=temperature,
-                max_tokens=num_tokens_request,
-                n=num_gen,
-                messages=messages,
-            )
-        elif model == "davinci":
-            completion = openai.Completion.create(
-                model="text-davinci-003",
-                prompt=query,
-                temperature=temperature,
-                max_tokens=num_tokens_request,
-                n=num_gen,
-            )
-        else:
-            raise ValueError(f"Model {model} is not supported.")
+    if model == "davinci":
+        completion = openai.Completion.create(
+            model="text-davinci-003",
+            prompt=query,
+            temperature=temperature,
+            max_tokens=num_tokens_request,
+            n=num_gen,
+        )
+        return completion.choices[0].message.content
+
+    completion = _create_completion(
+        "openai",
+        _chat_request(
+            model,
+            query,
+            num_gen=num_gen,
+            temperature=temperature,
+            num_tokens_request=num_tokens_request,
+            use_16k=use_16k,
+            json_mode=json_mode,
+        ),
+    )
 
-    return completion.choices[0].message.content
+    return _parse_completion(model, completion, num_gen)
 
 
 # qwen2
-def run_qwen(query, num_gen=1, num_tokens_request=1000, wait_time=1, temperature=0.8):
+def run_qwen(query, num_gen=1, num_tokens_request=1000, wait_time=1, temperature=0.8, json_mode=False, model="qwen"):
 
-    client = OpenAI(
-        api_key="sk-9fca3e0e00994b96835cf550bb254ba0",  # 使用您的 Dashscope API 密钥
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-    )
-    completion = client.chat.completions.create(
-        model="qwen-plus",  # qwen-max0.02 0.06 qwen-plus0.0008 0.002 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models  qwen-max-0919  qwen-max  qwen2.5-72b-instruct
-        temperature=temperature,
-        # max_tokens = num_tokens_request,
-        n=num_gen,
-        messages=[{"role": "user", "content": query}],
+    completion = _create_completion(
+        "dashscope", _chat_request(model, query, num_gen=num_gen, temperature=temperature, json_mode=json_mode)
     )
 
-    return completion.choices[0].message.content
+    return _parse_completion(model, completion, num_gen)
 
 
 # deepseek
@@ -277,49 +728,119 @@ def run_ds(query, model="deepseek-r1", temperature=0.7, num_gen=1):
         num_gen (int): 生成的回答数量 (默认: 1)
 
     返回:
-        tuple: (思考过程, 最终答案)
+        dict: {"reasoning": 思考过程, "answer": 最终答案}；num_gen > 1 时返回该结构的列表
     """
 
-    client = OpenAI(
-        api_key="sk-9fca3e0e00994b96835cf550bb254ba0", 
-        # api_key=os.getenv("sk-9fca3e0e00994b96835cf550bb254ba0"),  # API Key 读取方式
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-    )
-
-    completion = client.chat.completions.create(
-        model="deepseek-r1",
-        temperature=temperature,
-        n=num_gen,
-        messages=[{"role": "user", "content": query}],
+    completion = _create_completion(
+        "dashscope",
+        _chat_request("deepseek-r1", query, num_gen=num_gen, temperature=temperature),
     )
 
     # 提取思考过程和最终答案
-    reasoning_content = completion.choices[0].message.reasoning_content
-    final_content = completion.choices[0].message.content
+    return _parse_completion("deepseek-r1", completion, num_gen)
+    
 
-    # 组织返回结果
-    result = {
-        "reasoning": completion.choices[0].message.reasoning_content,  # 思考过程
-        "answer": completion.choices[0].message.content  # 最终答案
-    }
+def _agent_request(prompt, model, num_gen, temperature, json_mode=False):
+    """run_agent 语义下的 (服务商, 请求参数)"""
+    provider = resolve_provider(model)
+    if "deepseek" in model:
+        # 与 run_agent 保持一致：deepseek 使用 run_ds 的默认参数
+        num_gen, temperature = 1, 0.7
+    return provider, _chat_request(model, prompt, num_gen=num_gen, temperature=temperature, json_mode=json_mode)
 
-    return result
-    
 
-def run_agent(prompt, model="qwen", num_gen=1, temperature=1):
-    """调用大模型进行生成"""
+def _record_batch_request(prompt, model, num_gen, temperature, json_mode=False):
+    """批处理模式：记录请求并中断当前调用链"""
+    provider, request = _agent_request(prompt, model, num_gen, temperature, json_mode)
+    _BATCH_RECORDER.add(provider, make_cache_key(model, prompt, temperature, num_gen), request)
+    raise BatchPending(f"{model} 请求已写入批处理文件")
 
-    if "qwen" in model:
-        response = run_qwen(prompt, num_gen=num_gen, temperature=temperature)
-    elif "gpt" in model:
-        response = run_chatgpt(
-            prompt, model=model, num_gen=num_gen, temperature=temperature
+
+def _agent_cache(use_cache):
+    """
+    本次调用使用的缓存。批处理模式下结果只能经缓存回填，use_cache=False 的采样请求也读写缓存
+    （回填的结果本身就是新的采样），否则重跑时会再次写入批处理文件而永远无法完成
+    """
+    if use_cache or _BATCH_RECORDER is not None:
+        return _LLM_CACHE
+    return None
+
+
+def _cached_response(cache, model, prompt, temperature, num_gen, validate):
+    """读取缓存；未通过 validate 的旧结果视为未命中"""
+    if cache is None:
+        return None
+    cached = cache.get(model, prompt, temperature, num_gen)
+    if cached is not None and (validate is None or validate(cached)):
+        return cached
+    return None
+
+
+def _store_response(cache, model, prompt, temperature, num_gen, response, validate):
+    """写入缓存；未通过 validate 的结果不写入，避免重跑时再次命中"""
+    if cache is not None and (validate is None or validate(response)):
+        cache.put(model, prompt, temperature, num_gen, response)
+
+
+def run_agent(prompt, model="qwen", num_gen=1, temperature=1, use_cache=True, json_mode=False, validate=None):
+    """
+    调用大模型进行生成，底层客户端统一从 LLM_CLIENT_REGISTRY 获取。
+    开启全局缓存时先查缓存；采样类任务需要新结果时传 use_cache=False。
+    num_gen > 1 时一次请求返回 num_gen 个候选组成的列表（deepseek 不支持，固定返回单个结果）。
+    json_mode=True 时对支持的模型开启 JSON 模式（response_format）。
+    validate(response) -> bool 用于结构化输出：未通过校验的结果不读取也不写入缓存。
+    """
+    cache = _agent_cache(use_cache)
+    cached = _cached_response(cache, model, prompt, temperature, num_gen, validate)
+    if cached is not None:
+        return cached
+
+    if _BATCH_RECORDER is not None:
+        _record_batch_request(prompt, model, num_gen, temperature, json_mode)
+
+    provider = resolve_provider(model)
+
+    def call():
+        if "deepseek" in model:
+            return run_ds(prompt)
+        if provider == "dashscope":
+            return run_qwen(prompt, num_gen=num_gen, temperature=temperature, json_mode=json_mode, model=model)
+        return run_chatgpt(
+            prompt, model=model, num_gen=num_gen, temperature=temperature, json_mode=json_mode
+        )
+
+    hedge = _HEDGE_POLICY
+    response = hedge.run(model, call) if hedge is not None else call()
+
+    _store_response(cache, model, prompt, temperature, num_gen, response, validate)
+    return response
+
+
+async def run_agent_async(prompt, model="qwen", num_gen=1, temperature=1, use_cache=True, json_mode=False, validate=None):
+    """
+    run_agent 的异步版本，基于 AsyncOpenAI。
+    每个服务商由信号量限制在途请求数（见 LLMClientRegistry.async_concurrency），
+    单进程即可同时保持数百个请求在途。
+    """
+    cache = _agent_cache(use_cache)
+    cached = _cached_response(cache, model, prompt, temperature, num_gen, validate)
+    if cached is not None:
+        return cached
+
+    if _BATCH_RECORDER is not None:
+        _record_batch_request(prompt, model, num_gen, temperature, json_mode)
+
+    provider, request = _agent_request(prompt, model, num_gen, temperature, json_mode)
+    hedge = _HEDGE_POLICY
+    if hedge is not None:
+        completion = await hedge.run_async(
+            model, lambda: _create_completion_async(provider, request)
         )
-    elif "deepseek" in model:
-        response = run_ds(prompt)
     else:
-        raise ValueError(f"Unsupported model: {model}")
+        completion = await _create_completion_async(provider, request)
 
+    response = _parse_completion(model, completion, request["n"])
+    _store_response(cache, model, prompt, temperature, num_gen, response, validate)
     return response
 
 # babel -ipdbgt /home/zdx/xxx.pdbgt -opdb /home/zdx/xxx.pdb
\ No newline at end of file
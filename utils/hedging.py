@@ -0,0 +1,194 @@
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class LatencyTracker:
+    """滑动窗口内的请求延迟统计，用于估计 p95 等分位数"""
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+class HedgePolicy:
+    """
+    对冲请求策略：请求耗时超过观测到的分位数（默认 p95）时，再发一个相同请求，取先完成的结果。
+    - budget: 对冲请求占总请求数的比例上限（额外花费上限）
+    - min_samples: 样本不足时不对冲
+    - min_delay: 对冲触发的最短等待时间（秒），避免对极快请求对冲
+    - max_workers: 同步调用的线程池大小，应不小于在途请求数的两倍（主请求与对冲请求），
+      否则请求在池中排队
+    """
+
+    def __init__(self, percentile=0.95, budget=0.05, min_samples=20, min_delay=1.0,
+                 burst=5, max_workers=64):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.burst = burst
+
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def tracker(self, key):
+        with self._lock:
+            if key not in self._trackers:
+                self._trackers[key] = LatencyTracker()
+            return self._trackers[key]
+
+    def hedge_delay(self, key):
+        """返回触发对冲前的等待时间；样本不足时返回 None（不对冲）"""
+        tracker = self.tracker(key)
+        if len(tracker) < max(1, self.min_samples):
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _take_budget(self):
+        """额外请求是否在预算内：对冲数 ≤ budget × 总请求数 + burst"""
+        with self._lock:
+            if self.hedges_fired < self.budget * self.calls + self.burst:
+                self.hedges_fired += 1
+                return True
+            self.budget_denied += 1
+            return False
+
+    def _count_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def _count_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    @staticmethod
+    def _timed(fn, tracker, started=None):
+        """
+        包装单次请求：每个成功完成的请求（包括落后的请求）都记录自身耗时，分位延迟不因只记胜者而偏低。
+        started: 请求开始执行时置位的 Event
+        """
+        def attempt():
+            if started is not None:
+                started.set()
+            start = time.monotonic()
+            result = fn()
+            tracker.record(time.monotonic() - start)
+            return result
+        return attempt
+
+    @staticmethod
+    def _timed_async(fn, tracker):
+        async def attempt():
+            start = time.monotonic()
+            result = await fn()
+            tracker.record(time.monotonic() - start)
+            return result
+        return attempt
+
+    def run(self, key, fn):
+        """同步执行 fn()，超过分位延迟时发起对冲，返回先成功的结果"""
+        self._count_call()
+        delay = self.hedge_delay(key)
+        tracker = self.tracker(key)
+
+        if delay is None:
+            return self._timed(fn, tracker)()
+
+        # 在调用方的上下文中执行，保留 usage_tags 等上下文变量
+        started = threading.Event()
+        primary = self._executor.submit(contextvars.copy_context().run, self._timed(fn, tracker, started))
+        # 对冲延迟从主请求开始执行时计时，线程池排队时间不计入
+        started.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            return primary.result()
+
+        hedge = self._executor.submit(contextvars.copy_context().run, self._timed(fn, tracker))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is hedge:
+                    self._count_win()
+                # 落后的请求无法中断，完成后记录耗时，结果直接丢弃
+                return future.result()
+        raise error
+
+    async def run_async(self, key, fn):
+        """run 的异步版本，fn 为返回协程的函数；调用方被取消或已有结果时，未完成的请求都会被取消"""
+        self._count_call()
+        delay = self.hedge_delay(key)
+        attempt = self._timed_async(fn, self.tracker(key))
+
+        tasks = []
+        try:
+            primary = asyncio.ensure_future(attempt())
+            tasks.append(primary)
+            if delay is not None:
+                done, _ = await asyncio.wait([primary], timeout=delay)
+            if delay is None or done or not self._take_budget():
+                return await primary
+
+            hedge = asyncio.ensure_future(attempt())
+            tasks.append(hedge)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is hedge:
+                        self._count_win()
+                    return task.result()
+            raise error
+        finally:
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            # 等待未完成的请求结束取消，其限流槽位等资源在返回前已归还
+            if unfinished:
+                await asyncio.gather(*unfinished, return_exceptions=True)
+
+    def stats(self):
+        """对冲统计：触发次数、对冲胜出次数、预算拒绝次数及各模型 p95"""
+        with self._lock:
+            trackers = dict(self._trackers)
+            stats = {
+                "calls": self.calls,
+                "hedges_fired": self.hedges_fired,
+                "hedge_wins": self.hedge_wins,
+                "budget_denied": self.budget_denied,
+                "hedge_rate": self.hedges_fired / self.calls if self.calls else 0.0,
+            }
+        stats["p95"] = {key: tracker.percentile(0.95) for key, tracker in trackers.items()}
+        return stats
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+# 缓存模式
+#   read_write: 先查缓存，未命中再调用模型并写回（默认）
+#   read_only:  只读缓存，未命中时调用模型但不写回
+#   write_only: 总是调用模型，并用新结果覆盖缓存（刷新缓存）
+#   off:        完全不使用缓存
+CACHE_MODES = ("read_write", "read_only", "write_only", "off")
+
+
+def make_cache_key(model, prompt, temperature, num_gen):
+    """根据 (model, prompt, temperature, num_gen) 生成内容寻址的缓存 key"""
+    payload = json.dumps(
+        [model, prompt, float(temperature), int(num_gen)], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    基于 SQLite 的持久化 LLM 响应缓存。
+    - key 为 (model, prompt, temperature, num_gen) 的 sha256
+    - 支持 TTL 过期、按条数/字节数的 LRU 淘汰
+    - 统计命中、未命中、写入、淘汰次数
+    """
+
+    def __init__(self, path, mode="read_write", ttl=None, max_entries=None,
+                 max_bytes=None, evict_every=100):
+        """
+        :param path: SQLite 文件路径
+        :param mode: 缓存模式，见 CACHE_MODES
+        :param ttl: 过期时间（秒），None 表示永不过期
+        :param max_entries: 最大缓存条数，超过后按最近访问时间淘汰
+        :param max_bytes: 最大缓存字节数（按响应内容计算）
+        :param evict_every: 每写入多少条检查一次淘汰
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._writes_since_evict = 0
+
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed)"
+        )
+
+    @property
+    def readable(self):
+        return self.mode in ("read_write", "read_only")
+
+    @property
+    def writable(self):
+        return self.mode in ("read_write", "write_only")
+
+    def get(self, model, prompt, temperature, num_gen):
+        """查询缓存，未命中（或已过期）返回 None"""
+        if not self.readable:
+            return None
+        key = make_cache_key(model, prompt, temperature, num_gen)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, model, prompt, temperature, num_gen, response):
+        """写入缓存（覆盖同 key 的旧结果）"""
+        if not self.writable or response is None:
+            return
+        self.put_by_key(make_cache_key(model, prompt, temperature, num_gen), model, response)
+
+    def put_by_key(self, key, model, response):
+        """按已计算好的 key 写入缓存（用于回填批处理结果）"""
+        value = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, len(value.encode("utf-8")), now, now),
+            )
+            self.writes += 1
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_every:
+                self._writes_since_evict = 0
+                self._evict()
+
+    def _evict(self):
+        """按 TTL 清理过期数据，再按最近访问时间淘汰超出容量的数据（调用方需持有锁）"""
+        if self.ttl is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl,)
+            )
+            self.evictions += cursor.rowcount
+
+        if self.max_entries is not None:
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY accessed ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.evictions += cursor.rowcount
+
+        if self.max_bytes is not None:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                overflow = total - self.max_bytes
+                freed = 0
+                stale_keys = []
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM llm_cache ORDER BY accessed ASC"
+                ):
+                    stale_keys.append((key,))
+                    freed += size
+                    if freed >= overflow:
+                        break
+                self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale_keys)
+                self.evictions += len(stale_keys)
+
+    def evict(self):
+        """手动触发一次淘汰"""
+        with self._lock:
+            self._evict()
+
+    def stats(self):
+        """返回命中率等统计信息"""
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,244 @@
+"""
+LLM 输出的 JSON 解析：一次扫描提取 JSON 主体，并在本地修复常见缺陷，尽量避免因格式问题重新请求模型。
+
+解析顺序（前一步成功即返回）：
+1. 去掉 ```json 代码块标记后直接 json.loads（绝大多数输出走这条快速路径）
+2. 提取第一个完整的 JSON 对象/数组（忽略前后的解释文字）
+3. 本地修复后解析：尾逗号、单引号字符串、字符串中未转义的换行与引号、
+   Python 字面量（True/False/None）、输出被截断（补齐括号，丢弃不完整的末尾元素）
+
+parse_structured 在此基础上按 pydantic schema 校验，各 schema 的校验器只编译一次。
+"""
+import re
+import json
+import functools
+
+from pydantic import TypeAdapter
+
+_CODE_FENCE = re.compile(r"```(?:json|JSON)?")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def strip_code_fence(text):
+    """去掉 markdown 代码块标记及首尾空白"""
+    return _CODE_FENCE.sub("", text).strip()
+
+
+def extract_json_payload(text, expect=None):
+    """
+    提取 text 中第一个 JSON 对象或数组（按括号配对，跳过字符串内的括号）。
+    输出被截断、括号未闭合时返回从起始括号到末尾的内容。
+
+    :param expect: dict 或 list，只查找对应类型的起始括号；None 表示两者皆可
+    :return: JSON 文本，找不到起始括号时返回 None
+    """
+    if expect is dict:
+        start = text.find("{")
+    elif expect is list:
+        start = text.find("[")
+    else:
+        starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+        start = min(starts) if starts else -1
+    if start == -1:
+        return None
+
+    depth = 0
+    quote = None
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+        i += 1
+    return text[start:]
+
+
+def _closes_string(text, pos):
+    """引号后（跳过空白）紧跟结构字符或文本结束时，视为字符串的结束引号"""
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos >= len(text) or text[pos] in ",:}]"
+
+
+def _drop_trailing_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _close(out, stack):
+    return "".join(out) + "".join(_CLOSERS[b] for b in reversed(stack))
+
+
+def repair_json(payload):
+    """
+    单次扫描修复常见的 JSON 格式缺陷，返回修复后的文本（无法修复时返回尽力修复的结果）。
+    - 尾逗号：[1, 2,] / {"a": 1,}
+    - 单引号字符串：{'a': 'b'}
+    - 字符串中的原始换行、制表符，以及未转义的双引号（如 "什么是"碳汇"？"）
+    - Python 字面量 True / False / None
+    - 截断：补齐未闭合的字符串与括号，仍无法解析时回退到最后一个完整元素
+    """
+    out = []
+    stack = []
+    # 可安全截断的位置：(输出长度, 当时的括号栈)，用于丢弃被截断的末尾元素
+    safe_points = []
+    quote = None
+    i, n = 0, len(payload)
+
+    while i < n:
+        ch = payload[i]
+        if quote:
+            if ch == "\\" and i + 1 < n:
+                nxt = payload[i + 1]
+                # JSON 中 \' 不是合法转义
+                out.append("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote and _closes_string(payload, i + 1):
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\r":
+                out.append("\\r")
+            elif ch == "\t":
+                out.append("\\t")
+            else:
+                out.append(ch)
+        elif ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            safe_points.append((len(out), list(stack)))
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack and _CLOSERS[stack[-1]] == ch:
+                stack.pop()
+            out.append(ch)
+        elif ch == ",":
+            safe_points.append((len(out), list(stack)))
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and (payload[j].isalnum() or payload[j] == "_"):
+                j += 1
+            word = payload[i:j]
+            out.append(_PY_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote:
+        out.append('"')
+    _drop_trailing_comma(out)
+    repaired = _close(out, stack)
+    if not stack:
+        return repaired
+
+    # 截断的输出：先尝试直接补齐括号，失败则回退到最近的完整元素
+    try:
+        json.loads(repaired)
+        return repaired
+    except json.JSONDecodeError:
+        pass
+    for length, snapshot in reversed(safe_points):
+        head = out[:length]
+        _drop_trailing_comma(head)
+        candidate = _close(head, snapshot)
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    return repaired
+
+
+def parse_json(text, expect=None):
+    """
+    解析 LLM 输出中的 JSON。
+
+    :param text: 模型原始输出
+    :param expect: dict 或 list，期望的顶层类型；不匹配时视为解析失败
+    :return: 解析结果
+    :raises json.JSONDecodeError: 本地修复后仍无法解析（调用方可据此决定是否重新请求）
+    """
+    cleaned = strip_code_fence(text)
+    candidates = [lambda: cleaned]
+    payload = None
+
+    def payload_text():
+        nonlocal payload
+        if payload is None:
+            payload = extract_json_payload(cleaned, expect) or cleaned
+        return payload
+
+    candidates.append(payload_text)
+    candidates.append(lambda: repair_json(payload_text()))
+
+    error = None
+    for candidate in candidates:
+        try:
+            parsed = json.loads(candidate())
+        except json.JSONDecodeError as e:
+            error = e
+            continue
+        if expect is None or isinstance(parsed, expect):
+            return parsed
+        error = json.JSONDecodeError(f"Expected {expect.__name__}", cleaned, 0)
+    raise error
+
+
+def try_parse_json(text, expect=None, default=None):
+    """parse_json 的不抛异常版本，解析失败返回 default"""
+    try:
+        return parse_json(text, expect)
+    except json.JSONDecodeError:
+        return default
+
+
+@functools.lru_cache(maxsize=None)
+def schema_validator(schema):
+    """schema（pydantic 模型或 List[...] 等类型）对应的校验器，编译结果按 schema 缓存"""
+    return TypeAdapter(schema)
+
+
+def parse_structured(text, schema):
+    """
+    解析 LLM 输出并按 schema 校验。
+
+    :return: 校验后的对象（pydantic 模型实例或对应类型）
+    :raises ValueError: JSON 无法解析（json.JSONDecodeError）或不符合 schema（pydantic.ValidationError）
+    """
+    expect = list if getattr(schema, "__origin__", None) is list else None
+    return schema_validator(schema).validate_python(parse_json(text, expect))
+
+
+def is_valid_structured(text, schema):
+    """text 能否解析为符合 schema 的结果（用作 run_agent 的 validate）"""
+    if not isinstance(text, str):
+        return False
+    try:
+        parse_structured(text, schema)
+        return True
+    except ValueError:
+        return False
@@ -0,0 +1,156 @@
+import time
+import random
+import threading
+
+from utils.retry import CircuitOpenError, get_circuit_breaker, is_retryable_error
+
+
+class Endpoint:
+    """
+    端点池中的一个 OpenAI 兼容端点。
+    name 同时是 LLM_PROVIDERS 中的服务商名称，客户端、限流器、熔断器都按 name 独立维护。
+    """
+
+    def __init__(self, name, weight=1.0, models=None, latency_alpha=0.2, initial_latency=1.0,
+                 failure_penalty=10.0):
+        """
+        :param name: 服务商名称（需已注册到 LLM_PROVIDERS）
+        :param weight: 权重，越大分到的流量越多
+        :param models: 逻辑模型名到该端点实际模型名的映射，如 {"qwen-plus": "qwen2.5-72b-instruct"}
+        :param latency_alpha: 延迟指数滑动平均系数
+        :param initial_latency: 尚无样本时假设的延迟（秒）
+        :param failure_penalty: 请求失败时按该延迟（秒）计入平均，降低其被选中的概率
+        """
+        self.name = name
+        self.weight = float(weight)
+        self.models = models or {}
+        self.latency_alpha = latency_alpha
+        self.latency = initial_latency
+        self.failure_penalty = failure_penalty
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def prepare(self, request):
+        """按端点的模型映射改写请求中的模型名"""
+        model = self.models.get(request.get("model"))
+        if model is None:
+            return request
+        return dict(request, model=model)
+
+    def score(self):
+        """负载分数：在途请求数 × 平均延迟 / 权重，越小越优先"""
+        return (self.in_flight + 1) * self.latency / self.weight
+
+    def healthy(self):
+        return get_circuit_breaker(self.name).state != "open"
+
+
+class EndpointPool:
+    """
+    一个逻辑服务商对应的加权端点池：
+    - 优先选择健康且负载分数最低的端点（分数相同随机打散）
+    - 端点出错（网络/超时/429/5xx）或熔断时自动切换到下一个端点
+    - 参数错误等不可重试的异常直接抛出
+    """
+
+    def __init__(self, name, endpoints):
+        if not endpoints:
+            raise ValueError(f"Endpoint pool {name} is empty")
+        self.name = name
+        self.endpoints = list(endpoints)
+        self._lock = threading.Lock()
+
+    def ranked(self):
+        """按 (是否熔断, 负载分数) 排序的端点列表"""
+        with self._lock:
+            return sorted(
+                self.endpoints,
+                key=lambda e: (not e.healthy(), e.score(), random.random()),
+            )
+
+    def _start(self, endpoint):
+        with self._lock:
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+        return time.monotonic()
+
+    def _finish(self, endpoint, start, failed):
+        """
+        请求结束后更新端点状态。
+        failed 为 None 表示请求被取消（如对冲中落后的请求）或不是端点本身的故障（熔断未发出、400 参数错误等）：
+        只归还在途数，不计失败也不计入延迟
+        """
+        elapsed = time.monotonic() - start
+        with self._lock:
+            endpoint.in_flight -= 1
+            if failed is None:
+                return
+            if failed:
+                endpoint.failures += 1
+                elapsed = max(elapsed, endpoint.failure_penalty)
+            endpoint.latency += endpoint.latency_alpha * (elapsed - endpoint.latency)
+
+    def _should_failover(self, exc):
+        return isinstance(exc, CircuitOpenError) or is_retryable_error(exc)
+
+    @staticmethod
+    def _upstream_failure(exc):
+        """端点本身的故障（网络/超时/429/5xx），计入失败与延迟惩罚；熔断时请求并未发出"""
+        return not isinstance(exc, CircuitOpenError) and is_retryable_error(exc)
+
+    def call(self, fn):
+        """依次在端点上执行 fn(endpoint)，返回第一个成功的结果"""
+        error = None
+        for endpoint in self.ranked():
+            start = self._start(endpoint)
+            failed = None
+            try:
+                result = fn(endpoint)
+                failed = False
+            except Exception as e:
+                failed = True if self._upstream_failure(e) else None
+                if not self._should_failover(e):
+                    raise
+                error = e
+                continue
+            finally:
+                self._finish(endpoint, start, failed)
+            return result
+        raise error
+
+    async def call_async(self, fn):
+        """call 的异步版本，fn(endpoint) 返回协程"""
+        error = None
+        for endpoint in self.ranked():
+            start = self._start(endpoint)
+            failed = None
+            try:
+                result = await fn(endpoint)
+                failed = False
+            except Exception as e:
+                failed = True if self._upstream_failure(e) else None
+                if not self._should_failover(e):
+                    raise
+                error = e
+                continue
+            finally:
+                self._finish(endpoint, start, failed)
+            return result
+        raise error
+
+    def stats(self):
+        """各端点的请求数、失败数、在途数与平均延迟"""
+        with self._lock:
+            return [
+                {
+                    "endpoint": e.name,
+                    "weight": e.weight,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                    "in_flight": e.in_flight,
+                    "latency": round(e.latency, 3),
+                    "healthy": e.healthy(),
+                }
+                for e in self.endpoints
+            ]
@@ -0,0 +1,129 @@
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StagePipeline:
+    """
+    多阶段流水线：每个阶段一个线程池（自带任务队列），条目完成一个阶段后立即提交到下一阶段，
+    各阶段同时工作，条目无需等待整批数据完成上一阶段。
+    - stages: [(name, fn, workers)]，fn(item) 返回处理后的 item；各阶段并发数单独设置
+    - max_pending: 同时在流水线中的条目数上限，submit 在窗口已满时阻塞（背压），内存占用与输入规模无关
+    - on_done(item): 条目完成路由中的全部阶段后调用
+    - on_error(item, stage, exc): 某阶段抛出异常时调用，条目不再进入后续阶段
+    回调在工作线程中执行，需自行保证线程安全。
+    """
+
+    def __init__(self, stages, max_pending=16, on_done=None, on_error=None):
+        self._stages = {}
+        self._stats = {}
+        for name, fn, workers in stages:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"stage-{name}")
+            self._stages[name] = (fn, executor, workers)
+            self._stats[name] = {"processed": 0, "failed": 0, "busy": 0.0}
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.completed = 0
+        self.failed = 0
+        self._latency_total = 0.0
+        self._started = time.perf_counter()
+
+        self._window = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+
+    def submit(self, item, route):
+        """
+        提交条目，按 route（阶段名列表）依次处理；route 为空时直接完成。
+        """
+        route = list(route)
+        for name in route:
+            if name not in self._stages:
+                raise ValueError(f"unknown stage: {name}")
+        self._window.acquire()
+        with self._lock:
+            self._pending += 1
+        if not route:
+            self._finish(item, None, time.perf_counter())
+            return
+        self._dispatch(item, route, 0, time.perf_counter())
+
+    def _dispatch(self, item, route, index, started):
+        _, executor, _ = self._stages[route[index]]
+        executor.submit(self._run, item, route, index, started)
+
+    def _run(self, item, route, index, started):
+        name = route[index]
+        fn = self._stages[name][0]
+        begin = time.perf_counter()
+        try:
+            item = fn(item)
+        except Exception as e:
+            with self._lock:
+                self._stats[name]["failed"] += 1
+                self._stats[name]["busy"] += time.perf_counter() - begin
+            self._finish(item, (name, e), started)
+            return
+        with self._lock:
+            self._stats[name]["processed"] += 1
+            self._stats[name]["busy"] += time.perf_counter() - begin
+
+        if index + 1 < len(route):
+            self._dispatch(item, route, index + 1, started)
+        else:
+            self._finish(item, None, started)
+
+    def _finish(self, item, error, started):
+        """条目离开流水线：调用回调并释放窗口（回调异常不影响其他条目）"""
+        try:
+            if error is None:
+                if self.on_done is not None:
+                    self.on_done(item)
+            elif self.on_error is not None:
+                self.on_error(item, *error)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                if error is None:
+                    self.completed += 1
+                    self._latency_total += time.perf_counter() - started
+                else:
+                    self.failed += 1
+                self._pending -= 1
+                self._idle.notify_all()
+            self._window.release()
+
+    def join(self):
+        """等待所有已提交的条目离开流水线并关闭各阶段线程池"""
+        with self._idle:
+            while self._pending:
+                self._idle.wait()
+        for _, executor, _ in self._stages.values():
+            executor.shutdown()
+
+    def stats(self):
+        """各阶段处理数、失败数、平均耗时与利用率（忙碌时间 / (线程数 × 运行时间)），以及条目端到端平均耗时"""
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            stages = {}
+            for name, (_, _, workers) in self._stages.items():
+                stat = self._stats[name]
+                done = stat["processed"] + stat["failed"]
+                stages[name] = {
+                    "workers": workers,
+                    "processed": stat["processed"],
+                    "failed": stat["failed"],
+                    "mean_seconds": round(stat["busy"] / done, 3) if done else None,
+                    "utilization": round(stat["busy"] / (workers * elapsed), 3) if elapsed else None,
+                }
+            return {
+                "completed": self.completed,
+                "failed": self.failed,
+                "mean_latency": round(self._latency_total / self.completed, 3) if self.completed else None,
+                "elapsed": round(elapsed, 3),
+                "stages": stages,
+            }
@@ -0,0 +1,164 @@
+import re
+import csv
+import random
+import threading
+
+
+_CJK = re.compile(r"[一-鿿]+")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_ANSWER_INDEX = {"A": 0, "B": 1, "C": 2, "D": 3}
+_OPTION_PREFIX = re.compile(r"^\s*[A-Da-d]\s*[.、．:：)）]\s*")
+# 出题常用的设问词，不要求出现在原文中
+_QUESTION_WORDS = {
+    "下列", "列哪", "哪一", "一项", "项是", "哪些", "以下", "什么", "为什", "为何", "如何", "简述", "述一",
+    "请简", "请说", "说明", "分析", "讨论", "正确", "错误", "说法", "描述", "属于", "不属", "的是", "是什",
+}
+
+
+def lexical_tokens(text):
+    """词面特征：中文取相邻二字组，英文/数字取小写单词"""
+    tokens = set()
+    for run in _CJK.findall(text or ""):
+        if len(run) == 1:
+            tokens.add(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.update(word.lower() for word in _WORD.findall(text or ""))
+    return tokens
+
+
+def _coverage(part, whole):
+    """part 中出现在 whole 里的比例；part 为空时为 0"""
+    return len(part & whole) / len(part) if part else 0.0
+
+
+def split_question(question_data):
+    """
+    拆出试题各部分，返回 (题干, 选项列表, 答案)。
+    选择题的 response 为 CSV 行："题干",A,B,C,D,答案字母；简答/讨论题为 {"question", "answer"}。
+    """
+    response = question_data.get("response", "")
+    if question_data.get("question_type") == "multiple_choice":
+        fields = next(csv.reader([response])) if isinstance(response, str) and response else []
+        if len(fields) < 2:
+            return response if isinstance(response, str) else "", [], ""
+        return fields[0], fields[1:-1], fields[-1].strip()
+    if isinstance(response, dict):
+        return response.get("question", ""), [], response.get("answer", "")
+    return str(response), [], ""
+
+
+class QuestionPrescreen:
+    """
+    专家评估前的本地预筛：明显合格的试题直接通过，不调用 LLM 评估。
+    - grounding: 试题（题干、选项、答案）词面出现在原文中的比例，衡量是否基于原文
+    - knowledge_coverage: 知识点词面在试题中出现的比例，衡量是否考查了该知识点
+    - issues: 格式问题（选择题选项不足/重复、答案字母无效、题干或答案过短等），有问题的不通过
+    - audit_rate: 通过的试题中仍交给 LLM 评估的比例，用于校准（见 tools/calibrate_prescreen.py），1.0 为只记录不跳过
+    """
+
+    def __init__(self, min_grounding=0.6, min_knowledge=0.3, min_question_len=6,
+                 min_answer_len=2, audit_rate=0.0, seed=None):
+        self.min_grounding = min_grounding
+        self.min_knowledge = min_knowledge
+        self.min_question_len = min_question_len
+        self.min_answer_len = min_answer_len
+        self.audit_rate = audit_rate
+
+        self.screened = 0
+        self.passed = 0
+        self.audited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def features(self, text, question_data):
+        """计算预筛特征，不更新统计"""
+        question, options, answer = split_question(question_data)
+        issues = []
+
+        if len(question.strip()) < self.min_question_len:
+            issues.append("question_too_short")
+        if question_data.get("question_type") == "multiple_choice":
+            cleaned = [_OPTION_PREFIX.sub("", option).strip() for option in options]
+            if len(cleaned) != 4 or not all(cleaned):
+                issues.append("options_invalid")
+            elif len(set(cleaned)) < 4:
+                issues.append("options_duplicated")
+            index = _ANSWER_INDEX.get(answer.upper())
+            if index is None:
+                issues.append("answer_letter_invalid")
+            # 干扰项本就可以不出自原文，只统计题干与正确选项
+            correct = cleaned[index] if index is not None and index < len(cleaned) else ""
+            content = [question, correct]
+        else:
+            if len(answer.strip()) < self.min_answer_len:
+                issues.append("answer_too_short")
+            elif answer.strip() == question.strip():
+                issues.append("answer_repeats_question")
+            content = [question, answer]
+
+        item_tokens = lexical_tokens(" ".join(content)) - _QUESTION_WORDS
+        return {
+            "grounding": round(_coverage(item_tokens, lexical_tokens(text)), 4),
+            "knowledge_coverage": round(
+                _coverage(lexical_tokens(question_data.get("knowledge", "")), item_tokens), 4
+            ),
+            "issues": issues,
+        }
+
+    def decide(self, features, min_grounding=None, min_knowledge=None):
+        """按阈值判断是否通过（校准时可传入其它阈值）"""
+        min_grounding = self.min_grounding if min_grounding is None else min_grounding
+        min_knowledge = self.min_knowledge if min_knowledge is None else min_knowledge
+        return (
+            not features["issues"]
+            and features["grounding"] >= min_grounding
+            and features["knowledge_coverage"] >= min_knowledge
+        )
+
+    def screen(self, text, question_data):
+        """
+        预筛一道试题，返回特征及判定：
+        - passed: 是否明显合格
+        - audit: 通过但仍需 LLM 评估（抽样校准）
+        """
+        result = self.features(text, question_data)
+        result["passed"] = self.decide(result)
+        with self._lock:
+            self.screened += 1
+            result["audit"] = result["passed"] and self._rng.random() < self.audit_rate
+            if result["passed"]:
+                self.passed += 1
+            if result["audit"]:
+                self.audited += 1
+        return result
+
+    def skips(self, result):
+        """预筛结果是否可以跳过 LLM 评估"""
+        return result is not None and result["passed"] and not result["audit"]
+
+    @staticmethod
+    def feedback(result):
+        """
+        跳过 LLM 评估的试题的评估结果（字段与 ExpertAgent.evaluate_quality 一致）。
+        各项评分为 None 表示未评分，下游按评分筛选时应予保留（见 tools/analysis/low_relevance_extractor.py）
+        """
+        return {
+            "requires_refinement": False,
+            "delete_data": False,
+            "quality_score": None,
+            "relevance_score": None,
+            "consistency_score": None,
+            "improvement_suggestions": "",
+            "prescreen": result,
+        }
+
+    def stats(self):
+        with self._lock:
+            skipped = self.passed - self.audited
+            return {
+                "screened": self.screened,
+                "passed": self.passed,
+                "audited": self.audited,
+                "skipped": skipped,
+                "skip_rate": skipped / self.screened if self.screened else 0.0,
+            }
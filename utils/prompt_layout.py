@@ -0,0 +1,32 @@
+"""
+前缀缓存友好的 prompt 组装。
+
+同一篇语料会触发多次调用（抽取知识点、逐点出题、改写……），各模板中语料占位符的位置各不相同，
+服务端的前缀缓存（DashScope/OpenAI 上下文缓存、vLLM prefix caching）因此无法复用 prefill。
+这里把语料统一放在 prompt 开头，生成逐字节相同的前缀，模板中原来的占位符替换为引用说明，
+每次调用的差异部分（知识点、题型、试题等）都位于前缀之后。
+"""
+
+CONTEXT_HEADER = "# 📚 参考资料\n"
+CONTEXT_REFERENCE = "（见开头的“参考资料”）"
+
+
+def context_prefix(context):
+    """同一篇语料的共享前缀（逐字节相同）"""
+    return f"{CONTEXT_HEADER}{context}\n\n"
+
+
+def build_prompt(template, context_field, context, **fields):
+    """
+    组装 prompt：语料作为共享前缀，其余字段按模板填充。
+    模板中不含语料占位符时按原样填充，不额外增加前缀。
+
+    :param template: prompts/ 中的模板
+    :param context_field: 模板中语料的占位符名称（如 "full_text"、"text"）
+    :param context: 语料内容
+    :param fields: 其余模板字段
+    """
+    if "{" + context_field + "}" not in template:
+        return template.format(**{context_field: context}, **fields)
+    body = template.format(**{context_field: CONTEXT_REFERENCE}, **fields)
+    return context_prefix(context) + body.lstrip("\n")
@@ -0,0 +1,238 @@
+import time
+import asyncio
+import threading
+from collections import deque
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶。
+    rate_per_min 为每分钟补充的令牌数，capacity 为桶容量（允许的突发量）。
+    允许余额为负（用于按实际 token 用量事后结算），欠额会推迟后续请求。
+    """
+
+    def __init__(self, rate_per_min, capacity=None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        预占 amount 个令牌，返回需要等待的秒数（0 表示可立即执行）。
+        单次请求超过桶容量时按容量计算，避免永久阻塞。
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def adjust(self, delta):
+        """事后结算：delta > 0 表示多扣，delta < 0 表示返还"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+def estimate_tokens(text):
+    """粗略估计 token 数（中文约 1 字 1 token，作为偏保守的预估）"""
+    return max(1, len(text))
+
+
+def is_rate_limit_error(exc):
+    """判断异常是否为服务端限流（HTTP 429）"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(exc):
+    """读取限流响应中的 Retry-After 头，没有时返回 None"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AdaptiveRateLimiter:
+    """
+    单个服务商的自适应限流器：
+    - 令牌桶限制每分钟请求数（rpm）与每分钟 token 数（tpm）
+    - 并发上限按 AIMD 自动调节：成功时加性增加，遇到 429 时乘性减少
+    """
+
+    def __init__(self, name, rpm=None, tpm=None, max_concurrency=64, min_concurrency=1,
+                 initial_concurrency=None, increase=1.0, decrease=0.5, cooldown=5.0):
+        """
+        :param name: 服务商名称
+        :param rpm: 每分钟请求数上限，None 表示不限
+        :param tpm: 每分钟 token 数上限，None 表示不限
+        :param max_concurrency: 并发上限的最大值
+        :param min_concurrency: 并发上限的最小值
+        :param initial_concurrency: 初始并发上限，默认等于 max_concurrency
+        :param increase: 每个“窗口”（约等于当前并发数个成功请求）增加的并发数
+        :param decrease: 遇到限流时并发上限的乘性系数
+        :param cooldown: 遇到限流后暂停发送新请求的时间（秒），同一冷却期内只降一次
+        """
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self.limit = float(initial_concurrency or max_concurrency)
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._cooldown_until = 0.0
+        self._request_bucket = TokenBucket(rpm) if rpm else None
+        self._token_bucket = TokenBucket(tpm) if tpm else None
+        # 最近 60 秒完成的请求 (时间戳, token 数)，用于计算实际速率
+        self._recent = deque()
+        self._cond = threading.Condition()
+
+    # ---- 准入 ---- #
+    def _try_enter(self):
+        """尝试占用一个并发槽位，返回需要等待的秒数（None 表示已占用成功）"""
+        now = time.monotonic()
+        if now < self._cooldown_until:
+            return self._cooldown_until - now
+        if self.in_flight >= int(self.limit):
+            return 0.05
+        self.in_flight += 1
+        return None
+
+    def _reserve_budget(self, est_tokens):
+        wait = 0.0
+        if self._request_bucket is not None:
+            wait = max(wait, self._request_bucket.reserve(1))
+        if self._token_bucket is not None:
+            wait = max(wait, self._token_bucket.reserve(est_tokens))
+        return wait
+
+    def acquire(self, est_tokens=1):
+        """阻塞直到获得并发槽位和 rpm/tpm 预算"""
+        with self._cond:
+            while True:
+                wait = self._try_enter()
+                if wait is None:
+                    break
+                self._cond.wait(timeout=wait)
+        time.sleep(self._reserve_budget(est_tokens))
+
+    async def acquire_async(self, est_tokens=1):
+        """acquire 的异步版本；等待预算时被取消则归还槽位与预占的预算"""
+        while True:
+            with self._cond:
+                wait = self._try_enter()
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
+        try:
+            await asyncio.sleep(self._reserve_budget(est_tokens))
+        except BaseException:
+            self.cancel(est_tokens)
+            raise
+
+    # ---- 结算 ---- #
+    def release(self, est_tokens=1, used_tokens=None, throttled=False, failed=False):
+        """
+        请求结束后调用：
+        - used_tokens: 实际消耗的 token 数，用于修正 tpm 预算
+        - throttled: 本次请求是否被服务端限流
+        - failed: 本次请求因其它错误失败（不参与并发上限调节）
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if throttled:
+                self.throttles += 1
+                if now >= self._cooldown_until:
+                    # 乘性减少（同一冷却期内的多个 429 只降一次）
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease)
+                    self._cooldown_until = now + self.cooldown
+            elif not failed:
+                self.successes += 1
+                # 加性增加：约每完成 limit 个请求并发上限 +increase
+                self.limit = min(self.max_concurrency, self.limit + self.increase / self.limit)
+                tokens = used_tokens if used_tokens is not None else est_tokens
+                self._recent.append((now, tokens))
+            self._trim(now)
+            self._cond.notify_all()
+
+        if self._token_bucket is not None and used_tokens is not None:
+            self._token_bucket.adjust(used_tokens - est_tokens)
+
+    def cancel(self, est_tokens=1):
+        """已占用槽位但请求未发出时调用：归还槽位与预占的 rpm/tpm 预算，不参与并发上限调节"""
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify_all()
+        if self._request_bucket is not None:
+            self._request_bucket.adjust(-1)
+        if self._token_bucket is not None:
+            self._token_bucket.adjust(-min(est_tokens, self._token_bucket.capacity))
+
+    def backoff(self, seconds):
+        """服务端通过 Retry-After 指定等待时间时，延长冷却期"""
+        with self._cond:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+    def _trim(self, now):
+        while self._recent and now - self._recent[0][0] > 60:
+            self._recent.popleft()
+
+    def current_rate(self):
+        """返回当前的实际速率与并发状态"""
+        with self._cond:
+            self._trim(time.monotonic())
+            return {
+                "provider": self.name,
+                "requests_per_min": len(self._recent),
+                "tokens_per_min": sum(tokens for _, tokens in self._recent),
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "throttles": self.throttles,
+            }
+
+
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(provider):
+    """获取服务商共享的限流器，不存在时按默认参数创建"""
+    limiter = _RATE_LIMITERS.get(provider)
+    if limiter is None:
+        with _RATE_LIMITERS_LOCK:
+            limiter = _RATE_LIMITERS.setdefault(provider, AdaptiveRateLimiter(provider))
+    return limiter
+
+
+def configure_rate_limit(provider, **kwargs):
+    """为服务商设置限流参数（rpm / tpm / max_concurrency 等），替换原有限流器"""
+    limiter = AdaptiveRateLimiter(provider, **kwargs)
+    with _RATE_LIMITERS_LOCK:
+        _RATE_LIMITERS[provider] = limiter
+    return limiter
+
+
+def rate_limit_report():
+    """所有服务商限流器的当前状态"""
+    return [limiter.current_rate() for limiter in list(_RATE_LIMITERS.values())]
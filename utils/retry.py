@@ -0,0 +1,173 @@
+import time
+import random
+import asyncio
+import threading
+
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被快速失败"""
+
+
+class RetryExhaustedError(Exception):
+    """重试次数用尽后仍然失败"""
+
+
+# 可重试的 HTTP 状态码：超时、冲突、限流及服务端错误
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def get_status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable_error(exc):
+    """
+    判断异常是否值得重试：
+    - 网络连接错误、超时
+    - 408/409/429/5xx
+    其余（如 400 参数错误、401 鉴权失败）直接抛出。
+    """
+    if isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    if type(exc).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    status = get_status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return False
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试策略（full jitter）"""
+
+    def __init__(self, max_attempts=6, base_delay=1.0, max_delay=60.0, jitter=True):
+        """
+        :param max_attempts: 最大尝试次数（含第一次）
+        :param base_delay: 首次重试的基础等待时间（秒）
+        :param max_delay: 单次等待上限（秒）
+        :param jitter: 是否在 [0, 退避时间] 内随机抖动，避免大量线程同时重试
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """第 attempt 次失败（从 0 开始）后的等待时间"""
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+class CircuitBreaker:
+    """
+    服务商级熔断器：
+    - closed: 正常放行，连续失败达到阈值后打开
+    - open: 快速失败，recovery_timeout 秒后进入 half_open
+    - half_open: 只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """检查是否放行请求，不放行时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    raise CircuitOpenError(f"{self.name} 熔断中，请求被快速失败")
+                self.state = "half_open"
+                self._probing = False
+            # half_open：同一时间只允许一个探测请求
+            if self._probing:
+                raise CircuitOpenError(f"{self.name} 熔断探测中，请求被快速失败")
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"⚠️ {self.name} 连续失败 {self.failures} 次，熔断 {self.recovery_timeout}s")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """探测请求以非服务端原因结束时释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_circuit_breaker(provider):
+    """获取服务商共享的熔断器"""
+    breaker = _BREAKERS.get(provider)
+    if breaker is None:
+        with _BREAKERS_LOCK:
+            breaker = _BREAKERS.setdefault(provider, CircuitBreaker(provider))
+    return breaker
+
+
+def configure_circuit_breaker(provider, **kwargs):
+    """为服务商设置熔断参数（failure_threshold / recovery_timeout）"""
+    breaker = CircuitBreaker(provider, **kwargs)
+    with _BREAKERS_LOCK:
+        _BREAKERS[provider] = breaker
+    return breaker
+
+
+def call_with_retry(fn, policy=DEFAULT_RETRY_POLICY, retryable=is_retryable_error, name=""):
+    """
+    按重试策略调用 fn()，仅对 retryable(exc) 为真的异常重试。
+    重试用尽后抛出 RetryExhaustedError（保留原始异常为 __cause__）。
+    """
+    for attempt in range(policy.max_attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if not retryable(e):
+                raise
+            if attempt == policy.max_attempts - 1:
+                raise RetryExhaustedError(f"{name} 重试 {policy.max_attempts} 次后仍失败: {e}") from e
+            wait = policy.delay(attempt)
+            print(f"{name} 调用失败（{type(e).__name__}: {e}），{wait:.1f}s 后第 {attempt + 1} 次重试")
+            time.sleep(wait)
+
+
+async def call_with_retry_async(fn, policy=DEFAULT_RETRY_POLICY, retryable=is_retryable_error, name=""):
+    """call_with_retry 的异步版本，fn 为返回协程的函数"""
+    for attempt in range(policy.max_attempts):
+        try:
+            return await fn()
+        except Exception as e:
+            if not retryable(e):
+                raise
+            if attempt == policy.max_attempts - 1:
+                raise RetryExhaustedError(f"{name} 重试 {policy.max_attempts} 次后仍失败: {e}") from e
+            await asyncio.sleep(policy.delay(attempt))
@@ -1,5 +1,6 @@
 import re
 from utils.global_methods import *
+from utils.llm_json import parse_json
 from pydantic import BaseModel, ValidationError
 from typing import Optional
 
@@ -39,12 +40,9 @@ def extract_grading_result(grading_response):
     """从非标准JSON格式的字符串中提取评分和反馈信息"""
     """尝试用 Pydantic 模型解析结果"""
     try:
-        # 尝试解析为 JSON
-        grading_response = re.sub(r"```json", "", grading_response)  # 移除 ```json
-        grading_response = re.sub(r"```", "", grading_response)  # 移除 ```
-        grading_response = grading_response.strip()  # 移除首尾空格和换行符
-        return GradingResult.parse_raw(grading_response).dict()
-    except ValidationError:
+        # 提取 JSON 并在本地修复格式缺陷
+        return GradingResult.model_validate(parse_json(grading_response, expect=dict)).dict()
+    except (json.JSONDecodeError, ValidationError):
         print("Pydantic 无法解析，尝试正则表达式...")
         try:
             score_match = re.search(
@@ -297,17 +295,9 @@ def parse_output(evaluation_response):
         "improvement_suggestions": None,
     }
 
-    # 提取 JSON 部分
-    json_match = re.search(r"```json\n(.*?)\n```", evaluation_response, re.S)
-    if json_match:
-        cleaned_response = json_match.group(1).strip()
-    else:
-        # 如果没有找到 JSON 部分，清理 Markdown 格式标记（```json）以及多余的换行符和空格
-        cleaned_response = re.sub(r"```json\n?|```", "", evaluation_response).strip()
-
     try:
-        # 尝试直接解析 JSON 格式
-        evaluation_data = json.loads(cleaned_response)
+        # 提取 JSON 部分（兼容 Markdown 包裹与前后说明文字），并在本地修复格式缺陷
+        evaluation_data = parse_json(evaluation_response, expect=dict)
         result["quality_score"] = int(evaluation_data.get("Quality Score", 0))
         result["relevance_score"] = int(evaluation_data.get("Relevance Score", 0))
         result["consistency_score"] = int(evaluation_data.get("Consistency Score", 0))
@@ -0,0 +1,196 @@
+import csv
+import json
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+# 当前调用链上的标签（agent / step / entry_id），线程与协程各自独立
+_USAGE_TAGS = contextvars.ContextVar("usage_tags", default={})
+
+# 各模型每 1k token 的价格（元）：(输入, 输出)，未列出的模型不计费用
+DEFAULT_PRICES = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.02, 0.06),
+}
+
+
+@contextmanager
+def usage_tags(**tags):
+    """在 with 块内为所有 LLM 调用附加标签，例如 usage_tags(step=1, entry_id=...)"""
+    token = _USAGE_TAGS.set({**_USAGE_TAGS.get(), **tags})
+    try:
+        yield
+    finally:
+        _USAGE_TAGS.reset(token)
+
+
+def current_tags():
+    return _USAGE_TAGS.get()
+
+
+def track_usage(agent=None, **tags):
+    """
+    装饰器：函数内的 LLM 调用记入指定标签。
+    agent 默认取函数的 __qualname__（如 QuestionSetter.extract_knowledge_points），
+    支持 async 函数，*_async 版本与同步版本记为同一个 agent。
+    """
+    def decorator(func):
+        name = agent or func.__qualname__.removesuffix("_async")
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with usage_tags(agent=name, **tags):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with usage_tags(agent=name, **tags):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def _hit_rate(cached_tokens, prompt_tokens):
+    """前缀缓存命中率，只统计服务端返回了 cached_tokens 的调用；都没有返回时为 None"""
+    return cached_tokens / prompt_tokens if prompt_tokens else None
+
+
+class UsageTracker:
+    """
+    记录每次 LLM 调用的 token 用量与延迟，并按 agent / step / model / provider / entry 汇总。
+    - 只保留各分组的累计值，内存占用与调用次数无关
+    - 服务端返回 cached_tokens 时统计前缀缓存命中率（prefix_hit_rate）
+    - 给出 csv_path 时逐条写入原始记录（不在内存中缓存），汇总报告导出为 JSON
+    """
+
+    FIELDS = ["time", "agent", "step", "entry_id", "provider", "model", "prompt_tokens",
+              "cached_tokens", "completion_tokens", "total_tokens", "latency", "cost"]
+
+    GROUP_FIELDS = ["agent", "step", "model", "provider", "entry_id"]
+
+    def __init__(self, prices=None, csv_path=None):
+        """
+        :param prices: 模型价格表 {model: (输入每 1k token, 输出每 1k token)}，默认 DEFAULT_PRICES
+        :param csv_path: 原始记录 CSV 路径，None 表示不导出明细
+        """
+        self.prices = DEFAULT_PRICES if prices is None else prices
+        self.csv_path = csv_path
+        self._total = self._new_group()
+        self._groups = {field: {} for field in self.GROUP_FIELDS}
+        self._lock = threading.Lock()
+
+        self._csv_file = None
+        self._csv_writer = None
+        if csv_path is not None:
+            self._csv_file = open(csv_path, "w", encoding="utf-8", newline="")
+            self._csv_writer = csv.DictWriter(self._csv_file, fieldnames=self.FIELDS)
+            self._csv_writer.writeheader()
+
+    def _cost(self, model, prompt_tokens, completion_tokens):
+        price = self.prices.get(model)
+        if price is None:
+            return None
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1000
+
+    def record(self, provider, model, usage, latency):
+        """记录一次成功的 LLM 调用，标签取自当前上下文"""
+        tags = current_tags()
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        # 命中服务端前缀缓存的 token 数（OpenAI/DashScope 的 prompt_tokens_details.cached_tokens），
+        # 服务端不返回时为 None
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None)
+        record = {
+            "time": time.time(),
+            "agent": tags.get("agent", "unknown"),
+            "step": tags.get("step"),
+            "entry_id": tags.get("entry_id"),
+            "provider": provider,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": getattr(usage, "total_tokens", None) or prompt_tokens + completion_tokens,
+            "latency": latency,
+            "cost": self._cost(model, prompt_tokens, completion_tokens),
+        }
+        with self._lock:
+            self._add(self._total, record)
+            for field in self.GROUP_FIELDS:
+                self._add(self._groups[field].setdefault(str(record[field]), self._new_group()), record)
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(record)
+
+    @staticmethod
+    def _new_group():
+        return {
+            "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+            "total_tokens": 0, "latency_total": 0.0, "cost": 0.0, "_reported_prompt_tokens": 0,
+        }
+
+    @staticmethod
+    def _add(group, record):
+        group["calls"] += 1
+        group["prompt_tokens"] += record["prompt_tokens"]
+        if record["cached_tokens"] is not None:
+            group["cached_tokens"] += record["cached_tokens"]
+            group["_reported_prompt_tokens"] += record["prompt_tokens"]
+        group["completion_tokens"] += record["completion_tokens"]
+        group["total_tokens"] += record["total_tokens"]
+        group["latency_total"] += record["latency"]
+        group["cost"] += record["cost"] or 0.0
+
+    @staticmethod
+    def _summary(group):
+        summary = dict(group)
+        summary["latency_mean"] = summary["latency_total"] / summary["calls"]
+        summary["prefix_hit_rate"] = _hit_rate(summary["cached_tokens"], summary.pop("_reported_prompt_tokens"))
+        return summary
+
+    def report(self):
+        """汇总报告：总量及按 agent / step / model / provider / entry 分组的统计"""
+        with self._lock:
+            total = dict(self._total)
+            groups = {
+                field: {key: self._summary(group) for key, group in groups.items()}
+                for field, groups in self._groups.items()
+            }
+        report = {
+            "total": {
+                "calls": total["calls"],
+                "prompt_tokens": total["prompt_tokens"],
+                "cached_tokens": total["cached_tokens"],
+                "completion_tokens": total["completion_tokens"],
+                "total_tokens": total["total_tokens"],
+                "latency": total["latency_total"],
+                "cost": total["cost"],
+                "prefix_hit_rate": _hit_rate(total["cached_tokens"], total["_reported_prompt_tokens"]),
+            },
+        }
+        for field in self.GROUP_FIELDS:
+            # 按 token 消耗从高到低排列，便于定位最重的 prompt
+            report["by_" + field.removesuffix("_id")] = dict(
+                sorted(groups[field].items(), key=lambda kv: kv[1]["total_tokens"], reverse=True)
+            )
+        return report
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        """关闭原始记录 CSV"""
+        with self._lock:
+            if self._csv_file is not None:
+                self._csv_file.close()
+                self._csv_file = None
+                self._csv_writer = None